@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+冷启动和单次请求准备开销的基准测试
+
+导入时间: 每次在新的解释器进程中导入模块，测量导入耗时的中位数。默认先导入dify_plugin
+(插件运行时总是先加载它)，只统计插件自身模块的耗时；--with-runtime 时把dify_plugin也计算在内。
+请求准备: 对比原来每次请求重新构建完整的请求体字典、复制请求头并由requests序列化JSON的方式，
+和使用预先序列化固定字段的请求体模板(PayloadTemplate)的方式，分别测量构建请求体和准备好HTTP请求的耗时
+
+用法: python benchmarks/bench_cold_start.py [--runs 15] [--calls 20000] [--with-runtime] [--output out.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+MODULES = ("utils.sider_session", "utils.sider_api", "tools.sider_chat", "tools.sider_deep_search",
+           "tools.sider_ocr", "tools.sider_translate", "tools.sider_batch_chat")
+
+# 在子进程中执行：可选地先导入dify_plugin，再计时导入目标模块
+IMPORT_SNIPPET = """
+import sys, time
+if {runtime_first}:
+    import dify_plugin
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+sys.stdout.write(repr(time.perf_counter() - start))
+sys.stdout.flush()
+"""
+
+
+def import_time(modules, runs, runtime_first):
+    # 在新进程中导入模块，返回耗时(毫秒)的中位数和最小值
+    code = IMPORT_SNIPPET.format(runtime_first=runtime_first, modules=tuple(modules))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        # dify_plugin的gevent在解释器退出时可能输出无关的错误信息，只读取标准输出
+        if not output.stdout:
+            raise RuntimeError(f"导入 {', '.join(modules)} 失败: {output.stderr.strip()[-512:]}")
+        samples.append(float(output.stdout) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples)}
+
+
+def legacy_chat_request(session, prompt, model="gpt-4o-mini", stream=True, output_lang=None,
+                        thinking_mode=False, data_analysis=True, search=False, text_to_image=False, artifact=True):
+    # 原来的请求构建方式：每次构建完整的嵌套字典并复制请求头
+    from utils.sider_session import APP_NAME, APP_VERSION, ORIGIN, TIMEZONE
+    auto_tools = []
+    if data_analysis:
+        auto_tools.append("data_analysis")
+    if search:
+        auto_tools.append("search")
+    if text_to_image:
+        auto_tools.append("artifact")
+    url = "https://sider.ai/api/v3/completion/text"
+    header = session.header.copy()
+    header["content-type"] = 'application/json'
+    payload = {
+        "prompt": prompt, "stream": stream, "app_name": APP_NAME, "app_version": APP_VERSION,
+        "tz_name": TIMEZONE, "cid": session.context_id, "model": model, "search": False,
+        "auto_search": False, "filter_search_history": False, "from": "chat", "group_id": "default",
+        "chat_models": [], "files": [], "prompt_templates": [], "tools": {"auto": auto_tools},
+        "extra_info": {"origin_url": ORIGIN + "/standalone.html", "origin_title": "Sider"},
+    }
+    if artifact:
+        payload["prompt_templates"].append({"key": "artifacts", "attributes": {"lang": "original"}})
+    if thinking_mode:
+        payload["prompt_templates"].append({"key": "thinking_mode", "attributes": {}})
+    if output_lang is not None:
+        payload["output_language"] = output_lang
+    return url, header, payload
+
+
+def per_call(calls, prompt_chars):
+    # 返回每次请求准备的耗时(微秒)：build只构建请求体和请求头，prepare包括requests准备HTTP请求(序列化、合并请求头)
+    import requests
+    from utils.sider_session import Session, get_http_session
+
+    session = Session(token="bench", cookie="token=bench", update_info_at_init=False)
+    prompt = ("你好 hello " * prompt_chars)[:prompt_chars]
+    http = get_http_session("https://sider.ai/")
+
+    def legacy_build():
+        return legacy_chat_request(session, prompt)
+
+    def template_build():
+        return session._chat_request(prompt)
+
+    def legacy_prepare():
+        url, header, payload = legacy_chat_request(session, prompt)
+        return http.prepare_request(requests.Request("POST", url, headers=header, json=payload))
+
+    def template_prepare():
+        url, header, payload = session._chat_request(prompt)
+        return http.prepare_request(requests.Request("POST", url, headers=header, data=payload.body))
+
+    # 两种方式发送的请求体内容应当相同
+    assert json.loads(legacy_prepare().body) == json.loads(template_prepare().body)
+
+    result = {}
+    for name, func in (("legacy_build", legacy_build), ("template_build", template_build),
+                       ("legacy_prepare", legacy_prepare), ("template_prepare", template_prepare)):
+        best = min(timeit.repeat(func, number=calls, repeat=5))
+        result[name + "_us"] = best / calls * 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动和单次请求准备开销的基准测试")
+    parser.add_argument("--runs", type=int, default=15, help="每个模块在新进程中导入的次数")
+    parser.add_argument("--calls", type=int, default=20000, help="请求准备每轮执行的次数")
+    parser.add_argument("--with-runtime", action="store_true", help="导入时间包括dify_plugin本身")
+    parser.add_argument("--output", help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    imports = {}
+    for name in MODULES + ("(all tools)",):
+        modules = [module for module in MODULES if module.startswith("tools.")] if name == "(all tools)" else [name]
+        imports[name] = import_time(modules, args.runs, not args.with_runtime)
+    print(f"导入时间(新进程，{'包括' if args.with_runtime else '不包括'}dify_plugin，{args.runs}次):")
+    print(f"{'module':<26} {'median_ms':>10} {'min_ms':>10}")
+    for name, result in imports.items():
+        print(f"{name:<26} {result['median_ms']:>10.2f} {result['min_ms']:>10.2f}")
+
+    # 在导入工具(dify_plugin的gevent monkey patch)后测量，与插件运行时的环境相同
+    import dify_plugin  # noqa: F401
+    calls = {}
+    print(f"\n单次聊天请求准备(微秒，{args.calls}次取5轮最小值):")
+    print(f"{'prompt_chars':>12} {'legacy_build':>14} {'template_build':>15} {'legacy_prepare':>15} "
+          f"{'template_prepare':>17}")
+    for chars in (100, 20000):
+        result = calls[chars] = per_call(args.calls if chars < 10000 else max(1, args.calls // 20), chars)
+        print(f"{chars:>12} {result['legacy_build_us']:>14.2f} {result['template_build_us']:>15.2f} "
+              f"{result['legacy_prepare_us']:>15.2f} {result['template_prepare_us']:>17.2f}")
+
+    if args.output:
+        from utils import sider_json
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                                "json_backend": sider_json.backend, "with_runtime": args.with_runtime,
+                                "runs": args.runs, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                       "imports": imports, "per_call": calls}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
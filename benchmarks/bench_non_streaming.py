@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+非流式模式开销基准测试
+
+用返回固定长度文本的假会话替代网络请求，测量SiderAPIClient.chat(streaming=False)
+在不同响应长度下的耗时，每字符耗时应基本不随长度变化（线性复杂度）
+
+用法: python benchmarks/bench_non_streaming.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sider_api import SiderAPIClient, ChatRequest
+
+SIZES = [10_000, 100_000, 1_000_000, 4_000_000]
+REPEAT = 5
+
+
+class FakeSession:
+    """只返回固定文本的会话"""
+
+    def __init__(self, body):
+        self.body = body
+        self.context_id = "bench"
+        self.total = self.remain = None
+        self.advanced_total = self.advanced_remain = None
+
+    def chat(self, **kwargs):
+        return self.body
+
+
+class BenchClient(SiderAPIClient):
+    def __init__(self, body):
+        super().__init__(token="bench", cookie="bench")
+        self.body = body
+
+    def _create_session(self, context_id=""):
+        return FakeSession(self.body)
+
+
+def run(size):
+    # 响应内容中穿插换行，模拟普通的长回答
+    body = ("x" * 79 + "\n") * (size // 80)
+    client = BenchClient(body)
+    request = ChatRequest(prompt="bench")
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        generator = client.chat(request, streaming=False)
+        chunks = list(generator)
+        best = min(best, time.perf_counter() - start)
+        assert "".join(chunks) == body
+    return best
+
+
+def main():
+    print(f"{'响应长度':>12} {'耗时(ms)':>10} {'ns/字符':>10}")
+    for size in SIZES:
+        elapsed = run(size)
+        print(f"{size:>12} {elapsed * 1000:>10.3f} {elapsed * 1e9 / size:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
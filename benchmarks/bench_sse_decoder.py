@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+SSE解码微基准测试
+
+对比原来基于iter_lines的逐行解码循环和增量字节解码器，输出每秒处理的事件数。
+测试数据混合了文本事件和没有输出内容的状态事件，并按随机大小切成网络数据块
+
+用法: python benchmarks/bench_sse_decoder.py [事件数]
+"""
+import io
+import json
+import os
+import random
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import sider_json
+from utils.sider_session import Session
+
+REPEAT = 5
+
+
+def build_stream(count):
+    lines = []
+    for i in range(count):
+        if i % 4 == 3:
+            event = {"code": 0, "msg": "", "data": {"type": "status", "status": "processing"}}
+        else:
+            event = {"code": 0, "msg": "", "data": {"text": "token%d " % i, "cid": "c-bench",
+                                                     "total": 100, "remain": 99}}
+        lines.append(b"data:" + json.dumps(event).encode() + b"\n\n")
+    lines.append(b"data:[DONE]\n\n")
+    return b"".join(lines)
+
+
+def split_chunks(body, seed=0):
+    rng = random.Random(seed)
+    chunks, start = [], 0
+    while start < len(body):
+        size = rng.randint(64, 1500)
+        chunks.append(body[start:start + size])
+        start += size
+    return chunks
+
+
+def legacy_get_text(session, chunks, payload):
+    # 原Session.get_text的解码循环：iter_lines + 逐行decode + json.loads
+    resp = requests.Response()
+    resp.raw = io.BytesIO(b"".join(chunks))
+    for line_raw in resp.iter_lines():
+        if not line_raw.strip():
+            continue
+        line = line_raw.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        response = line[5:]
+        if not response:
+            continue
+        if response == "[DONE]":
+            break
+        yield from session._handle_data(json.loads(response), payload)
+
+
+def bench(name, func, count):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        texts = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<12} {count / best:>14,.0f} 事件/秒   输出 {texts} 个事件")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    chunks = split_chunks(build_stream(count))
+    payload = {"stream": True, "model": "sider"}
+    session = Session(token="bench", update_info_at_init=False)
+    print(f"JSON后端: {sider_json.backend}")
+    bench("iter_lines", lambda: sum(1 for _ in legacy_get_text(session, chunks, payload)), count)
+    bench("SSEDecoder", lambda: sum(1 for _ in session._iter_events(chunks, payload)), count)
+
+
+if __name__ == "__main__":
+    main()
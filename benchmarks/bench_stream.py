@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+端到端流式基准测试
+
+在独立进程中启动本地Sider替身服务器(fake_sider.py)，把所有Sider主机的请求通过requests的传输适配器转发到该服务器，
+分别测量三层调用的首字延迟(TTFT)、每秒token数(按整个请求的耗时)、每个上游数据块(token事件)的CPU时间和峰值内存：
+  session  Session.chat -> Session.get_text
+  client   SiderAPIClient.chat
+  tool     SiderChatTool._invoke
+结果可以保存为JSON，并与之前保存的结果对比
+
+用法: python benchmarks/bench_stream.py [--targets session,client,tool] [--runs 20] [--output out.json]
+                                       [--baseline base.json] [服务器参数，见 fake_sider.py --help]
+例如: python benchmarks/bench_stream.py --runs 10 --tokens 500 --rate 2000 --latency 0.05 --jitter 0.01
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 先导入工具(dify_plugin会对标准库做gevent monkey patch)，三层调用都在与插件运行时相同的环境中测量
+from dify_plugin.entities.tool import ToolRuntime
+from tools.sider_chat import SiderChatTool
+
+from utils import sider_json
+from utils.sider_api import ChatRequest, SiderAPIClient
+from utils.sider_session import POOL_MAXSIZE, Session, TimedHTTPAdapter, get_http_session
+
+SIDER_HOSTS = ("sider.ai", "api1.sider.ai", "api2.sider.ai", "api3.sider.ai")
+TARGETS = ("session", "client", "tool")
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_sider.py")
+
+# 与上一次结果对比时，这些指标越小越好；HIGHER_IS_BETTER中的越大越好；其余只显示变化
+LOWER_IS_BETTER = ("ttft_ms", "ttft_p95_ms", "total_ms", "cpu_us_per_chunk", "peak_kb")
+HIGHER_IS_BETTER = ("tokens_per_s",)
+
+
+class LocalAdapter(TimedHTTPAdapter):
+    """把请求改发到本地服务器，保持路径和查询参数不变"""
+
+    def __init__(self, base_url):
+        super().__init__(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        rest = request.url.partition("://")[2]
+        request.url = self.base_url + "/" + rest.partition("/")[2]
+        return super().send(request, **kwargs)
+
+
+class MemoryStorage:
+    """插件持久化存储的内存实现，供工具保存对话上下文"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data[key]
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def exist(self, key):
+        return key in self.data
+
+
+def start_server(server_args):
+    # 启动替身服务器进程，返回(进程, 地址)
+    process = subprocess.Popen([sys.executable, SERVER, *server_args], stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().split()
+    if len(line) != 2 or line[0] != "listening":
+        process.kill()
+        raise RuntimeError(f"替身服务器启动失败: {line}")
+    return process, f"http://127.0.0.1:{line[1]}"
+
+
+def install(base_url):
+    # 所有Sider主机共用的连接池改为连接本地服务器
+    for host in SIDER_HOSTS:
+        get_http_session(f"https://{host}/").mount("https://", LocalAdapter(base_url))
+
+
+def session_stream(prompt, context_id):
+    session = Session(token="bench", context_id=context_id, cookie="token=bench", update_info_at_init=False)
+    for text in session.chat(prompt, model="sider", stream=True):
+        yield text, None
+
+
+def client_stream(prompt, client, context_id):
+    generator = client.chat(ChatRequest(prompt=prompt, model="sider", context_id=context_id))
+    while True:
+        try:
+            yield next(generator), None
+        except StopIteration as stop:
+            yield "", stop.value.success
+            return
+
+
+def tool_stream(prompt, tool, context_id):
+    for message in tool._invoke({"prompt": prompt, "model": "sider", "streaming": True, "context_id": context_id,
+                                 "sider_token": "bench", "sider_cookie": "token=bench"}):
+        if message.type == message.MessageType.JSON:
+            yield "", message.message.json_object.get("success", False)
+        else:
+            yield message.message.text, None
+
+
+def make_streams(context_id):
+    client = SiderAPIClient(token="bench", cookie="token=bench")
+    tool = SiderChatTool(runtime=ToolRuntime(credentials={}, user_id="bench", session_id="bench"),
+                         session=SimpleNamespace(storage=MemoryStorage()))
+    return {
+        "session": lambda prompt: session_stream(prompt, context_id),
+        "client": lambda prompt: client_stream(prompt, client, context_id),
+        "tool": lambda prompt: tool_stream(prompt, tool, context_id),
+    }
+
+
+def measure(stream, prompt):
+    # 执行一次请求，返回(首字延迟, 总耗时, CPU时间, 输出块数, 是否成功)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    success = True
+    try:
+        for text, result in stream(prompt):
+            if text:
+                if first is None:
+                    first = time.perf_counter()
+                chunks += 1
+            if result is not None:
+                success = result
+    except Exception:
+        success = False
+    end = time.perf_counter()
+    if first is None:
+        success = False
+    return (first or end) - start, end - start, time.process_time() - cpu_start, chunks, success
+
+
+def peak_memory(stream, prompt):
+    # 单独执行一次请求测量Python分配的峰值内存(KB)，tracemalloc会拖慢执行，不与计时混在一起
+    tracemalloc.start()
+    try:
+        for _ in stream(prompt):
+            pass
+        return tracemalloc.get_traced_memory()[1] / 1024
+    except Exception:
+        return float("nan")
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(name, stream, runs, warmup, tokens):
+    for index in range(warmup):
+        measure(stream, f"warmup {name} {index}")
+    samples = [measure(stream, f"bench {name} {index}") for index in range(runs)]
+    done = [sample for sample in samples if sample[4]]
+    result = {"runs": runs, "succeeded": len(done), "failed": runs - len(done)}
+    if done:
+        ttft = [sample[0] * 1000 for sample in done]
+        result.update({
+            "ttft_ms": statistics.median(ttft),
+            "ttft_p95_ms": percentile(ttft, 0.95),
+            "total_ms": statistics.median(sample[1] * 1000 for sample in done),
+            "tokens_per_s": statistics.median(tokens / sample[1] for sample in done),
+            "cpu_us_per_chunk": statistics.median(sample[2] * 1e6 / tokens for sample in done),
+            "chunks_out": statistics.median(sample[3] for sample in done),
+        })
+    result["peak_kb"] = peak_memory(stream, f"memory {name}")
+    return result
+
+
+def print_report(report, baseline=None):
+    columns = ("ttft_ms", "ttft_p95_ms", "total_ms", "tokens_per_s", "cpu_us_per_chunk", "chunks_out", "peak_kb")
+    print(f"JSON后端: {report['meta']['json_backend']}   服务器参数: {' '.join(report['meta']['server_args']) or '(默认)'}")
+    print(f"{'target':<8} {'ok/runs':>8} " + " ".join(f"{column:>16}" for column in columns))
+    for target, result in report["results"].items():
+        cells = []
+        for column in columns:
+            value = result.get(column)
+            cell = "-" if value is None else f"{value:,.1f}"
+            old = ((baseline or {}).get("results", {}).get(target) or {}).get(column)
+            if value is not None and old:
+                change = (value - old) / old * 100
+                better = ((column in LOWER_IS_BETTER and change < 0)
+                          or (column in HIGHER_IS_BETTER and change > 0))
+                cell += f" ({change:+.0f}%{'↑' if better and abs(change) >= 1 else ''})"
+            cells.append(f"{cell:>16}")
+        print(f"{target:<8} {result['succeeded']:>3}/{result['runs']:<4} " + " ".join(cells))
+    print(f"进程峰值RSS: {report['meta']['max_rss_kb']:,} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端流式基准测试，未识别的参数传给替身服务器")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="测量的调用层，逗号分隔")
+    parser.add_argument("--runs", type=int, default=20, help="每层的测量次数")
+    parser.add_argument("--warmup", type=int, default=2, help="每层的预热次数")
+    parser.add_argument("--output", help="把结果保存为JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的JSON结果对比")
+    parser.add_argument("--context-id", default="", help="请求携带的对话ID(配合服务器的--expire-contexts测试605)")
+    args, server_args = parser.parse_known_args()
+    # 服务器和客户端需要知道每次回答的token数
+    tokens = int(server_args[server_args.index("--tokens") + 1]) if "--tokens" in server_args else 200
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的调用层: {', '.join(sorted(unknown))}")
+
+    process, base_url = start_server(server_args)
+    try:
+        install(base_url)
+        streams = make_streams(args.context_id)
+        results = {target: bench(target, streams[target], args.runs, args.warmup, tokens) for target in targets}
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": sider_json.backend,
+            "server_args": server_args,
+            "tokens": tokens,
+            "context_id": args.context_id,
+            "runs": args.runs,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+本地Sider替身服务器
+
+模拟/api/v3/completion/text(及v2的翻译、OCR、深度搜索接口)的SSE协议：逐token输出带cid、total/remain的文本事件，
+支持code/msg错误事件、605对话ID无效和deep_search进度事件；可以配置输出速率、首字延迟、抖动和故障注入。
+在独立进程中运行，基准测试测量的CPU和内存只包含客户端
+
+用法: python benchmarks/fake_sider.py [--port 0] [--tokens 200] [--rate 0] [--latency 0] ...
+启动后在标准输出打印一行 "listening <port>"
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地Sider替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="监听端口，0表示自动选择")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回答输出的token事件数")
+    parser.add_argument("--token-text", default="token ", help="每个token事件的文本")
+    parser.add_argument("--rate", type=float, default=0.0, help="每秒输出的token数，0表示不限速")
+    parser.add_argument("--latency", type=float, default=0.0, help="首字延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟和token间隔的随机抖动(秒)")
+    parser.add_argument("--status-every", type=int, default=4,
+                        help="每隔几个token插入一个没有输出内容的状态事件，0表示不插入")
+    parser.add_argument("--deep-search-statuses", type=int, default=20, help="深度搜索回答前的进度事件数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回code/msg错误事件的请求比例")
+    parser.add_argument("--error-code", type=int, default=429, help="错误事件的code")
+    parser.add_argument("--error-msg", default="Too many requests, rate limit exceeded", help="错误事件的msg")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="返回HTTP错误状态码的请求比例")
+    parser.add_argument("--http-status", type=int, default=503, help="HTTP错误状态码")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="输出到一半时断开连接的请求比例")
+    parser.add_argument("--expire-contexts", action="store_true", help="所有带cid的请求都返回605")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    return parser
+
+
+def sse(event):
+    return b"data:" + json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n\n"
+
+
+class FakeSiderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # 客户端读到[DONE]或提前结束后关闭连接
+
+    def do_GET(self):
+        # 用户额度信息
+        if urlsplit(self.path).path.endswith("/completion/limit/user"):
+            body = json.dumps({"code": 0, "msg": "", "data": {
+                "basic_credit": {"count": 30, "remain": self.server.remain},
+                "advanced_credit": {"count": 10, "remain": 10}}}).encode("utf-8")
+            self._send(200, body, "application/json")
+        else:
+            self._send(404, b"", "text/plain")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = self.rfile.read(length)
+        path = urlsplit(self.path).path
+        if path.endswith("/imagechat/upload"):
+            self._send(200, json.dumps({"code": 0, "msg": "", "data": {"id": "img-bench"}}).encode("utf-8"),
+                       "application/json")
+            return
+        if not path.endswith("/completion/text"):
+            self._send(404, b"", "text/plain")
+            return
+        payload = json.loads(body or b"{}")
+        self._stream(payload)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self, base):
+        # 基础延迟加上随机抖动
+        options = self.server.options
+        delay = base + (self.server.random() * options.jitter if options.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _write(self, data):
+        # 以一个chunked编码的数据块发送
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, payload):
+        options = self.server.options
+        number = self.server.next_request()
+        self._delay(options.latency)
+        if self.server.random() < options.http_error_rate:
+            self._send(options.http_status, b"<html>upstream error</html>", "text/html")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        if options.expire_contexts and payload.get("cid"):
+            self._write(sse({"code": 605, "msg": "invalid conversation id", "data": None}))
+        elif self.server.random() < options.error_rate:
+            self._write(sse({"code": options.error_code, "msg": options.error_msg, "data": None}))
+        else:
+            cid = payload.get("cid") or f"c-bench-{number}"
+            disconnect_at = (options.tokens // 2 if self.server.random() < options.disconnect_rate else None)
+            interval = 1.0 / options.rate if options.rate > 0 else 0.0
+            if (payload.get("deep_search") or {}).get("enable"):
+                for index in range(options.deep_search_statuses):
+                    status = ("searching", "reading", "thinking")[index * 3 // max(1, options.deep_search_statuses)]
+                    self._write(sse({"code": 0, "msg": "", "data": {"deep_search": {
+                        "status": status, "field": {"step": index, "urls": [f"https://example.com/{index}"]}}}}))
+                    self._delay(interval)
+            for index in range(options.tokens):
+                if index == disconnect_at:
+                    self.close_connection = True
+                    return  # 不发送结束块，客户端收到不完整的响应
+                if options.status_every and index % options.status_every == options.status_every - 1:
+                    self._write(sse({"code": 0, "msg": "", "data": {"type": "status", "status": "processing"}}))
+                if (payload.get("deep_search") or {}).get("enable"):
+                    event = {"deep_search": {"status": "answering",
+                                             "field": {"answer_fragment": options.token_text}}}
+                else:
+                    event = {"type": "text", "text": options.token_text, "cid": cid,
+                             "total": 30, "remain": self.server.remain}
+                self._write(sse({"code": 0, "msg": "", "data": event}))
+                self._delay(interval)
+        self._write(b"data:[DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeSiderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, options):
+        super().__init__((options.host, options.port), FakeSiderHandler)
+        self.options = options
+        self.remain = 30
+        self.requests = 0
+        self._rng = random.Random(options.seed)
+        self._lock = threading.Lock()
+
+    def random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def next_request(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    server = FakeSiderServer(options)
+    print(f"listening {server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
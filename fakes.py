@@ -0,0 +1,13 @@
+"""
+测试共用的模拟对象
+"""
+
+
+class FakeClock:
+    """手动推进的计时函数，测试中修改now模拟时间流逝"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -3,15 +3,31 @@ Sider AI 提供商实现
 """
 from typing import Any
 from dify_plugin import ToolProvider
+from dify_plugin.errors.tool import ToolProviderCredentialValidationError
+
+from utils.sider_api import get_client
+from utils.sider_pool import parse_credentials
 
 class SiderChatProvider(ToolProvider):
     """Sider AI工具提供商"""
-    
+
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         """
-        验证凭据 - 简化版本，总是返回成功
-        为了支持打包后的插件，这里不进行实际验证
+        验证凭据
+        提供商凭据是可选的，工具参数中的认证信息为空时使用；两项都为空时不需要验证。
+        提供了sider_token和sider_cookie时，通过获取用户额度信息的轻量接口逐组验证(结果有缓存，不消耗聊天额度)
         """
-        # 不进行任何实际验证，直接返回成功
-        # 这样可以绕过打包后插件无法验证的问题
-        pass
+        token = credentials.get("sider_token")
+        cookie = credentials.get("sider_cookie")
+        if not token or not cookie:
+            return
+
+        try:
+            pairs = parse_credentials(token, cookie)
+        except ValueError as e:
+            raise ToolProviderCredentialValidationError(str(e))
+
+        for index, (pair_token, pair_cookie) in enumerate(pairs, 1):
+            if not get_client(token=pair_token, cookie=pair_cookie).validate_credentials():
+                suffix = f"（第{index}组）" if len(pairs) > 1 else ""
+                raise ToolProviderCredentialValidationError(f"Sider凭据无效或暂时无法验证{suffix}")
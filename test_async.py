@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试异步会话和异步客户端的翻译、OCR、深度搜索接口（不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+
+from utils import sider_async
+from utils.sider_async import AsyncSession, AsyncSiderAPIClient
+from utils.sider_events import TextDelta, ServerMessage, DeepSearchStatus
+from utils.sider_retry import RetryPolicy
+
+
+class FakeSession(AsyncSession):
+    """按请求地址返回固定事件的异步会话，replies为每次请求依次使用的事件列表"""
+
+    def __init__(self, replies=None):
+        super().__init__(token="t", cookie="token=t")
+        self.replies = replies
+        self.payloads = []
+
+    def fork(self, context_id=""):
+        return self
+
+    async def get_events(self, url, header, payload, deep_search=False, deadline=None):
+        self.payloads.append(payload)
+        if self.replies is not None:
+            for event in self.replies.pop(0):
+                yield event
+            return
+        if deep_search:
+            yield DeepSearchStatus("searching")
+        yield TextDelta("你好")
+        yield TextDelta("世界")
+
+
+class FakeClient(AsyncSiderAPIClient):
+    def __init__(self, session):
+        super().__init__(token="t", cookie="token=t", retry_policy=RetryPolicy(base_delay=0, rng=lambda: 0.0))
+        self.session = session
+
+    def _create_session(self, context_id=""):
+        return self.session
+
+
+def fake_upload(filename, header, name=None, content_type=None):
+    return {"data": {"id": "img-1"}}
+
+
+def test_session_non_stream():
+    """stream=False时返回完整结果的协程，stream=True时返回异步生成器"""
+    async def run():
+        session = FakeSession()
+        assert await session.translate("hi", stream=False) == "你好世界"
+        assert await session.ocr(b"png", stream=False) == "你好世界"
+        assert session.payloads[-1]["image_id"] == "img-1"
+        text = await session.search("q", stream=False)
+        assert text.endswith("你好世界")
+        assert [chunk async for chunk in session.translate("hi")] == ["你好", "世界"]
+        events = [event async for event in session.ocr(b"png", typed=True)]
+        assert events == [TextDelta("你好"), TextDelta("世界")]
+
+    upload_image, sider_async.upload_image = sider_async.upload_image, fake_upload
+    try:
+        asyncio.run(run())
+    finally:
+        sider_async.upload_image = upload_image
+
+
+def test_client_translate_ocr_deep_search():
+    """异步客户端的翻译、OCR和深度搜索是协程/异步生成器，限流时重试"""
+    async def run():
+        client = FakeClient(FakeSession())
+        assert await client.translate("hi") == "你好世界"
+        assert await client.ocr(b"png") == "你好世界"
+        events = [event async for event in client.deep_search("q")]
+        assert events == [DeepSearchStatus("searching"), TextDelta("你好"), TextDelta("世界")]
+
+        assert [chunk async for chunk in client.ocr_stream(b"png")] == ["你好", "世界"]
+
+        limited = ServerMessage(code=429, msg="too many requests")
+        client = FakeClient(FakeSession(replies=[[limited], [TextDelta("ok")]]))
+        assert await client.translate("hi") == "ok"
+
+        client = FakeClient(FakeSession(replies=[[ServerMessage(code=500, msg="bad")]]))
+        try:
+            await client.deep_search("q").__anext__()
+        except Exception as e:
+            assert "深度搜索失败" in str(e)
+        else:
+            raise AssertionError("应当抛出异常")
+
+    upload_image, sider_async.upload_image = sider_async.upload_image, fake_upload
+    try:
+        asyncio.run(run())
+    finally:
+        sider_async.upload_image = upload_image
+
+
+def test_connection_pool_per_event_loop():
+    """每个事件循环使用单独的连接池，后台事件循环(同步调用)不与调用方的事件循环共用"""
+    client = AsyncSiderAPIClient(token="t", cookie="token=t")
+
+    async def pools():
+        session = client._create_session()
+        return session._client(), client._create_session()._client()
+
+    first, again = asyncio.run(pools())
+    assert first is again
+    second, _ = asyncio.run(pools())
+    assert second is not first and len(client._http) == 1  # 已关闭的事件循环的连接池被丢弃
+    background, _ = asyncio.run_coroutine_threadsafe(pools(), sider_async._background_loop()).result()
+    assert background is not second
+
+    async def close():
+        await client.aclose()
+
+    asyncio.run_coroutine_threadsafe(close(), sider_async._background_loop()).result()
+    assert background.is_closed and client._http == {}
+
+
+if __name__ == "__main__":
+    test_session_non_stream()
+    test_client_translate_ocr_deep_search()
+    test_connection_pool_per_event_loop()
+    print("全部通过")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+测试批量聊天的输入解析和并发执行（不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import time
+
+from utils import sider_session
+from utils.sider_api import ChatRequest, ChatResponse
+from utils.sider_batch import STREAM_END, map_ordered, map_streams, parse_prompts, render_template, run_batch
+
+
+class FakeClient:
+    """按提示词返回结果的客户端，记录最大并发数"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def chat(self, request, streaming=True, deadline=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.02 if request.prompt != "slow" else 0.1)
+            if request.prompt == "boom":
+                raise ConnectionError("reset")
+            if request.prompt == "bad":
+                return ChatResponse(response="", context_id="", model=request.model,
+                                    success=False, error="quota exhausted")
+            yield request.prompt.upper()
+            return ChatResponse(response=request.prompt.upper(), context_id="c", model=request.model)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_parse_prompts():
+    """JSON数组、按行分隔和模板变量"""
+    assert parse_prompts('["a", "b"]') == ["a", "b"]
+    assert parse_prompts("a\n\n b \n") == ["a", "b"]
+    assert parse_prompts('[{"name": "x", "n": 1}]', "{name}:{n}") == ["x:1"]
+    assert parse_prompts('["x", "y"]', "translate {item}") == ["translate x", "translate y"]
+    assert render_template("{a}{b}", {"a": "1", "b": [2]}) == "1[2]"
+    for bad, template in (('[1]', ""), ('[{"a": 1}]', "{b}")):
+        try:
+            parse_prompts(bad, template)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_run_batch_isolates_failures():
+    """单项失败不影响其他项，并发数不超过上限"""
+    client = FakeClient()
+    prompts = ["slow", "a", "boom", "b", "bad", "c"]
+    results = dict(run_batch(client, [ChatRequest(prompt=p) for p in prompts], max_workers=3))
+    assert sorted(results) == list(range(len(prompts)))
+    assert [results[i].success for i in range(len(prompts))] == [True, True, False, True, False, True]
+    assert results[0].response == "SLOW" and "reset" in results[2].error
+    assert 1 < client.peak <= 3
+
+
+def test_configure_pool_limits_workers():
+    """configure_pool修改连接池大小后，并发数上限随之变化"""
+    original = sider_session.POOL_MAXSIZE
+    sider_session.configure_pool(2)
+    try:
+        client = FakeClient()
+        results = dict(run_batch(client, [ChatRequest(prompt=p) for p in "abcdef"], max_workers=6))
+        assert len(results) == 6 and client.peak == 2
+    finally:
+        sider_session.configure_pool(original)
+
+
+def test_map_ordered():
+    """结果按输入顺序输出，失败的项在轮到它时抛出异常"""
+    def work(n):
+        time.sleep(0.01 * (5 - n))
+        if n == 3:
+            raise ValueError("bad item")
+        return n * 10
+
+    results = []
+    try:
+        for value in map_ordered(work, range(5), max_workers=3):
+            results.append(value)
+        assert False
+    except ValueError:
+        pass
+    assert results == [0, 10, 20]
+
+
+
+def test_map_streams():
+    """各项的结果块边产生边输出，结束和失败分别以STREAM_END和异常标记"""
+    def work(n):
+        for i in range(2):
+            time.sleep(0.01)
+            yield f"{n}-{i}"
+        if n == 1:
+            raise ValueError("bad item")
+
+    items = list(map_streams(work, range(3), max_workers=3))
+    for n in range(3):
+        own = [item for index, item in items if index == n]
+        assert own[:2] == [f"{n}-0", f"{n}-1"]
+        assert own[2] is STREAM_END if n != 1 else isinstance(own[2], ValueError)
+    assert [index for index, _ in items[:3]] != [0, 0, 0]  # 不同项的结果块交错输出
+
+if __name__ == "__main__":
+    test_parse_prompts()
+    test_run_batch_isolates_failures()
+    test_configure_pool_limits_workers()
+    test_map_ordered()
+    test_map_streams()
+    print("全部通过")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+测试响应缓存（使用内存中的模拟存储）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_api import ChatRequest, ChatOptions
+import json
+import threading
+
+from utils.sider_cache import ResponseCache, HotCache, cache_key, split_text, ENTRY_PREFIX, INDEX_KEY
+from fakes import FakeClock
+
+
+class FakeStorage:
+    """与插件持久化存储接口相同的内存存储"""
+
+    def __init__(self, fail=False):
+        self.data = {}
+        self.fail = fail
+        self.writes = []
+
+    def _check(self):
+        if self.fail:
+            raise RuntimeError("storage unavailable")
+
+    def get(self, key):
+        self._check()
+        return self.data[key]
+
+    def set(self, key, val):
+        self._check()
+        self.writes.append(key)
+        self.data[key] = val
+
+    def delete(self, key):
+        self._check()
+        del self.data[key]
+
+    def exist(self, key):
+        self._check()
+        return key in self.data
+
+
+def test_cache_key():
+    """键包含模型、提示词和选项；带上下文的请求不缓存"""
+    key = cache_key(ChatRequest(prompt="分类: 苹果", model="sider"))
+    assert key == cache_key(ChatRequest(prompt="分类: 苹果", model="sider"))
+    assert key != cache_key(ChatRequest(prompt="分类: 苹果", model="gpt-4o-mini"))
+    assert key != cache_key(ChatRequest(prompt="分类: 苹果", model="sider", options=ChatOptions(search=True)))
+    assert cache_key(ChatRequest(prompt="分类: 苹果", context_id="c1")) is None
+
+
+def test_persistent_hit_and_ttl():
+    """持久化条目在新进程(新的热缓存)中也能命中，过期后失效"""
+    storage, clock = FakeStorage(), FakeClock(1000.0)
+    ResponseCache(storage, ttl=60, hot=HotCache(), clock=clock).put("k", "水果" * 100)
+    cache = ResponseCache(storage, ttl=60, hot=HotCache(), clock=clock)
+    assert cache.get("k") == "水果" * 100
+    assert len(storage.data[ENTRY_PREFIX + "k"]) < len("水果" * 100)  # 压缩保存
+    clock.now += 61
+    assert ResponseCache(storage, hot=HotCache(), clock=clock).get("k") is None
+
+
+def test_lru_eviction_within_budget():
+    """超过存储预算时淘汰最久未使用的条目"""
+    storage, clock = FakeStorage(), FakeClock(1000.0)
+    cache = ResponseCache(storage, budget=300, hot=HotCache(), clock=clock)
+    for key in ("a", "b"):
+        clock.now += 1
+        cache.put(key, key * 50)
+    clock.now += 1
+    cache.hot = HotCache()
+    assert cache.get("a") == "a" * 50  # a变为最近使用
+    clock.now += 1
+    cache.put("c", "c" * 50)
+    assert ENTRY_PREFIX + "b" not in storage.data
+    assert ENTRY_PREFIX + "a" in storage.data and ENTRY_PREFIX + "c" in storage.data
+
+
+def test_hit_does_not_rewrite_index():
+    """命中时不写入存储，索引丢失时条目仍能命中，下次写入时重新登记到索引"""
+    storage, clock = FakeStorage(), FakeClock(1000.0)
+    ResponseCache(storage, hot=HotCache(), clock=clock).put("k", "v" * 100)
+    del storage.data[INDEX_KEY]
+    storage.writes.clear()
+    assert ResponseCache(storage, hot=HotCache(), clock=clock).get("k") == "v" * 100
+    assert storage.writes == []
+    ResponseCache(storage, hot=HotCache(), clock=clock).put("k2", "w")
+    index = json.loads(storage.data[INDEX_KEY])
+    assert set(index) == {"k", "k2"}
+
+
+def test_concurrent_puts_keep_index():
+    """并发写入不会丢失索引记录"""
+    storage = FakeStorage()
+    threads = [threading.Thread(target=ResponseCache(storage, hot=HotCache()).put, args=(str(i), "x" * i))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    index = json.loads(storage.data[INDEX_KEY])
+    assert set(index) == {str(i) for i in range(20)}
+
+
+def test_storage_failure_is_ignored():
+    """存储不可用时只使用热缓存，不影响请求"""
+    cache = ResponseCache(FakeStorage(fail=True), hot=HotCache())
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    assert ResponseCache(FakeStorage(fail=True), hot=HotCache()).get("k") is None
+    assert split_text("abcdefg", 3) == ["abc", "def", "g"] and split_text("", 3) == []
+
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_persistent_hit_and_ttl()
+    test_lru_eviction_within_budget()
+    test_hit_does_not_rewrite_index()
+    test_concurrent_puts_keep_index()
+    test_storage_failure_is_ignored()
+    print("全部通过")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试流式输出合并
+"""
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_coalesce import IDLE, ChunkCoalescer, StatusThrottle, summarize_field, with_idle
+from utils.sider_events import DeepSearchStatus
+from fakes import FakeClock
+
+
+def test_first_chunk_sent_immediately_then_merged():
+    """第一个响应块立即发送，之后按大小合并"""
+    coalescer = ChunkCoalescer(max_bytes=8, flush_on_sentence=False, clock=FakeClock())
+    assert coalescer.push("Hi") == "Hi"
+    assert coalescer.push("abc") is None
+    assert coalescer.push("defgh") == "abcdefgh"
+    assert coalescer.push("x") is None
+    assert coalescer.flush() == "x"
+    assert coalescer.stats.to_dict()["flush_reasons"] == {"first": 1, "size": 1, "end": 1}
+
+
+def test_flush_on_boundaries_and_delay():
+    """换行、句子结尾和等待超时都会触发发送"""
+    clock = FakeClock()
+    coalescer = ChunkCoalescer(max_bytes=1024, max_delay_ms=100, clock=clock)
+    coalescer.push("start")
+    assert coalescer.push("第一句。") == "第一句。"
+    assert coalescer.push("line\n") == "line\n"
+    assert coalescer.push("a") is None
+    clock.now = 0.2
+    assert coalescer.push("b") == "ab"
+    assert coalescer.stats.messages_out == 4
+
+
+def test_delay_flush_without_next_chunk():
+    """上游停顿、没有下一个响应块时，缓存的内容在等待超时后发出"""
+    resume = threading.Event()
+
+    def stalled():
+        yield "Hi"
+        yield "abc"
+        resume.wait(5)  # 模拟上游停顿
+        return "done"
+
+    coalescer = ChunkCoalescer(max_bytes=1024, max_delay_ms=20, flush_on_sentence=False)
+    assert coalescer.remaining() is None
+    sent = []
+    stream = with_idle(stalled(), coalescer.remaining)
+    while len(sent) < 2:
+        item = next(stream)
+        text = coalescer.expire() if item is IDLE else coalescer.push(item)
+        if text:
+            sent.append(text)
+    assert sent == ["Hi", "abc"]
+    assert coalescer.stats.flush_reasons == {"first": 1, "delay": 1}
+    assert coalescer.remaining() is None
+    resume.set()
+    try:
+        next(stream)
+        raise AssertionError("应当结束")
+    except StopIteration as stop:
+        assert stop.value == "done"
+
+
+def test_with_idle_propagates_errors():
+    """source中的异常在调用方的线程中重新抛出"""
+    def failing():
+        yield "a"
+        raise ValueError("boom")
+
+    stream = with_idle(failing(), lambda: None)
+    assert next(stream) == "a"
+    try:
+        next(stream)
+        raise AssertionError("应当抛出异常")
+    except ValueError as err:
+        assert str(err) == "boom"
+
+
+def test_zero_max_bytes_disables_merging():
+    """max_bytes为0时逐块发送"""
+    coalescer = ChunkCoalescer(max_bytes=0)
+    assert [coalescer.push(c) for c in "abc"] == ["a", "b", "c"]
+
+
+def test_status_throttle_merges_repeated_status():
+    """状态变化立即发送，相同状态按间隔合并，结束时发送最后一个"""
+    clock = FakeClock()
+    throttle = StatusThrottle(min_interval=1.0, clock=clock)
+    assert throttle.push(DeepSearchStatus("searching", {"q": 1}))["status"] == "searching"
+    assert throttle.push(DeepSearchStatus("searching", {"q": 2})) is None
+    assert throttle.push(DeepSearchStatus("searching", {"q": 3})) is None
+    clock.now = 1.5
+    progress = throttle.push(DeepSearchStatus("searching", {"q": 4}))
+    assert progress["detail"] == {"q": 4} and progress["merged"] == 3
+    assert throttle.push(DeepSearchStatus("reading")) is not None
+    assert throttle.push(DeepSearchStatus("reading", "last")) is None
+    assert throttle.flush()["detail"] == "last"
+    assert throttle.flush() is None
+    assert (throttle.events_in, throttle.messages_out) == (6, 4)
+
+
+def test_summarize_field():
+    """长字符串截断，长列表只保留前几项，深层嵌套只保留数量"""
+    detail = summarize_field({"text": "x" * 500, "urls": list(range(8)), "deep": {"a": {"b": [1, 2]}}})
+    assert len(detail["text"]) == 201
+    assert detail["urls"] == [0, 1, 2, 3, 4, "<3 more>"]
+    assert detail["deep"] == {"a": "<1 items>"}
+
+
+if __name__ == "__main__":
+    test_first_chunk_sent_immediately_then_merged()
+    test_flush_on_boundaries_and_delay()
+    test_delay_flush_without_next_chunk()
+    test_with_idle_propagates_errors()
+    test_zero_max_bytes_disables_merging()
+    test_status_throttle_merges_repeated_status()
+    test_summarize_field()
+    print("全部通过")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+测试对话上下文存储（使用内存中的模拟存储）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_context import ContextStore, DeadContexts, CONTEXTS_KEY
+from fakes import FakeClock
+from test_cache import FakeStorage
+
+
+def test_resolve_latest_context():
+    """会话键映射到最新的对话ID，长时间未使用后过期"""
+    clock = FakeClock(1000.0)
+    store = ContextStore(FakeStorage(), ttl=100, dead=DeadContexts(), clock=clock)
+    assert store.resolve("conv-1") == ""
+    store.record("conv-1", "cid-a")
+    store.record("conv-1", "cid-b")
+    store.record("conv-2", "cid-c")
+    assert store.resolve("conv-1") == "cid-b" and store.resolve("conv-2") == "cid-c"
+    assert b"conv-1" not in store.storage.data[CONTEXTS_KEY]  # 存储中只保存会话键的哈希
+
+    clock.now += 101
+    assert store.resolve("conv-1") == ""
+
+
+def test_dead_contexts_shared_across_processes():
+    """失效的对话ID写入存储，其他进程(独立的进程内记录)也能识别"""
+    storage = FakeStorage()
+    clock = FakeClock(1000.0)
+    first = ContextStore(storage, dead=DeadContexts(clock=clock), clock=clock)
+    first.record("conv", "cid-a")
+    first.mark_dead("cid-a")
+    assert first.resolve("conv") == ""
+
+    other = ContextStore(storage, dead=DeadContexts(clock=clock), clock=clock)
+    assert not other.is_dead("cid-a")  # 直接传入的对话ID只查进程内记录
+    assert other.resolve("conv") == "" and other.is_dead("cid-a")  # 按会话键查找时读取存储中的记录
+    assert not other.is_dead("cid-b")
+
+
+def test_is_dead_does_not_touch_storage():
+    """判断对话ID是否失效不访问存储"""
+    store = ContextStore(FakeStorage(fail=True), dead=DeadContexts())
+    assert not store.is_dead("cid")
+    store.dead.add("cid")
+    assert store.is_dead("cid")
+
+
+def test_storage_errors_are_ignored():
+    """存储不可用时退化为不记录上下文"""
+    store = ContextStore(FakeStorage(fail=True), dead=DeadContexts())
+    store.record("conv", "cid")
+    store.mark_dead("cid")
+    assert store.resolve("conv") == ""
+    assert store.is_dead("cid")  # 进程内记录仍然有效
+
+
+if __name__ == "__main__":
+    test_resolve_latest_context()
+    test_dead_contexts_shared_across_processes()
+    test_is_dead_does_not_touch_storage()
+    test_storage_errors_are_ignored()
+    print("全部通过")
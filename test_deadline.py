@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+测试请求时间预算（使用模拟时钟，不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_deadline import Deadline, DeadlineExceeded
+from fakes import FakeClock
+
+
+def test_phase_budgets_capped_by_total():
+    """各阶段的超时不超过剩余的总时间"""
+    clock = FakeClock()
+    deadline = Deadline(total=20, connect=5, first_byte=10, idle=8, clock=clock)
+    assert deadline.requests_timeout() == (5, 10)
+    clock.now = 15
+    assert deadline.timeout("idle") == 5
+    assert deadline.timeout("connect") == 5
+
+
+def test_first_byte_restarts_on_retry():
+    """重试时重新计算首个数据块的等待时间，但只能使用剩余的总时间"""
+    clock = FakeClock()
+    deadline = Deadline(total=20, first_byte=10, clock=clock)
+    clock.now = 12
+    try:
+        deadline.timeout("first_byte")
+        assert False, "应当超时"
+    except DeadlineExceeded as err:
+        assert err.phase == "first_byte"
+    deadline.restart()
+    assert deadline.timeout("first_byte") == 8
+
+
+def test_total_exceeded():
+    """总时间用完后所有阶段都报告total超时"""
+    clock = FakeClock()
+    deadline = Deadline(total=1, clock=clock)
+    clock.now = 1
+    assert deadline.expired
+    for phase in ("connect", "first_byte", "idle"):
+        try:
+            deadline.timeout(phase)
+            assert False, "应当超时"
+        except DeadlineExceeded as err:
+            assert err.phase == "total"
+    assert deadline.exceeded("idle").phase == "total"
+
+
+if __name__ == "__main__":
+    test_phase_budgets_capped_by_total()
+    test_first_byte_restarts_on_retry()
+    test_total_exceeded()
+    print("全部通过")
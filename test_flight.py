@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+测试相同请求合并（single-flight，不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+
+from utils import sider_api
+from utils.sider_api import SiderAPIClient, ChatRequest, ResponseBuffer
+from utils.sider_deadline import Deadline
+from utils.sider_events import TextDelta
+from utils.sider_flight import Flight
+
+
+class GatedSession:
+    """每输出一个事件前等待放行，用来控制订阅者加入的时机"""
+
+    def __init__(self, client):
+        self.client = client
+        self.context_id = ""
+        self.host = "sider.ai"
+        self.total = self.remain = None
+        self.advanced_total = self.advanced_remain = None
+
+    def chat(self, typed=False, **kwargs):
+        self.client.upstream_calls += 1
+        self.client.calls.append(kwargs)
+        return self._events()
+
+    def _events(self):
+        self.context_id = "c-new"  # 上游新建的对话
+        try:
+            for text in ("a", "b", "c"):
+                assert self.client.gate.acquire(timeout=5)
+                yield TextDelta(text)
+        finally:
+            self.client.closed.set()
+
+
+class GatedClient(SiderAPIClient):
+    def __init__(self):
+        super().__init__(token="test_token", cookie="test_cookie", single_flight=True)
+        self.gate = threading.Semaphore(0)
+        self.closed = threading.Event()
+        self.upstream_calls = 0
+        self.calls = []
+
+    def _create_session(self, context_id=""):
+        return GatedSession(self)
+
+
+def _drain(generator):
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(generator))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+
+def test_late_subscriber_gets_replay():
+    """第二个相同请求共用上游请求，并从头收到已经输出的内容"""
+    client = GatedClient()
+    request = ChatRequest(prompt="same")
+    first = client.chat(request)
+    client.gate.release()
+    assert next(first) == "a"
+
+    buffer = ResponseBuffer()
+    second = client.chat(request, buffer=buffer)
+    assert next(second) == "a"
+    client.gate.release()
+    client.gate.release()
+    chunks, result = _drain(first)
+    assert chunks == ["b", "c"] and result.response == "abc" and result.context_id == "c-new"
+
+    chunks, result = _drain(second)
+    assert chunks == ["b", "c"] and buffer.getvalue() == "abc" and result.success
+    assert result.context_id == "", "新建的对话只属于发起请求的调用方"
+    assert client.upstream_calls == 1
+
+
+def test_requests_with_context_are_not_merged():
+    """带context_id、内容不同或关闭合并的请求各自发送"""
+    client = GatedClient()
+    for _ in range(6):
+        client.gate.release()
+    generators = [client.chat(ChatRequest(prompt="p", context_id="cid")),
+                  client.chat(ChatRequest(prompt="p", context_id="cid")),
+                  client.chat(ChatRequest(prompt="q"))]
+    for generator in generators:
+        next(generator)
+    assert client.upstream_calls == 3
+    for generator in generators:
+        generator.close()
+
+    # 调用方要继续使用新建的对话时不合并；默认不合并
+    client = GatedClient()
+    client.single_flight = False
+    for _ in range(2):
+        client.gate.release()
+    generators = [client.chat(ChatRequest(prompt="p")) for _ in range(2)]
+    for generator in generators:
+        next(generator)
+    assert client.upstream_calls == 2
+    for generator in generators:
+        generator.close()
+    assert not SiderAPIClient(token="t", cookie="c").single_flight
+
+    client = GatedClient()
+    for _ in range(2):
+        client.gate.release()
+    generators = [client.chat(ChatRequest(prompt="p"), single_flight=False) for _ in range(2)]
+    for generator in generators:
+        next(generator)
+    assert client.upstream_calls == 2
+    for generator in generators:
+        generator.close()
+
+
+def test_different_settings_are_not_merged():
+    """输出方式、时间预算或对冲配置不同的相同请求不合并；非流式请求走非流式路径"""
+    client = GatedClient()
+    for _ in range(9):
+        client.gate.release()
+    request = ChatRequest(prompt="p")
+    streaming = client.chat(request)
+    blocking = client.chat(request, streaming=False)
+    limited = client.chat(request, deadline=Deadline(total=30))
+    assert next(streaming) == "a"
+    assert _drain(blocking)[0] == ["abc"]
+    assert next(limited) == "a"
+    assert client.upstream_calls == 3
+    assert [kwargs["stream"] for kwargs in client.calls].count(False) == 1
+    streaming.close()
+    limited.close()
+
+
+def test_last_subscriber_leaving_cancels_upstream():
+    """所有订阅者都离开后停止上游请求，之后的相同请求重新发送"""
+    client = GatedClient()
+    request = ChatRequest(prompt="cancel")
+    generator = client.chat(request)
+    client.gate.release()
+    assert next(generator) == "a"
+    generator.close()
+    client.gate.release()
+    assert client.closed.wait(5)
+
+    for _ in range(3):
+        client.gate.release()
+    chunks, result = _drain(client.chat(request))
+    assert chunks == ["a", "b", "c"] and client.upstream_calls == 2
+
+    flight = Flight()
+    assert flight.join()
+    flight.leave()
+    assert flight.cancelled and not flight.join()
+
+
+def test_flight_is_the_response_buffer():
+    """响应只保存在Flight中：拼接完整响应后清空分块，之后的订阅者从拼接结果中按原来的块读取"""
+    flight = Flight(max_chars=5)
+    flight.append("abc")
+    flight.append("def")
+    assert len(flight) == 5 and flight.truncated
+    assert flight.join()
+    reader = flight.subscribe(leader=True)
+    assert list(next(reader) for _ in range(2)) == ["abc", "de"]
+    assert flight.getvalue() == "abcde" and flight.chunks == []
+    assert flight.join()
+    late = flight.subscribe()
+    assert next(late) == "abc" and next(late) == "de"
+    flight.finish(sider_api.ChatResponse(response=flight.getvalue(), context_id="c1", model="sider"))
+    assert _drain(reader) == ([], flight.result)
+    chunks, result = _drain(late)
+    assert chunks == [] and result.response == "abcde" and result.context_id == ""
+
+
+if __name__ == "__main__":
+    test_late_subscriber_gets_replay()
+    test_requests_with_context_are_not_merged()
+    test_different_settings_are_not_merged()
+    test_last_subscriber_leaving_cancels_upstream()
+    test_flight_is_the_response_buffer()
+    print("全部通过")
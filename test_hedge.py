@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试对冲请求（使用模拟会话，不访问网络）
+"""
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_hedge import HedgeConfig, LatencyTracker, hedged_events
+from utils.sider_events import TextDelta
+from utils.sider_retry import UpstreamError
+from utils.sider_session import Session
+
+
+class FakeSession:
+    """按地址返回预设的延迟和事件；失败的地址抛出异常"""
+
+    def __init__(self, routes, context_id="", calls=None, closed=None):
+        self.routes = routes
+        self.closed = closed if closed is not None else []  # 所有派生会话共用，记录已结束(关闭)的地址
+        self.aborted = threading.Event()
+        self.context_id = context_id
+        self.host = None
+        self.total = self.remain = None
+        self.advanced_total = self.advanced_remain = None
+        self.calls = calls if calls is not None else []  # 所有派生会话共用，记录请求的地址
+
+    def fork(self, context_id=""):
+        return FakeSession(self.routes, context_id, self.calls, self.closed)
+
+    def abort(self):
+        self.aborted.set()
+
+    def get_events(self, url, header, payload, deep_search=False, deadline=None):
+        self.calls.append(url)
+        delay, texts = self.routes[url]
+        try:
+            if self.aborted.wait(delay):
+                return  # 模拟等待中的连接被关闭
+            if isinstance(texts, Exception):
+                raise texts
+            self.host = url
+            self.context_id = "cid-" + url
+            for text in texts:
+                yield TextDelta(text)
+        finally:
+            self.closed.append(url)
+
+
+def test_slow_primary_is_hedged():
+    """首个请求超过等待时间未响应时发送对冲请求，使用先响应的结果"""
+    session = FakeSession({"a": (1.0, ["slow"]), "b": (0.0, ["fast", "!"])})
+    config = HedgeConfig(default_delay=0.05, min_delay=0.05, urls=["a", "b"])
+    start = time.monotonic()
+    events = list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker()))
+    assert events == [TextDelta("fast"), TextDelta("!")]
+    assert time.monotonic() - start < 0.5
+    assert session.host == "b" and session.context_id == "cid-b"
+
+
+def test_fast_primary_is_not_hedged():
+    """首个请求及时响应时不发送对冲请求"""
+    session = FakeSession({"a": (0.0, ["ok"]), "b": (0.0, UpstreamError(500))})
+    config = HedgeConfig(default_delay=0.5, urls=["a", "b"])
+    assert list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker())) == [TextDelta("ok")]
+    assert session.host == "a"
+    time.sleep(0.6)  # 超过对冲等待时间后也没有请求b
+    assert session.calls == ["a"]
+
+
+def test_failed_request_fails_over():
+    """请求在输出前失败时立即改用下一个地址；全部失败时抛出最后的错误"""
+    session = FakeSession({"a": (0.0, UpstreamError(502)), "b": (0.0, ["ok"])})
+    config = HedgeConfig(default_delay=5, urls=["a", "b"])
+    assert list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker())) == [TextDelta("ok")]
+
+    session = FakeSession({"a": (0.0, UpstreamError(502)), "b": (0.0, UpstreamError(503))})
+    try:
+        list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker()))
+        assert False, "应当失败"
+    except UpstreamError as err:
+        assert err.status == 503
+
+
+def test_failover_limits():
+    """认证失败不换用其他地址；换用地址计入max_hedges"""
+    session = FakeSession({"a": (0.0, UpstreamError(401)), "b": (0.0, ["ok"])})
+    config = HedgeConfig(default_delay=5, urls=["a", "b"])
+    try:
+        list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker()))
+        assert False, "应当失败"
+    except UpstreamError as err:
+        assert err.status == 401
+    assert session.calls == ["a"]
+
+    session = FakeSession({"a": (0.0, UpstreamError(502)), "b": (0.0, UpstreamError(503)), "c": (0.0, ["ok"])})
+    config = HedgeConfig(default_delay=5, max_hedges=1, urls=["a", "b", "c"])
+    try:
+        list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker()))
+        assert False, "应当失败"
+    except UpstreamError as err:
+        assert err.status == 503
+    assert session.calls == ["a", "b"]
+
+
+def test_losing_request_is_closed_immediately():
+    """选出胜出请求后立即关闭落选请求的连接，不等它的下一个事件"""
+    session = FakeSession({"a": (10.0, ["stalled"]), "b": (0.0, ["fast"])})
+    config = HedgeConfig(default_delay=0.05, min_delay=0.05, urls=["a", "b"])
+    assert list(hedged_events(session, "a", {}, {}, config=config, tracker=LatencyTracker())) == [TextDelta("fast")]
+    for _ in range(50):
+        if "a" in session.closed:
+            break
+        time.sleep(0.01)
+    assert "a" in session.closed
+
+
+def test_session_abort_shuts_down_response():
+    """Session.abort关闭进行中的响应；没有响应时只做标记"""
+    shutdowns = []
+    session = Session(token="t", update_info_at_init=False).fork()
+    session.abort()
+    assert session.aborted
+    session = Session(token="t", update_info_at_init=False).fork()
+    session.response = SimpleNamespace(raw=SimpleNamespace(shutdown=lambda: shutdowns.append(1)))
+    session.abort()
+    assert shutdowns == [1]
+
+
+if __name__ == "__main__":
+    test_slow_primary_is_hedged()
+    test_fast_primary_is_not_hedged()
+    test_failed_request_fails_over()
+    test_failover_limits()
+    test_losing_request_is_closed_immediately()
+    test_session_abort_shuts_down_response()
+    print("全部通过")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试按主机共享的requests连接池（使用本地HTTP服务，不访问外网）
+"""
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_session import TimedHTTPAdapter, close_pool, get_http_session, pop_connect_time
+
+
+class CookieHandler(BaseHTTPRequestHandler):
+    """记录收到的Cookie请求头，并在响应中设置一个cookie"""
+    protocol_version = "HTTP/1.1"  # 保持连接，以便检查连接复用
+    received = []
+
+    def do_GET(self):
+        self.received.append(self.headers.get("Cookie"))
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Set-Cookie", "leaked=1; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CookieHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_session_per_host():
+    """同一主机返回同一个Session，不同主机使用各自的Session"""
+    close_pool()
+    try:
+        http = get_http_session("https://sider.ai/api/v3/completion/text")
+        assert get_http_session("https://sider.ai/api/v1/imagechat/upload") is http
+        other = get_http_session("https://api2.sider.ai/api/v2/completion/text")
+        assert other is not http
+        assert isinstance(http.get_adapter("https://sider.ai/"), TimedHTTPAdapter)
+    finally:
+        close_pool()
+
+
+def test_cookies_do_not_leak_between_credentials():
+    """响应中的Set-Cookie不保存到共享的Session，下一个凭据的请求只带自己的Cookie"""
+    server = _serve()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    CookieHandler.received = []
+    close_pool()
+    try:
+        http = get_http_session(url)
+        # 与Session.get_events一样使用流式响应，读取前连接还没有归还连接池
+        first = http.get(url, headers={"Cookie": "token=a"}, stream=True)
+        assert first.cookies.get("leaked") == "1"
+        assert pop_connect_time(first) is not None  # 新建连接记录了耗时
+        assert first.content == b"ok"  # 读完后连接归还连接池
+        second = http.get(url, headers={"Cookie": "token=b"}, stream=True)
+        assert pop_connect_time(second) is None  # 复用连接
+        assert second.content == b"ok"
+        assert CookieHandler.received == ["token=a", "token=b"]
+        assert len(http.cookies) == 0
+    finally:
+        close_pool()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_session_per_host()
+    test_cookies_do_not_leak_between_credentials()
+    print("全部通过")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试map-reduce模式的切分、并发执行和汇总（不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import time
+
+from utils.sider_api import ChatRequest, ChatResponse
+from utils.sider_mapreduce import MODEL_INPUT_TOKENS, MapReduceConfig, map_reduce, needs_map_reduce
+from utils.sider_session import ADVANCED_MODELS, MODELS
+from utils.sider_text import estimate_tokens, split_tokens
+
+
+class FakeClient:
+    """记录收到的提示词：map步骤返回部分的序号，reduce步骤流式返回汇总"""
+
+    def __init__(self):
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def chat(self, request, streaming=True, buffer=None, deadline=None):
+        with self._lock:
+            self.prompts.append(request.prompt)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.05)
+        finally:
+            with self._lock:
+                self.active -= 1
+        if request.prompt.startswith("The following is part"):
+            text = "summary of " + request.prompt.split("\n")[0].split()[4]
+        else:
+            text = f"final ({request.prompt.count('### Part')} parts)"
+            yield "final "
+        return ChatResponse(response=text, context_id="new-cid", model=request.model)
+
+
+def run(generator):
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(generator))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+
+def test_estimate_and_split_tokens():
+    """中日韩字符按每字一个token估算，切分后每部分不超过预算且拼接后与原文相同"""
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcdefgh") == 2
+    text = "第一段内容。" * 200 + "\n\n" + "English sentence here. " * 300
+    chunks = split_tokens(text, 300)
+    assert "".join(chunks) == text
+    assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+    assert split_tokens("", 10) == []
+
+
+def test_limit_table_covers_models():
+    """模型列表中的每个模型都有输入上限"""
+    assert all(model in MODEL_INPUT_TOKENS for model in MODELS + ADVANCED_MODELS)
+
+
+def test_short_prompt_sent_unchanged():
+    """没有超过上限的提示词直接发送"""
+    client = FakeClient()
+    request = ChatRequest(prompt="short question", model="gpt-4o-mini")
+    assert not needs_map_reduce(request)
+    chunks, response = run(map_reduce(client, request))
+    assert client.prompts == ["short question"]
+    assert response.response == "final (0 parts)"
+
+
+def test_long_prompt_mapped_concurrently_then_reduced():
+    """超长提示词切分后并发执行map，reduce使用原请求的上下文并流式返回"""
+    client = FakeClient()
+    document = "Paragraph with some words. " * 40 + "\n\n"
+    request = ChatRequest(prompt=document * 10, model="gpt-4o-mini", context_id="cid")
+    config = MapReduceConfig(instruction="List the topics", max_input_tokens=400, max_workers=4)
+    chunks, response = run(map_reduce(client, request, config))
+    maps = [prompt for prompt in client.prompts if prompt.startswith("The following is part")]
+    assert len(maps) > 1 and client.peak > 1
+    assert all(estimate_tokens(prompt) <= 400 for prompt in maps)
+    assert all("List the topics" in prompt for prompt in maps)
+    assert chunks == ["final "]
+    assert response.response == f"final ({len(maps)} parts)"
+    assert response.context_id == "new-cid"
+
+
+if __name__ == "__main__":
+    test_estimate_and_split_tokens()
+    test_limit_table_covers_models()
+    test_short_prompt_sent_unchanged()
+    test_long_prompt_mapped_concurrently_then_reduced()
+    print("全部通过")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试请求指标的记录、钩子和Prometheus文本输出
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import sider_metrics
+from utils.sider_metrics import PrometheusExporter, RequestMetrics
+from fakes import FakeClock
+
+
+def test_request_metrics_timings():
+    """分别记录响应头、首字节、首字、数据块间隔和总耗时"""
+    clock = FakeClock()
+    metrics = RequestMetrics("sider", clock=clock)
+    clock.now = 0.2
+    metrics.response_started(0.05)
+    clock.now = 0.3
+    chunks = list(metrics.count_bytes([b"abc", b"de"]))
+    assert chunks == [b"abc", b"de"]
+    metrics.text()
+    clock.now = 0.302
+    metrics.text()
+    clock.now = 0.5
+    metrics.text()
+    metrics.finish(True, host="sider.ai", quota=(29, 30, False))
+    result = metrics.to_dict()
+    assert (result["connect_ms"], result["headers_ms"], result["first_byte_ms"]) == (50.0, 200.0, 300.0)
+    assert result["first_token_ms"] == 300.0 and result["total_ms"] == 500.0
+    assert result["bytes_received"] == 5 and result["chunks"] == 3
+    assert result["inter_chunk"]["buckets"] == {"5": 1, "250": 1}
+    assert result["reused_connection"] is False and result["quota_remain"] == 29
+
+
+def test_prometheus_exporter():
+    """按模型汇总请求数、计数器和直方图"""
+    exporter = PrometheusExporter()
+    for success in (True, True, False):
+        metrics = RequestMetrics("gpt-4o-mini", clock=FakeClock())
+        metrics.response_started(None)
+        metrics.text()
+        metrics.retry()
+        metrics.finish(success, quota=(10, 30, False) if success else None)
+        exporter(metrics)
+    text = exporter.render()
+    assert 'sider_requests_total{model="gpt-4o-mini",outcome="success"} 2' in text
+    assert 'sider_requests_total{model="gpt-4o-mini",outcome="failure"} 1' in text
+    assert 'sider_retries_total{model="gpt-4o-mini"} 3' in text
+    assert 'sider_connections_reused_total{model="gpt-4o-mini"} 3' in text
+    assert 'sider_request_duration_seconds_bucket{model="gpt-4o-mini",le="+Inf"} 3' in text
+    assert 'sider_quota_remaining{tier="basic"} 10' in text
+
+
+def test_failing_hook_is_ignored():
+    """钩子抛出的异常不影响其他钩子"""
+    seen = []
+
+    def broken(metrics):
+        raise RuntimeError("boom")
+
+    sider_metrics.add_hook(broken)
+    sider_metrics.add_hook(seen.append)
+    try:
+        sider_metrics.emit(RequestMetrics("sider"))
+    finally:
+        sider_metrics.remove_hook(broken)
+        sider_metrics.remove_hook(seen.append)
+    assert len(seen) == 1
+
+
+if __name__ == "__main__":
+    test_request_metrics_timings()
+    test_prometheus_exporter()
+    test_failing_hook_is_ignored()
+    print("全部通过")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+测试多凭据池的调度（使用模拟客户端，不访问网络）
+"""
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_api import ChatRequest, ChatResponse, SiderAPIClient
+from utils.sider_events import TextDelta
+from utils.sider_session import Session
+from utils.sider_pool import CredentialPool, parse_credentials
+
+
+class FakeClient:
+    """返回预设结果的客户端，记录收到的请求"""
+
+    def __init__(self, name, remain=None, advanced_remain=None, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+        self._base_session = SimpleNamespace(total=None, remain=remain, advanced_total=None,
+                                             advanced_remain=advanced_remain)
+
+    def chat(self, request, streaming=True, **kwargs):
+        self.calls += 1
+        if self.error:
+            return ChatResponse(response="", context_id="", model=request.model, success=False, error=self.error)
+        yield self.name
+        return ChatResponse(response=self.name, context_id="cid-" + self.name, model=request.model)
+
+
+def _pool(clients, **kwargs):
+    pool = CredentialPool([(f"t{i}", f"c{i}") for i in range(len(clients))], **kwargs)
+    for member, client in zip(pool.members, clients):
+        member.client = client
+    return pool
+
+
+def _run(generator):
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(generator))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+
+def test_schedule_by_tier_headroom():
+    """按模型档位选择剩余额度最多的凭据，并计入进行中的请求"""
+    pool = _pool([FakeClient("a", remain=5, advanced_remain=1), FakeClient("b", remain=3, advanced_remain=4)],
+                 max_concurrency=3)
+    assert pool.acquire("gpt-4o-mini").client.name == "a"
+    assert pool.acquire("gpt-4o").client.name == "b"
+    assert pool.acquire("gpt-4o-mini").client.name == "a"
+    assert pool.acquire("gpt-4o-mini").client.name == "a"  # a: 5-2=3, b: 3-1=2
+
+
+def test_concurrency_limit():
+    """凭据达到并发上限后等待，超时则失败"""
+    pool = _pool([FakeClient("a")], max_concurrency=1, acquire_timeout=0.05)
+    member = pool.acquire("sider")
+    try:
+        pool.acquire("sider")
+        assert False, "应当等待超时"
+    except Exception as err:
+        assert "超时" in str(err)
+    pool.release(member)
+    assert pool.acquire("sider") is member
+
+
+def test_quota_failover_and_affinity():
+    """额度耗尽时换用其他凭据；之后带context_id的请求交给创建对话的凭据"""
+    a = FakeClient("a", remain=9, error="Sider API错误: quota exhausted (Code: 1001)")
+    b = FakeClient("b", remain=1)
+    pool = _pool([a, b])
+    chunks, result = _run(pool.chat(ChatRequest(prompt="x", model="sider")))
+    assert chunks == ["b"] and result.success and result.context_id == "cid-b"
+    assert pool.members[0].exhausted_until[False] > 0
+
+    a.error = None
+    pool.members[0].exhausted_until[False] = 0
+    _run(pool.chat(ChatRequest(prompt="x", model="sider", context_id="cid-b")))
+    assert b.calls == 2
+
+
+class QuotaStreamClient(FakeClient):
+    """流中报告剩余额度的客户端，额度经由真实的Session事件处理和SiderAPIClient保存"""
+
+    def __init__(self, name, stream_remain, **kwargs):
+        super().__init__(name, **kwargs)
+        self.stream_remain = stream_remain
+
+    def chat(self, request, streaming=True, **kwargs):
+        self.calls += 1
+        session = Session(token="t", update_info_at_init=False)
+        data = {"msg": "", "data": {"text": self.name, "total": 50, "remain": self.stream_remain}}
+        for event in session._handle_data(data, {"model": request.model}):
+            if isinstance(event, TextDelta):
+                yield event.text
+        SiderAPIClient._remember_quota(self, session)
+        return ChatResponse(response=self.name, context_id="", model=request.model)
+
+
+def test_zero_remain_marks_exhausted():
+    """流中报告remain为0时保存0，该凭据被标记为耗尽，下一次请求换用其他凭据"""
+    a = QuotaStreamClient("a", stream_remain=0, remain=9)
+    b = QuotaStreamClient("b", stream_remain=3, remain=5)
+    pool = _pool([a, b])
+    chunks, result = _run(pool.chat(ChatRequest(prompt="x", model="sider")))
+    assert chunks == ["a"] and result.success
+    assert a._base_session.remain == 0
+    assert pool.members[0].exhausted_until[False] > 0
+
+    chunks, _ = _run(pool.chat(ChatRequest(prompt="x", model="sider")))
+    assert chunks == ["b"] and a.calls == 1
+
+
+def test_parse_credentials():
+    """按行解析多组凭据，单个cookie由所有token共用"""
+    assert parse_credentials("t1\nt2\n", "c1\nc2") == [("t1", "c1"), ("t2", "c2")]
+    assert parse_credentials("t1\nt2", "c") == [("t1", "c"), ("t2", "c")]
+    try:
+        parse_credentials("t1\nt2\nt3", "c1\nc2")
+        assert False, "数量不一致应当报错"
+    except ValueError:
+        pass
+
+
+
+def test_non_chat_tool_with_two_credentials():
+    """翻译工具使用两行凭据时按组拆分，交给池中的客户端，不把多行字符串放进请求头"""
+    from tools.sider_translate import SiderTranslateTool
+
+    used = []
+
+    def translate(self, content, target_lang="English", model="sider", deadline=None):
+        assert "\n" not in self.token and "\n" not in self.cookie
+        used.append(self.token)
+        return content.upper()
+
+    original, SiderAPIClient.translate = SiderAPIClient.translate, translate
+    try:
+        tool = object.__new__(SiderTranslateTool)
+        tool.runtime = SimpleNamespace(credentials={"sider_token": "pool-a\npool-b", "sider_cookie": "token=x"})
+        tool.create_text_message = lambda text: ("text", text)
+        tool.create_json_message = lambda data: ("json", data)
+        messages = list(tool._invoke({"content": "hello"}))
+    finally:
+        SiderAPIClient.translate = original
+    assert ("text", "HELLO") in messages and messages[-1][1]["success"]
+    assert used and used[0] in ("pool-a", "pool-b")
+
+if __name__ == "__main__":
+    test_schedule_by_tier_headroom()
+    test_concurrency_limit()
+    test_quota_failover_and_affinity()
+    test_zero_remain_marks_exhausted()
+    test_parse_credentials()
+    test_non_chat_tool_with_two_credentials()
+    print("全部通过")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试重试策略和熔断器（使用模拟时钟，不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import sider_retry, sider_session
+from utils.sider_deadline import Deadline, DeadlineExceeded
+from utils.sider_retry import (RetryPolicy, CircuitBreaker, CircuitOpenError, UpstreamError,
+                               is_transient, upstream_error)
+from utils.sider_session import Session
+from fakes import FakeClock
+
+
+def test_error_classification():
+    """限流、服务端错误、Cloudflare验证和连接中断可以重试，其他错误不重试"""
+    assert is_transient(UpstreamError(429)) and is_transient(UpstreamError(502))
+    assert not is_transient(UpstreamError(401))
+    assert is_transient(upstream_error(403, {}, "<title>Just a moment...</title>"))
+    assert not is_transient(upstream_error(403, {}, '{"error":"forbidden"}'))
+    assert is_transient(ConnectionError("reset"))
+    assert is_transient(DeadlineExceeded("connect", 10)) and not is_transient(DeadlineExceeded("idle", 30))
+    assert upstream_error(429, {"Retry-After": "3"}).retry_after == 3.0
+
+
+def test_backoff_with_jitter_and_retry_after():
+    """退避时间按指数增长并随机抖动，Retry-After优先，次数和时间预算用完后不再重试"""
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=3, rng=lambda: 0.5)
+    assert [policy.backoff(i) for i in range(4)] == [0.5, 1.0, 1.5, 1.5]
+    assert policy.next_delay(UpstreamError(503), 0) == 0.5
+    assert policy.next_delay(UpstreamError(429, retry_after=2.0), 0) == 2.0
+    assert policy.next_delay(UpstreamError(429, retry_after=60.0), 0) is None
+    assert policy.next_delay(UpstreamError(503), 2) is None
+
+    clock = FakeClock()
+    deadline = Deadline(total=20, connect=5, clock=clock)
+    clock.now = 16
+    assert policy.next_delay(UpstreamError(503), 0, deadline) is None
+    assert policy.backoff_within(0, deadline) is None  # 限流消息的退避同样不超过时间预算
+    clock.now = 10
+    assert policy.backoff_within(0, deadline) == 0.5
+
+
+def test_circuit_breaker():
+    """连续失败后打开，超时后只放行一个试探请求，成功则关闭"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("sider.ai", failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    try:
+        breaker.check()
+        assert False, "应当熔断"
+    except CircuitOpenError as err:
+        assert err.retry_after == 10
+    clock.now = 10
+    breaker.check()  # 试探请求
+    try:
+        breaker.check()
+        assert False, "半开状态只放行一个请求"
+    except CircuitOpenError:
+        pass
+    breaker.record_success()
+    breaker.check()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class IdleTimeoutHTTP:
+    """post时抛出空闲超时，既不算主机成功也不算失败"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        raise DeadlineExceeded("idle", 30)
+
+
+def test_probe_without_outcome_is_released():
+    """试探请求因时间预算结束时释放名额，熔断器不会一直停在半开状态"""
+    clock = FakeClock()
+    breaker = sider_retry._breakers["probe.test"] = CircuitBreaker(
+        "probe.test", failure_threshold=1, reset_timeout=10, clock=clock)
+    http = sider_session._http_sessions["probe.test"] = IdleTimeoutHTTP()
+    session = Session(token="t", cookie="token=t", update_info_at_init=False)
+    url = "https://probe.test/api/v3/completion/text"
+    try:
+        breaker.record_failure()
+        clock.now = 10
+
+        # 时间预算已经用完的请求不发送，也不占用试探名额
+        expired = Deadline(total=5, clock=clock)
+        clock.now = 20
+        try:
+            list(session.get_events(url, {}, {}, deadline=expired))
+            assert False, "应当超时"
+        except DeadlineExceeded as err:
+            assert err.phase == "total"
+        assert http.calls == 0 and breaker.state == CircuitBreaker.OPEN
+
+        # 试探请求以空闲超时结束，之后的请求可以重新试探
+        for calls in (1, 2):
+            try:
+                list(session.get_events(url, {}, {}))
+                assert False, "应当超时"
+            except DeadlineExceeded as err:
+                assert err.phase == "idle"
+            assert http.calls == calls and breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.check()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+    finally:
+        del sider_retry._breakers["probe.test"]
+        del sider_session._http_sessions["probe.test"]
+
+
+if __name__ == "__main__":
+    test_error_classification()
+    test_backoff_with_jitter_and_retry_after()
+    test_circuit_breaker()
+    test_probe_without_outcome_is_released()
+    print("全部通过")
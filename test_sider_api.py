@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+测试SiderAPIClient的错误分类和重试逻辑，以及请求体模板（不访问网络）
+"""
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from types import SimpleNamespace
+
+from utils import sider_api, sider_json
+from utils.sider_context import dead_contexts
+from utils.sider_api import SiderAPIClient, ChatRequest, ErrorAction, classify_error
+from utils.sider_events import TextDelta, ServerMessage
+from utils.sider_retry import RetryPolicy, UpstreamError
+from utils.sider_deadline import Deadline
+from utils.sider_session import CHAT_TEMPLATE, PayloadTemplate, Session
+
+
+class FakeSession:
+    """按顺序返回预设事件的会话，每次chat消耗一组事件"""
+
+    def __init__(self, scripts, context_id=""):
+        self.scripts = scripts
+        self.context_id = context_id
+        self.host = None
+        self.models = []
+        self.total = self.remain = None
+        self.advanced_total = self.advanced_remain = None
+
+    def chat(self, typed=False, **kwargs):
+        self.models.append(kwargs["model"])
+        return self._events(self.scripts.pop(0))
+
+    def ocr(self, image, typed=False, **kwargs):
+        return self._events(self.scripts.pop(0))
+
+    def _events(self, script):
+        # 脚本中的异常在对应位置抛出，模拟请求失败或连接中断
+        for item in script:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class FakeClient(SiderAPIClient):
+    def __init__(self, scripts):
+        # 退避时间固定为0，测试不等待
+        super().__init__(token="test_token", cookie="test_cookie",
+                         retry_policy=RetryPolicy(rng=lambda: 0.0))
+        self.scripts = scripts
+        self.sessions = []
+
+    def _create_session(self, context_id=""):
+        session = FakeSession(self.scripts, context_id)
+        self.sessions.append(session)
+        return session
+
+
+def _run(client, request, streaming=True):
+    generator = client.chat(request, streaming=streaming)
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(generator))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+
+def test_classify_error():
+    """按code查表，未知code按msg关键字归类"""
+    assert classify_error(ServerMessage(605, "invalid conversation id")) is ErrorAction.NEW_SESSION
+    assert classify_error(ServerMessage(1001, "Daily quota exceeded")) is ErrorAction.FALLBACK
+    assert classify_error(ServerMessage(1, "Rate limit reached")) is ErrorAction.RETRY
+    assert classify_error(ServerMessage(500, "internal")) is ErrorAction.FAIL
+
+
+def test_error_text_in_answer_is_not_an_error():
+    """回答内容里出现Error:等字样不会中断或重试"""
+    client = FakeClient([[TextDelta("Error: "), TextDelta("Failed to parse")]])
+    chunks, result = _run(client, ChatRequest(prompt="x"))
+    assert chunks == ["Error: ", "Failed to parse"]
+    assert result.success and len(client.sessions) == 1
+
+
+def test_invalid_conversation_starts_new_session():
+    """605时用新会话重试一次，并记住失效的对话ID"""
+    dead_contexts._entries.clear()
+    client = FakeClient([[ServerMessage(605, "invalid conversation id")], [TextDelta("ok")]])
+    chunks, result = _run(client, ChatRequest(prompt="x", context_id="old"), streaming=False)
+    assert chunks == ["ok"] and result.response == "ok"
+    assert [s.context_id for s in client.sessions] == ["old", ""]
+
+    # 已知失效的对话ID不再先请求一次
+    client = FakeClient([[TextDelta("ok")]])
+    _, result = _run(client, ChatRequest(prompt="x", context_id="old"))
+    assert result.success and [s.context_id for s in client.sessions] == [""]
+
+
+def test_quota_fallback_and_fail():
+    """额度耗尽时改用备用模型；没有备用模型则失败"""
+    client = FakeClient([[ServerMessage(1001, "quota exhausted")], [TextDelta("ok")]])
+    _, result = _run(client, ChatRequest(prompt="x", model="gpt-4o", fallback_model="gpt-4o-mini"))
+    assert result.success and client.sessions[0].models == ["gpt-4o", "gpt-4o-mini"]
+
+    client = FakeClient([[ServerMessage(1001, "quota exhausted")]])
+    _, result = _run(client, ChatRequest(prompt="x", model="gpt-4o"))
+    assert not result.success and "quota exhausted" in result.error
+
+
+def test_rate_limit_retry_respects_deadline():
+    """限流消息退避后剩余时间不足时不再重试"""
+    client = FakeClient([[ServerMessage(429, "too many requests")], [TextDelta("ok")]])
+    _, result = _run(client, ChatRequest(prompt="x"))
+    assert result.success and len(client.sessions[0].models) == 2
+
+    client = FakeClient([[ServerMessage(429, "too many requests")], [TextDelta("ok")]])
+    generator = client.chat(ChatRequest(prompt="x"), deadline=Deadline(total=1, connect=5))
+    try:
+        next(generator)
+        assert False, "不应输出内容"
+    except StopIteration as stop:
+        assert not stop.value.success and "剩余时间不足" in stop.value.error
+
+
+def test_ocr_stream():
+    """OCR结果逐块输出；限流时在输出前重试，输出后失败直接抛出"""
+    client = FakeClient([[ServerMessage(429, "too many requests")], [TextDelta("第一"), TextDelta("行")]])
+    assert list(client.ocr_stream(b"png")) == ["第一", "行"] and len(client.sessions) == 2
+
+    client = FakeClient([[TextDelta("a"), ConnectionError("reset")], [TextDelta("b")]])
+    chunks = []
+    try:
+        for chunk in client.ocr_stream(b"png"):
+            chunks.append(chunk)
+        assert False, "应当失败"
+    except ConnectionError:
+        assert chunks == ["a"]
+
+
+def test_retry_only_before_first_token():
+    """暂时性错误在输出内容前重试；已经输出内容后不重试"""
+    client = FakeClient([[UpstreamError(503)], [ConnectionError("reset")], [TextDelta("ok")]])
+    chunks, result = _run(client, ChatRequest(prompt="x"))
+    assert chunks == ["ok"] and result.success
+    assert result.metrics["retries"] == 2 and result.metrics["chunks"] == 1
+
+    client = FakeClient([[TextDelta("a"), ConnectionError("reset")], [TextDelta("b")]])
+    chunks, result = _run(client, ChatRequest(prompt="x"))
+    assert chunks == ["a"] and not result.success and "reset" in result.error
+
+    client = FakeClient([[UpstreamError(401)], [TextDelta("ok")]])
+    _, result = _run(client, ChatRequest(prompt="x"))
+    assert not result.success and "401" in result.error
+
+
+class UserinfoClient(SiderAPIClient):
+    """按顺序返回预设的用户信息接口结果(None为成功)"""
+
+    def __init__(self, outcomes):
+        super().__init__(token="validate_token", cookie="validate_cookie")
+        self.outcomes = outcomes
+        self.calls = 0
+
+    def _fetch_userinfo(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+
+def test_validate_credentials_cached():
+    """凭据验证使用用户信息接口，结果按凭据缓存；暂时性错误不缓存"""
+    sider_api._validation_cache.clear()
+    client = UserinfoClient([ConnectionError("reset"), None])
+    assert not client.validate_credentials()
+    assert client.validate_credentials() and client.validate_credentials()
+    assert client.calls == 2
+
+    sider_api._validation_cache.clear()
+    denied = Exception("401 Unauthorized")
+    denied.response = SimpleNamespace(status_code=401)
+    client = UserinfoClient([denied])
+    assert not client.validate_credentials() and not client.validate_credentials()
+    assert client.calls == 1
+    sider_api._validation_cache.clear()
+
+
+def test_validation_cache_is_bounded():
+    """缓存已满且没有过期结果时淘汰最早的结果"""
+    sider_api._validation_cache.clear()
+    for i in range(sider_api.VALIDATION_CACHE_SIZE + 5):
+        client = UserinfoClient([None])
+        client.token = f"token-{i}"
+        assert client.validate_credentials()
+    assert len(sider_api._validation_cache) == sider_api.VALIDATION_CACHE_SIZE
+    assert sider_api.credential_key("token-0", "validate_cookie") not in sider_api._validation_cache
+    sider_api._validation_cache.clear()
+
+
+def test_client_cache_lru():
+    """相同凭据复用客户端；超过CLIENT_CACHE_SIZE时淘汰最久未使用的；空闲超过CLIENT_IDLE_TTL后重新创建"""
+    now = [0.0]
+    clock = lambda: now[0]
+    sider_api._client_cache.clear()
+    client = sider_api.get_client("t0", "c", clock=clock)
+    assert sider_api.get_client("t0", "c", clock=clock) is client
+    assert sider_api.get_client("t0", "other", clock=clock) is not client
+    sider_api.get_client("t0", "c", clock=clock)  # 使用后移到最近使用的一端
+
+    for i in range(1, sider_api.CLIENT_CACHE_SIZE):
+        sider_api.get_client(f"t{i}", "c", clock=clock)
+    assert len(sider_api._client_cache) == sider_api.CLIENT_CACHE_SIZE
+    assert sider_api.credential_key("t0", "other") not in sider_api._client_cache  # 最久未使用
+    assert sider_api.get_client("t0", "c", clock=clock) is client
+
+    recent = sider_api.get_client("t1", "c", clock=clock)
+    now[0] = sider_api.CLIENT_IDLE_TTL
+    assert sider_api.get_client("t1", "c", clock=clock) is recent  # 刚好达到空闲时间时仍然复用
+    now[0] = sider_api.CLIENT_IDLE_TTL * 2 + 1
+    assert sider_api.get_client("t1", "c", clock=clock) is not recent
+    assert len(sider_api._client_cache) == 1  # 其余客户端都已空闲超时
+    sider_api._client_cache.clear()
+
+
+def test_payload_template():
+    """请求体模板拼接的JSON与完整的请求体一致，字典中只保留可变字段"""
+    session = Session(token="t", context_id="c1", cookie="token=t", update_info_at_init=False)
+    for backend in sider_json.BACKENDS:
+        if sider_json._load_backend(backend) is None:
+            continue
+        sider_json.set_backend(backend)
+        url, header, payload = session._chat_request('说"hi"\n', model="gpt-4o", thinking_mode=True,
+                                                     output_lang="en")
+        assert header["content-type"] == "application/json" and header["authorization"] == "Bearer t"
+        assert payload["model"] == "gpt-4o" and payload["stream"] is True
+        assert "app_name" not in payload
+        assert json.loads(payload.body) == dict(CHAT_TEMPLATE.fixed, prompt='说"hi"\n', stream=True, cid="c1",
+                                                model="gpt-4o", output_language="en", tools={"auto": ["data_analysis"]},
+                                                prompt_templates=[{"key": "artifacts", "attributes": {"lang": "original"}},
+                                                                  {"key": "thinking_mode", "attributes": {}}])
+    sider_json.set_backend()
+    assert json.loads(PayloadTemplate({"a": 1}).render().body) == {"a": 1}
+    assert json.loads(PayloadTemplate({}).render(b=[1]).body) == {"b": [1]}
+
+
+if __name__ == "__main__":
+    test_classify_error()
+    test_error_text_in_answer_is_not_an_error()
+    test_invalid_conversation_starts_new_session()
+    test_quota_fallback_and_fail()
+    test_rate_limit_retry_respects_deadline()
+    test_ocr_stream()
+    test_retry_only_before_first_token()
+    test_validate_credentials_cached()
+    test_validation_cache_is_bounded()
+    test_client_cache_lru()
+    test_payload_template()
+    print("全部通过")
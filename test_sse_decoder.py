@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试增量SSE解码器
+"""
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_sse import SSEDecoder, DONE, is_ignorable, iter_events, parse_event
+from utils.sider_session import Session, render_event
+from utils.sider_events import TextDelta, ServerMessage, QuotaUpdate
+from utils import sider_json
+
+
+def _event(text, cid="c1"):
+    return {"code": 0, "msg": "", "data": {"text": text, "cid": cid, "total": 10, "remain": 9}}
+
+
+def _stream(events):
+    return b"".join(b"data: " + json.dumps(e).encode() + b"\r\n\r\n" for e in events) + b"data: [DONE]\n\n"
+
+
+def test_events_split_across_chunks():
+    """事件被任意切分到多个数据块时结果不变"""
+    body = _stream([_event("你好"), _event("世界")])
+    for size in (1, 2, 3, 7, len(body)):
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        events = list(iter_events(chunks))
+        assert [json.loads(e)["data"]["text"] for e in events[:-1]] == ["你好", "世界"]
+        assert events[-1] == DONE
+
+
+def test_multiline_data_event():
+    """多行data按换行连接成一个事件"""
+    decoder = SSEDecoder()
+    assert decoder.feed(b'data: {"a":\ndata: 1}\n') == []
+    assert decoder.feed(b": comment\n\n") == [b'{"a":\n1}']
+    assert json.loads(b'{"a":\n1}') == {"a": 1}
+
+
+def test_comment_line_containing_data():
+    """注释行和其他字段中出现的"data:"不会被当作事件"""
+    decoder = SSEDecoder()
+    assert decoder.feed(b": keepalive data: x\n\n") == []
+    assert decoder.feed(b"event: metadata: y\n\ndata: 1\n\n") == [b"1"]
+    assert decoder.feed(b": data: z\n\ndata: 2\n\ndata: 3\n\n") == [b"2", b"3"]
+
+
+def test_unseparated_data_lines_fall_back_to_per_line():
+    """服务端没有用空行分隔事件时，合并后的事件逐行解析"""
+    data = b'{"x": 1}\n{"x": 2}'
+    assert parse_event(data, json.loads) == [{"x": 1}, {"x": 2}]
+
+
+def test_ignorable_fast_path():
+    """没有输出内容且msg为空的事件可以跳过"""
+    assert is_ignorable(b'{"code":0,"msg":"","data":{"status":"ok"}}')
+    assert not is_ignorable(b'{"code":0,"msg":"","data":{"text":"a"}}')
+    assert not is_ignorable(b'{"code":605,"msg":"invalid conversation id","data":null}')
+
+
+def test_session_iter_events():
+    """Session解码后的文本、上下文ID和额度与事件一致"""
+    session = Session(token="test_token", update_info_at_init=False)
+    body = _stream([_event("Hel"), _event("lo", cid="c2"),
+                    {"code": 605, "msg": "invalid conversation id", "data": None}])
+    events = session._iter_events([body[:10], body[10:]], {"stream": True, "model": "sider"})
+    texts = [text for text in map(render_event, events) if text is not None]
+    assert texts == ["Hel", "lo", "<Message: invalid conversation id Code: 605>"]
+    assert session.context_id == "c2"
+    assert session.remain == 9
+
+
+def test_session_typed_events():
+    """类型化事件：错误按code识别，额度只在变化时上报"""
+    session = Session(token="test_token", update_info_at_init=False)
+    body = _stream([_event("a"), _event("b"),
+                    {"code": 605, "msg": "invalid conversation id", "data": None}])
+    for backend in sider_json.BACKENDS:
+        if sider_json._load_backend(backend) is None:
+            continue
+        sider_json.set_backend(backend)
+        session.total = session.remain = None
+        events = list(session._iter_events([body], {"stream": True, "model": "sider"}))
+        assert events == [QuotaUpdate(10, 9, False), TextDelta("a"), TextDelta("b"),
+                          ServerMessage(605, "invalid conversation id")]
+    sider_json.set_backend()
+
+
+if __name__ == "__main__":
+    test_events_split_across_chunks()
+    test_multiline_data_event()
+    test_comment_line_containing_data()
+    test_unseparated_data_lines_fall_back_to_per_line()
+    test_ignorable_fast_path()
+    test_session_iter_events()
+    test_session_typed_events()
+    print("全部通过")
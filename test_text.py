@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+测试长文本切分
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sider_text import split_segments, split_whitespace
+
+
+def test_split_on_paragraphs_and_sentences():
+    """优先按段落切分，段落过长时按句子切分，拼接后与原文相同"""
+    text = "第一段。第二句！\n\nFirst sentence. Second one? Third.\n\n" + "长" * 25
+    segments = split_segments(text, 20)
+    assert "".join(segments) == text
+    assert all(len(segment) <= 20 for segment in segments)
+    assert segments[0] == "第一段。第二句！\n\n"
+    assert "First sentence. " in segments and "长" * 20 in segments
+
+    assert split_segments(text, 1000) == [text]
+    assert split_segments("", 10) == []
+
+
+def test_split_whitespace():
+    """首尾空白单独保留"""
+    assert split_whitespace("\n\n  abc d \n") == ("\n\n  ", "abc d", " \n")
+    assert split_whitespace(" \n ") == (" \n ", "", "")
+
+
+if __name__ == "__main__":
+    test_split_on_paragraphs_and_sentences()
+    test_split_whitespace()
+    print("全部通过")
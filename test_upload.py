@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+测试图片上传的流式multipart请求体（不访问网络）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import io
+import tempfile
+
+from utils.sider_session import MultipartBody, open_upload
+
+
+def test_multipart_body_streams_file():
+    """请求体分块读取文件，长度与实际内容一致"""
+    data = os.urandom(200000)
+    body = MultipartBody("file", 'scan "1".png', "image/png", io.BytesIO(data), len(data), chunk_size=65536)
+    chunks = list(body)
+    payload = b"".join(chunks)
+    assert len(payload) == len(body)
+    assert len(chunks) == 2 + 4  # 头、4个文件块、尾
+    assert b'name="file"; filename="scan %221%22.png"' in payload
+    assert b"Content-Type: image/png\r\n\r\n" + data + b"\r\n--" in payload
+    assert body.content_type.split("boundary=")[1].encode() in payload
+
+
+def test_open_upload_sources():
+    """文件路径推断文件名和MIME类型，文件对象按当前位置计算长度"""
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+        tmp.write(b"12345")
+    try:
+        fileobj, size, name, content_type = open_upload(tmp.name)
+        fileobj.close()
+        assert size == 5 and name.endswith(".png") and content_type == "image/png"
+    finally:
+        os.unlink(tmp.name)
+
+    stream = io.BytesIO(b"xxabc")
+    stream.seek(2)
+    fileobj, size, name, content_type = open_upload(lambda: stream)
+    assert size == 3 and fileobj.read() == b"abc"
+
+    fileobj, size, _, _ = open_upload((io.BytesIO(b"abcd"), 4))
+    assert size == 4
+
+
+if __name__ == "__main__":
+    test_multipart_body_streams_file()
+    test_open_upload_sources()
+    print("全部通过")
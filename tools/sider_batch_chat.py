@@ -0,0 +1,117 @@
+"""
+Sider AI 批量聊天工具实现
+一次调用并发处理一组提示词，按输入顺序返回结果
+"""
+from collections.abc import Generator
+from typing import Any
+import logging
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.sider_api import get_client, ChatRequest, ChatOptions
+from utils.sider_batch import DEFAULT_WORKERS, parse_prompts, run_batch
+from utils.sider_pool import get_pool, parse_credentials
+
+logger = logging.getLogger(__name__)
+
+class SiderBatchChatTool(Tool):
+    """Sider AI批量聊天工具"""
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        执行批量聊天工具调用
+
+        Args:
+            tool_parameters: 工具参数字典
+
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        try:
+            # 获取工具参数
+            prompts = tool_parameters.get("prompts", "") or ""
+            prompt_template = tool_parameters.get("prompt_template", "") or ""
+            model = tool_parameters.get("model", "sider")
+            output_lang = tool_parameters.get("output_lang", "auto")
+            thinking_mode = tool_parameters.get("thinking_mode", False)
+            max_workers = tool_parameters.get("max_workers")
+            max_workers = DEFAULT_WORKERS if max_workers is None else int(max_workers)
+
+            # 验证必需参数
+            try:
+                prompt_list = parse_prompts(prompts, prompt_template)
+            except ValueError as e:
+                yield self.create_text_message(f"错误：{e}")
+                return
+            if not prompt_list:
+                yield self.create_text_message("错误：prompts参数不能为空")
+                return
+
+            # 从工具参数获取认证信息，工具参数为空时使用提供商凭据
+            provider = self.runtime.credentials or {}
+            token = tool_parameters.get("sider_token") or provider.get("sider_token")
+            cookie = tool_parameters.get("sider_cookie") or provider.get("sider_cookie")
+
+            if not token or not cookie:
+                yield self.create_text_message("错误：缺少Sider认证信息（token和cookie）")
+                return
+
+            # 所有条目共用同一个客户端(或凭据池)及其连接
+            credentials = parse_credentials(token, cookie)
+            if len(credentials) > 1:
+                client = get_pool(credentials)
+            else:
+                client = get_client(token=credentials[0][0], cookie=credentials[0][1])
+
+            options = ChatOptions(
+                output_lang=None if output_lang == "auto" else output_lang,
+                thinking_mode=thinking_mode,
+                text_to_image=False,
+                artifact=True
+            )
+            requests = [ChatRequest(prompt=prompt, model=model, options=options) for prompt in prompt_list]
+            total = len(requests)
+
+            logger.info(f"开始Sider AI批量聊天: model={model}, 条数={total}, 并发数={max_workers}")
+
+            # 按完成顺序报告进度，结果按输入顺序保存
+            results: list = [None] * total
+            succeeded = 0
+            for completed, (index, response) in enumerate(run_batch(client, requests, max_workers), 1):
+                results[index] = {
+                    "index": index,
+                    "prompt": prompt_list[index],
+                    "success": response.success,
+                    "response": response.response,
+                    "error": response.error,
+                    "context_id": response.context_id,
+                    "truncated": response.truncated
+                }
+                if response.success:
+                    succeeded += 1
+                    yield self.create_text_message(f"[{completed}/{total}] 第{index + 1}项完成\n")
+                else:
+                    yield self.create_text_message(f"[{completed}/{total}] 第{index + 1}项失败: {response.error}\n")
+
+            yield self.create_json_message({
+                "model": model,
+                "results": results,
+                "total": total,
+                "succeeded": succeeded,
+                "failed": total - succeeded,
+                "success": succeeded == total
+            })
+
+            logger.info(f"Sider AI批量聊天完成: 成功{succeeded}/{total}")
+
+        except Exception as e:
+            error_msg = f"Sider AI批量聊天工具执行失败: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "model": tool_parameters.get("model", "sider"),
+                "results": [],
+                "success": False,
+                "error": str(e)
+            })
@@ -10,7 +10,12 @@ import json
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from utils.sider_api import SiderAPIClient, ChatRequest, ChatOptions
+from utils.sider_api import get_client, ChatRequest, ChatOptions
+from utils.sider_coalesce import IDLE, ChunkCoalescer, with_idle
+from utils.sider_hedge import HedgeConfig
+from utils.sider_pool import get_pool, parse_credentials
+from utils.sider_cache import ResponseCache, DEFAULT_TTL, cache_key, split_text
+from utils.sider_context import ContextStore, dead_contexts
 
 logger = logging.getLogger(__name__)
 
@@ -31,28 +36,59 @@ class SiderChatTool(Tool):
             # 获取工具参数
             prompt = tool_parameters.get("prompt", "")
             context_id = tool_parameters.get("context_id", "")
+            # 会话键：由插件保存对应的最新context_id，不需要在每一步手动传递
+            conversation_key = tool_parameters.get("conversation_key", "") or ""
             model = tool_parameters.get("model", "sider")
             output_lang = tool_parameters.get("output_lang", "auto")
             thinking_mode = tool_parameters.get("thinking_mode", False)
             streaming = tool_parameters.get("streaming", True)
             data_analysis = tool_parameters.get("data_analysis", True)
             search = tool_parameters.get("search", False)
+            hedge = tool_parameters.get("hedge", False)
+            # map-reduce模式：提示词超过模型的输入上限时分段并发处理后汇总
+            use_map_reduce = tool_parameters.get("map_reduce", False)
+            map_reduce_instruction = tool_parameters.get("map_reduce_instruction", "") or ""
+            # 响应缓存(只对不带context_id的请求生效)
+            use_cache = tool_parameters.get("cache", False)
+            cache_ttl = tool_parameters.get("cache_ttl")
+            cache_ttl = DEFAULT_TTL if cache_ttl is None else float(cache_ttl)
+            # 流式输出合并参数，0表示不合并
+            stream_max_bytes = tool_parameters.get("stream_max_bytes")
+            stream_max_bytes = 512 if stream_max_bytes is None else int(stream_max_bytes)
+            stream_max_delay_ms = tool_parameters.get("stream_max_delay_ms")
+            stream_max_delay_ms = 200 if stream_max_delay_ms is None else float(stream_max_delay_ms)
             
             # 验证必需参数
             if not prompt:
                 yield self.create_text_message("错误：prompt参数不能为空")
                 return
             
-            # 从工具参数获取认证信息
-            token = tool_parameters.get("sider_token")
-            cookie = tool_parameters.get("sider_cookie")
+            # 从工具参数获取认证信息，工具参数为空时使用提供商凭据
+            provider = self.runtime.credentials or {}
+            token = tool_parameters.get("sider_token") or provider.get("sider_token")
+            cookie = tool_parameters.get("sider_cookie") or provider.get("sider_cookie")
             
             if not token or not cookie:
                 yield self.create_text_message("错误：缺少Sider认证信息（token和cookie）")
                 return
             
-            # 创建API客户端
-            client = SiderAPIClient(token=token, cookie=cookie)
+            # 多组凭据(每行一组)时使用凭据池，按剩余额度和并发数分配请求；
+            # 单组凭据直接获取API客户端（相同凭据复用已有客户端及其连接）
+            credentials = parse_credentials(token, cookie)
+            if len(credentials) > 1:
+                client = get_pool(credentials)
+            else:
+                client = get_client(token=credentials[0][0], cookie=credentials[0][1])
+            
+            # 未指定context_id时按会话键查找最新的对话ID；已知失效的对话ID直接开始新对话。
+            # 只有使用会话键时才访问持久化存储，直接传入的对话ID只查进程内的失效记录
+            contexts = ContextStore(self.session.storage) if conversation_key else None
+            if not context_id and contexts is not None:
+                context_id = contexts.resolve(conversation_key)
+            elif context_id and context_id in dead_contexts:
+                logger.info(f"context_id '{context_id}' 已失效，开始新对话")
+                context_id = ""
+            requested_context_id = context_id
             
             # 处理output_lang参数
             processed_output_lang = None if output_lang == "auto" else output_lang
@@ -75,69 +111,105 @@ class SiderChatTool(Tool):
                 options=options
             )
             
+            mapped = False
+            if use_map_reduce:
+                # map-reduce只在打开开关时使用，推迟导入以减少工具的冷启动时间
+                from utils.sider_mapreduce import MapReduceConfig, map_reduce, needs_map_reduce
+                map_reduce_config = MapReduceConfig(instruction=map_reduce_instruction)
+                mapped = needs_map_reduce(chat_request, map_reduce_config)
+            
             logger.info(f"开始Sider AI聊天: model={model}, prompt长度={len(prompt)}, context_id='{context_id}'")
             
-            # 执行聊天并流式返回结果
-            accumulated_response = ""
-            final_context_id = ""
+            # 命中缓存时直接返回缓存的响应，不请求上游(使用会话键的调用属于连续对话，不使用缓存；
+            # map-reduce的结果还取决于任务说明，也不使用缓存)
+            cache = None
+            key = cache_key(chat_request) if use_cache and not conversation_key and not mapped else None
+            if key is not None:
+                cache = ResponseCache(self.session.storage, ttl=cache_ttl)
+                cached = cache.get(key)
+                if cached is not None:
+                    logger.info(f"命中响应缓存: 响应长度={len(cached)}")
+                    yield from self._replay(cached, streaming, stream_max_bytes)
+                    yield self.create_json_message(self._result(
+                        "", model, prompt, cached, False, output_lang, thinking_mode,
+                        streaming, data_analysis, search, host=None, stream_stats=None, cached=True))
+                    return
+            
+            # 执行聊天并流式返回结果，完整响应由客户端的响应缓冲区保存，这里不再重复累积
+            final_response = None
             
             # 获取聊天响应生成器
-            chat_generator = client.chat(chat_request, streaming=streaming)
-            
-            try:
-                # 流式处理响应
-                for chunk in chat_generator:
-                    if chunk:
-                        accumulated_response += chunk
-                        # 根据streaming参数决定是否发送流式文本消息
-                        if streaming:
-                            yield self.create_text_message(chunk)
-                
-                # 获取最终响应对象
-                final_response = next(chat_generator, None)
-                if final_response:
-                    final_context_id = final_response.context_id
-                    
-                    # 如果有错误，报告错误
-                    if not final_response.success:
-                        error_msg = f"Sider API错误: {final_response.error}"
-                        logger.error(error_msg)
-                        yield self.create_text_message(f"\n\n{error_msg}")
-                        return
+            if mapped:
+                chat_generator = map_reduce(client, chat_request, map_reduce_config, streaming=streaming)
+            else:
+                # 使用会话键时新建的对话ID会被保存并继续使用，不能与其他相同的请求合并，
+                # 否则多个会话键会记录同一个对话ID
+                chat_generator = client.chat(chat_request, streaming=streaming,
+                                             hedge=HedgeConfig() if hedge else None,
+                                             single_flight=False if conversation_key else None)
+            # 合并逐token的响应块，减少发送的消息数量；上游停顿时缓存的内容到期后也会发出
+            coalescer = ChunkCoalescer(max_bytes=stream_max_bytes, max_delay_ms=stream_max_delay_ms)
+            if streaming:
+                chat_generator = with_idle(chat_generator, coalescer.remaining)
+            
+            # 流式处理响应，生成器结束时的返回值即最终响应对象
+            while True:
+                try:
+                    chunk = next(chat_generator)
+                except StopIteration as stop:
+                    final_response = stop.value
+                    break
+                if chunk is IDLE:
+                    text = coalescer.expire()
+                    if text:
+                        yield self.create_text_message(text)
+                    continue
+                if not chunk:
+                    continue
+                if streaming:
+                    text = coalescer.push(chunk)
+                    if text:
+                        yield self.create_text_message(text)
                 else:
-                    # 如果没有最终响应对象，从客户端获取context_id
-                    final_context_id = client.get_last_context_id()
-                
-            except StopIteration:
-                # 生成器正常结束
-                final_context_id = client.get_last_context_id()
+                    # 非流式模式下客户端只输出一次完整响应
+                    yield self.create_text_message(chunk)
+            if streaming:
+                text = coalescer.flush()
+                if text:
+                    yield self.create_text_message(text)
+            
+            # 如果有错误，报告错误
+            if not final_response.success:
+                error_msg = f"Sider API错误: {final_response.error}"
+                logger.error(error_msg)
+                yield self.create_text_message(f"\n\n{error_msg}")
+                return
+            final_context_id = final_response.context_id
+            response = final_response.response
             
-            # 如果没有启用流式输出，在这里一次性输出完整响应
-            if not streaming and accumulated_response:
-                yield self.create_text_message(accumulated_response)
+            # 请求的对话ID在本次请求中失效(605)时保存到存储，其他进程也不再使用；记录会话键的最新对话ID
+            if contexts is not None:
+                if requested_context_id and requested_context_id in dead_contexts:
+                    contexts.mark_dead(requested_context_id)
+                contexts.record(conversation_key, final_context_id)
             
             # 发送完成提示
             yield self.create_text_message(f"\n\n")
             
             # 构建结果数据 - 使用标准的JSON格式输出
-            result_data = {
-                "context_id": final_context_id,
-                "model": model,
-                "response": accumulated_response,
-                "success": True,
-                "prompt_length": len(prompt),
-                "response_length": len(accumulated_response),
-                "output_lang": output_lang,
-                "thinking_mode": thinking_mode,
-                "streaming": streaming,
-                "data_analysis": data_analysis,
-                "search": search
-            }
+            result_data = self._result(
+                final_context_id, model, prompt, response, final_response.truncated, output_lang,
+                thinking_mode, streaming, data_analysis, search, host=final_response.host,
+                stream_stats=coalescer.stats.to_dict() if streaming else None, cached=False,
+                map_reduce=mapped, metrics=final_response.metrics)
+            
+            if cache is not None and not final_response.truncated and response:
+                cache.put(key, response)
             
             # 发送JSON结果消息 - 这是标准的Dify输出方式
             yield self.create_json_message(result_data)
             
-            logger.info(f"Sider AI聊天完成: 响应长度={len(accumulated_response)}, 新context_id='{final_context_id}'")
+            logger.info(f"Sider AI聊天完成: 响应长度={len(response)}, 新context_id='{final_context_id}'")
             
         except Exception as e:
             error_msg = f"Sider AI聊天工具执行失败: {str(e)}"
@@ -157,3 +229,49 @@ class SiderChatTool(Tool):
                 "response_length": 0
             }
             yield self.create_json_message(error_data)
+    
+    def _replay(self, text: str, streaming: bool, chunk_size: int) -> Generator[ToolInvokeMessage]:
+        """
+        发送缓存的响应，流式模式下按合并后的消息大小分块发送
+        
+        Args:
+            text: 缓存的响应文本
+            streaming: 是否启用流式输出
+            chunk_size: 每块的大约字符数
+            
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        for chunk in split_text(text, chunk_size) if streaming else [text]:
+            yield self.create_text_message(chunk)
+        yield self.create_text_message("\n\n")
+    
+    def _result(self, context_id: str, model: str, prompt: str, response: str, truncated: bool,
+                output_lang: str, thinking_mode: bool, streaming: bool, data_analysis: bool,
+                search: bool, host, stream_stats, cached: bool, map_reduce: bool = False,
+                metrics=None) -> dict:
+        """
+        构建结果数据
+        
+        Returns:
+            dict: JSON结果
+        """
+        return {
+            "context_id": context_id,
+            "model": model,
+            "response": response,
+            "success": True,
+            "prompt_length": len(prompt),
+            "response_length": len(response),
+            "truncated": truncated,
+            "output_lang": output_lang,
+            "thinking_mode": thinking_mode,
+            "streaming": streaming,
+            "data_analysis": data_analysis,
+            "search": search,
+            "host": host,
+            "cached": cached,
+            "map_reduce": map_reduce,
+            "stream_stats": stream_stats,
+            "metrics": metrics
+        }
@@ -0,0 +1,111 @@
+"""
+Sider AI 深度搜索工具实现
+回答片段作为文本流式返回，搜索进度作为结构化的日志消息按状态去重、限速后返回
+"""
+from collections.abc import Generator
+from typing import Any
+import logging
+import re
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.sider_coalesce import IDLE, ChunkCoalescer, StatusThrottle, with_idle
+from utils.sider_events import TextDelta
+from utils.sider_pool import client_for
+
+logger = logging.getLogger(__name__)
+
+class SiderDeepSearchTool(Tool):
+    """Sider AI深度搜索工具"""
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        执行深度搜索工具调用
+
+        Args:
+            tool_parameters: 工具参数字典
+
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        query = tool_parameters.get("query", "") or ""
+        model = tool_parameters.get("model", "sider")
+        # 限定搜索的网站域名，逗号、空白或换行分隔
+        focus = [domain for domain in re.split(r"[\s,，]+", tool_parameters.get("focus", "") or "") if domain]
+        answer = []
+        try:
+            status_interval = tool_parameters.get("status_interval")
+            status_interval = 1.0 if status_interval is None else float(status_interval)
+
+            # 验证必需参数
+            if not query.strip():
+                yield self.create_text_message("错误：query参数不能为空")
+                return
+
+            # 工具参数为空时使用提供商凭据
+            provider = self.runtime.credentials or {}
+            token = tool_parameters.get("sider_token") or provider.get("sider_token")
+            cookie = tool_parameters.get("sider_cookie") or provider.get("sider_cookie")
+            if not token or not cookie:
+                yield self.create_text_message("错误：缺少Sider认证信息（token和cookie）")
+                return
+
+            # 多组凭据(每行一组)时从凭据池中选择余量最多的凭据
+            client = client_for(token, cookie, model)
+            logger.info(f"开始Sider AI深度搜索: model={model}, 问题长度={len(query)}, focus={focus}")
+
+            coalescer = ChunkCoalescer()
+            throttle = StatusThrottle(min_interval=status_interval)
+            statuses = []
+            events = with_idle(client.deep_search(query, model=model, focus=focus or None), coalescer.remaining)
+            for event in events:
+                if event is IDLE:
+                    text = coalescer.expire()
+                    if text:
+                        yield self.create_text_message(text)
+                    continue
+                if type(event) is TextDelta:
+                    answer.append(event.text)
+                    text = coalescer.push(event.text)
+                    if text:
+                        yield self.create_text_message(text)
+                    continue
+                if not statuses or statuses[-1] != event.status:
+                    statuses.append(event.status)
+                progress = throttle.push(event)
+                if progress is not None:
+                    yield self.create_log_message(f"深度搜索: {progress['status']}", progress)
+            text = coalescer.flush()
+            if text:
+                yield self.create_text_message(text)
+            progress = throttle.flush()
+            if progress is not None:
+                yield self.create_log_message(f"深度搜索: {progress['status']}", progress)
+
+            result = "".join(answer)
+            yield self.create_json_message({
+                "answer": result,
+                "query": query,
+                "model": model,
+                "focus": focus,
+                "statuses": statuses,
+                "status_events": throttle.events_in,
+                "progress_messages": throttle.messages_out,
+                "success": True
+            })
+            logger.info(f"Sider AI深度搜索完成: 回答长度={len(result)}, 进度事件={throttle.events_in}, "
+                        f"发送={throttle.messages_out}")
+
+        except Exception as e:
+            error_msg = f"Sider AI深度搜索工具执行失败: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            yield self.create_text_message(f"\n\n{error_msg}")
+            yield self.create_json_message({
+                "answer": "".join(answer),
+                "query": query,
+                "model": model,
+                "focus": focus,
+                "success": False,
+                "error": str(e)
+            })
@@ -0,0 +1,163 @@
+"""
+Sider AI OCR工具实现
+并发上传多张图片，每张图片上传后立即识别，识别结果边收到边按图片标记流式返回
+"""
+from collections import deque
+from collections.abc import Generator
+from typing import Any
+import logging
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.sider_batch import DEFAULT_WORKERS, STREAM_END, map_streams
+from utils.sider_coalesce import IDLE, ChunkCoalescer, with_idle
+from utils.sider_deadline import REQUEST_TIMEOUT
+from utils.sider_pool import client_for
+from utils.sider_session import get_http_session
+
+logger = logging.getLogger(__name__)
+
+class SiderOCRTool(Tool):
+    """Sider AI OCR工具"""
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        执行OCR工具调用
+
+        Args:
+            tool_parameters: 工具参数字典
+
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        model = tool_parameters.get("model", "gemini-2.0-flash")
+        try:
+            files = tool_parameters.get("images") or []
+            if not isinstance(files, list):
+                files = [files]
+            max_workers = tool_parameters.get("max_workers")
+            max_workers = DEFAULT_WORKERS if max_workers is None else int(max_workers)
+
+            # 验证必需参数
+            if not files:
+                yield self.create_text_message("错误：images参数不能为空")
+                return
+
+            # 工具参数为空时使用提供商凭据
+            provider = self.runtime.credentials or {}
+            token = tool_parameters.get("sider_token") or provider.get("sider_token")
+            cookie = tool_parameters.get("sider_cookie") or provider.get("sider_cookie")
+            if not token or not cookie:
+                yield self.create_text_message("错误：缺少Sider认证信息（token和cookie）")
+                return
+
+            # 多组凭据(每行一组)时从凭据池中选择余量最多的凭据
+            client = client_for(token, cookie, model)
+            total = len(files)
+            names = [file.filename or f"image-{index + 1}" for index, file in enumerate(files)]
+            logger.info(f"开始Sider AI OCR: model={model}, 图片数={total}, 并发数={max_workers}")
+
+            def recognize(index: int):
+                file = files[index]
+                return client.ocr_stream(self._image_source(file), name=names[index],
+                                         content_type=file.mime_type, model=model)
+
+            # 每张图片在工作线程中依次上传、识别。同一时间只有一张图片的结果边收到边输出，
+            # 其余图片的结果先缓存，当前图片结束后按开始输出(或结束)的先后顺序接着输出
+            results: list = [None] * total
+            parts = [[] for _ in range(total)]  # 每张图片已收到的文本块
+            sent = [0] * total                  # 每张图片已输出的文本块数
+            outcomes = {}                       # 已结束的图片 -> None(成功)或异常
+            waiting = deque()                   # 有输出或已结束、还没轮到输出的图片
+            current = None
+            coalescer = ChunkCoalescer()
+            succeeded = 0
+            for entry in with_idle(map_streams(recognize, range(total), max_workers), coalescer.remaining):
+                if entry is IDLE:
+                    text = coalescer.expire()
+                    if text:
+                        yield self.create_text_message(text)
+                    continue
+                index, item = entry
+                if item is STREAM_END:
+                    outcomes[index] = None
+                elif isinstance(item, Exception):
+                    outcomes[index] = item
+                else:
+                    parts[index].append(item)
+                if index != current and index not in waiting:
+                    waiting.append(index)
+                while True:
+                    if current is None:
+                        if not waiting:
+                            break
+                        current = waiting.popleft()
+                        yield self.create_text_message(f"## [{current + 1}/{total}] {names[current]}\n\n")
+                    for chunk in parts[current][sent[current]:]:
+                        text = coalescer.push(chunk)
+                        if text:
+                            yield self.create_text_message(text)
+                    sent[current] = len(parts[current])
+                    if current not in outcomes:
+                        break
+                    text = coalescer.flush()
+                    if text:
+                        yield self.create_text_message(text)
+                    error = outcomes[current]
+                    if error is None:
+                        succeeded += 1
+                        results[current] = {"index": current, "filename": names[current], "success": True,
+                                            "text": "".join(parts[current]), "error": None}
+                        yield self.create_text_message("\n\n")
+                    else:
+                        logger.error(f"图片 {names[current]} 识别失败: {error}")
+                        results[current] = {"index": current, "filename": names[current], "success": False,
+                                            "text": "", "error": str(error)}
+                        prefix = "\n\n" if parts[current] else ""
+                        yield self.create_text_message(f"{prefix}识别失败: {error}\n\n")
+                    current = None
+
+            yield self.create_json_message({
+                "model": model,
+                "results": results,
+                "text": "\n\n".join(result["text"] for result in results if result["success"]),
+                "total": total,
+                "succeeded": succeeded,
+                "failed": total - succeeded,
+                "success": succeeded == total
+            })
+            logger.info(f"Sider AI OCR完成: 成功{succeeded}/{total}")
+
+        except Exception as e:
+            error_msg = f"Sider AI OCR工具执行失败: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "model": model,
+                "results": [],
+                "success": False,
+                "error": str(e)
+            })
+
+    def _image_source(self, file):
+        """
+        构建图片的上传来源：每次上传(包括重试)重新下载文件，长度已知时边下载边上传，不在内存中保存整张图片
+
+        Args:
+            file: Dify文件对象
+
+        Returns:
+            返回(文件对象, 长度)或bytes的函数
+        """
+        def open_image():
+            if not file.url.startswith(("http://", "https://")):
+                return file.blob  # 交给SDK处理FILES_URL配置错误等情况
+            response = get_http_session(file.url).get(file.url, stream=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length is None or response.headers.get("Content-Encoding"):
+                return response.content
+            return response.raw, int(length)
+
+        return open_image
@@ -0,0 +1,93 @@
+"""
+Sider AI 翻译工具实现
+把长文档按段落和句子切分后并发翻译，按原文顺序流式输出已完成的部分
+"""
+from collections.abc import Generator
+from typing import Any
+import logging
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.sider_batch import DEFAULT_WORKERS, map_ordered
+from utils.sider_pool import client_for
+from utils.sider_text import DEFAULT_SEGMENT_CHARS, split_segments, split_whitespace
+
+logger = logging.getLogger(__name__)
+
+class SiderTranslateTool(Tool):
+    """Sider AI翻译工具"""
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        执行翻译工具调用
+
+        Args:
+            tool_parameters: 工具参数字典
+
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        content = tool_parameters.get("content", "") or ""
+        target_lang = tool_parameters.get("target_lang") or "English"
+        model = tool_parameters.get("model", "sider")
+        translated = []
+        try:
+            segment_chars = tool_parameters.get("segment_chars")
+            segment_chars = DEFAULT_SEGMENT_CHARS if segment_chars is None else int(segment_chars)
+            max_workers = tool_parameters.get("max_workers")
+            max_workers = DEFAULT_WORKERS if max_workers is None else int(max_workers)
+
+            # 验证必需参数
+            if not content.strip():
+                yield self.create_text_message("错误：content参数不能为空")
+                return
+
+            # 工具参数为空时使用提供商凭据
+            provider = self.runtime.credentials or {}
+            token = tool_parameters.get("sider_token") or provider.get("sider_token")
+            cookie = tool_parameters.get("sider_cookie") or provider.get("sider_cookie")
+            if not token or not cookie:
+                yield self.create_text_message("错误：缺少Sider认证信息（token和cookie）")
+                return
+
+            # 多组凭据(每行一组)时从凭据池中选择余量最多的凭据
+            client = client_for(token, cookie, model)
+            segments = split_segments(content, max(1, segment_chars))
+            logger.info(f"开始Sider AI翻译: model={model}, 原文长度={len(content)}, 片段数={len(segments)}")
+
+            def translate_segment(segment: str) -> str:
+                # 只翻译片段的内容，保留首尾的空白(段落分隔)
+                leading, body, trailing = split_whitespace(segment)
+                if not body:
+                    return segment
+                return leading + client.translate(body, target_lang=target_lang, model=model).strip() + trailing
+
+            # 片段并发翻译，前面的片段都完成后立即输出，译文按原文顺序流式返回
+            for text in map_ordered(translate_segment, segments, max_workers):
+                translated.append(text)
+                if text:
+                    yield self.create_text_message(text)
+
+            translation = "".join(translated)
+            yield self.create_json_message({
+                "translation": translation,
+                "target_lang": target_lang,
+                "model": model,
+                "segments": len(segments),
+                "success": True
+            })
+            logger.info(f"Sider AI翻译完成: 译文长度={len(translation)}")
+
+        except Exception as e:
+            error_msg = f"Sider AI翻译工具执行失败: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            yield self.create_text_message(f"\n\n{error_msg}")
+            # 已经完成的前面部分仍然返回
+            yield self.create_json_message({
+                "translation": "".join(translated),
+                "target_lang": target_lang,
+                "model": model,
+                "success": False,
+                "error": str(e)
+            })
@@ -2,15 +2,84 @@
 Sider AI API核心逻辑
 复用现有项目的API调用、错误处理和重试机制
 """
+import hashlib
+import json
 import logging
-from typing import Generator, Optional, Dict, Any
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable, Generator, Optional, Dict, Any, List, Set
+from dataclasses import dataclass, asdict
 
 # 导入内部的Session实现
-from .sider_session import Session
+from .sider_session import ADVANCED_MODELS, Session, known
+from .sider_events import TextDelta, ServerMessage, DeepSearchStatus, CODE_INVALID_CONVERSATION
+from .sider_deadline import Deadline, ensure_deadline
+from .sider_retry import RetryPolicy
+from .sider_hedge import HedgeConfig
+from .sider_flight import Flight
+from .sider_context import dead_contexts
+from .sider_metrics import RequestMetrics, emit as emit_metrics
 
 logger = logging.getLogger(__name__)
 
+# 单次响应最多缓存的字符数，None表示不限制
+MAX_RESPONSE_CHARS: Optional[int] = None
+
+# 客户端缓存配置：按凭据复用SiderAPIClient，每个客户端仅占用几KB，32个远低于插件内存限制
+CLIENT_CACHE_SIZE = 32
+CLIENT_IDLE_TTL = 600.0  # 秒，超过该时间未使用的客户端被淘汰
+
+# 凭据验证结果的缓存时间(秒)
+VALIDATION_TTL = 600.0
+INVALID_TTL = 60.0
+VALIDATION_CACHE_SIZE = CLIENT_CACHE_SIZE * 8  # 缓存的验证结果数量上限
+
+class ErrorAction(Enum):
+    """服务端错误消息的处理方式"""
+    RETRY = "retry"              # 原样重试
+    NEW_SESSION = "new_session"  # 放弃当前对话上下文，用新会话重试
+    FALLBACK = "fallback"        # 换用ChatRequest.fallback_model重试
+    FAIL = "fail"                # 直接失败
+
+# 按code查表确定处理方式，只根据流中结构化的code/msg字段判断，不检查回答文本
+ERROR_ACTIONS: Dict[int, ErrorAction] = {
+    CODE_INVALID_CONVERSATION: ErrorAction.NEW_SESSION,  # 对话ID无效或已过期
+    429: ErrorAction.RETRY,                               # 请求过于频繁
+    401: ErrorAction.FAIL,                                # 凭据无效
+    403: ErrorAction.FAIL,
+}
+
+# code不在表中时按msg关键字归类(额度耗尽、限流没有固定的code)，小写匹配
+MESSAGE_ACTIONS = (
+    ("invalid conversation id", ErrorAction.NEW_SESSION),
+    ("rate limit", ErrorAction.RETRY),
+    ("too many requests", ErrorAction.RETRY),
+    ("quota", ErrorAction.FALLBACK),
+    ("credit", ErrorAction.FALLBACK),
+    ("usage limit", ErrorAction.FALLBACK),
+)
+
+def classify_error(message: ServerMessage) -> ErrorAction:
+    """
+    确定服务端错误消息的处理方式
+    
+    Args:
+        message: 服务端消息
+        
+    Returns:
+        ErrorAction: 处理方式，未知错误为FAIL
+    """
+    action = ERROR_ACTIONS.get(message.code)
+    if action is not None:
+        return action
+    msg = message.msg.lower()
+    for keyword, action in MESSAGE_ACTIONS:
+        if keyword in msg:
+            return action
+    return ErrorAction.FAIL
+
 @dataclass
 class ChatOptions:
     """聊天选项配置"""
@@ -28,6 +97,7 @@ class ChatRequest:
     model: str = "gpt-4o-mini"
     context_id: str = ""
     options: ChatOptions = None
+    fallback_model: Optional[str] = None  # 额度耗尽时改用的模型，为空则不降级
     
     def __post_init__(self):
         if self.options is None:
@@ -41,20 +111,127 @@ class ChatResponse:
     model: str
     success: bool = True
     error: Optional[str] = None
+    truncated: bool = False  # 响应超过缓冲区上限，response只包含前面的部分
+    host: Optional[str] = None  # 实际返回响应的主机(对冲请求时为最先响应的主机)
+    metrics: Optional[Dict[str, Any]] = None  # 请求指标(耗时、接收的字节数、重试次数等)，见RequestMetrics.to_dict
+
+def request_key(request: ChatRequest) -> Optional[str]:
+    """
+    计算请求内容的哈希(模型、提示词和聊天选项)，用于识别相同的请求；带对话上下文的请求返回None
+    
+    Args:
+        request: 聊天请求对象
+        
+    Returns:
+        Optional[str]: 请求哈希
+    """
+    if request.context_id:
+        return None
+    material = json.dumps([request.model, request.prompt, asdict(request.options)],
+                          ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def flight_key(request: ChatRequest, streaming: bool, deadline: Optional[Deadline],
+               hedge: Optional[HedgeConfig]) -> Optional[str]:
+    """
+    计算相同请求合并(single-flight)使用的键：请求内容相同，且输出方式、时间预算和对冲配置也相同的调用才合并
+    
+    Args:
+        request: 聊天请求对象
+        streaming: 是否流式输出
+        deadline: 时间预算
+        hedge: 对冲请求配置
+        
+    Returns:
+        Optional[str]: 合并键，带对话上下文的请求返回None
+    """
+    key = request_key(request)
+    if key is None:
+        return None
+    budget = None if deadline is None else [deadline.total, deadline.connect, deadline.first_byte, deadline.idle]
+    settings = json.dumps([streaming, budget, None if hedge is None else asdict(hedge)],
+                          sort_keys=True, default=list)
+    return key + ":" + hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+class ResponseBuffer:
+    """
+    追加式响应缓冲区
+    
+    由客户端持有，响应块只保存这一份；getvalue只在需要时拼接一次(O(n))，
+    拼接结果替换原来的分块，之后ChatResponse.response与缓冲区共用同一个字符串
+    """
+    
+    __slots__ = ("_parts", "_length", "max_chars", "truncated")
+    
+    def __init__(self, max_chars: Optional[int] = None):
+        """
+        初始化缓冲区
+        
+        Args:
+            max_chars: 最多保存的字符数，超过的部分丢弃并标记truncated，None表示不限制
+        """
+        self._parts = []
+        self._length = 0
+        self.max_chars = max_chars
+        self.truncated = False
+    
+    def append(self, text: str) -> None:
+        """
+        追加一个响应块
+        
+        Args:
+            text: 响应文本块
+        """
+        if self.max_chars is not None and self._length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self._length]
+            self.truncated = True
+            if not text:
+                return
+        self._parts.append(text)
+        self._length += len(text)
+    
+    def clear(self) -> None:
+        """清空缓冲区(重试前调用)"""
+        self._parts = []
+        self._length = 0
+        self.truncated = False
+    
+    def getvalue(self) -> str:
+        """
+        获取完整响应
+        
+        Returns:
+            str: 缓冲区中的全部文本
+        """
+        parts = self._parts
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+    
+    def __len__(self) -> int:
+        return self._length
 
 class SiderAPIClient:
     """Sider AI API客户端"""
     
-    def __init__(self, token: str, cookie: str):
+    def __init__(self, token: str, cookie: str, retry_policy: Optional[RetryPolicy] = None,
+                 single_flight: bool = False):
         """
         初始化API客户端
         
         Args:
             token: Sider认证令牌
             cookie: Sider认证Cookie
+            retry_policy: 请求失败时的重试策略，为空时使用默认策略
+            single_flight: 是否合并同时进行的相同请求(不带context_id)，默认不合并
         """
         self.token = token
         self.cookie = cookie
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.single_flight = single_flight
+        self._flights: Dict[str, Flight] = {}  # 请求哈希 -> 正在进行的上游请求
+        self._flights_lock = threading.Lock()
+        self._base_session: Optional[Session] = None
         self._last_session: Optional[Session] = None
     
     def _create_session(self, context_id: str = "") -> Session:
@@ -68,45 +245,184 @@ class SiderAPIClient:
             Session: 会话实例
         """
         try:
-            session = Session(
-                token=self.token,
-                cookie=self.cookie,
-                context_id=context_id,
-                update_info_at_init=False
-            )
+            if self._base_session is None:
+                # 只在首次使用时解析cookie并构建请求头，之后的会话都从它派生
+                self._base_session = Session(
+                    token=self.token,
+                    cookie=self.cookie,
+                    update_info_at_init=False
+                )
+            session = self._base_session.fork(context_id)
             logger.debug(f"创建会话: context_id='{context_id}'")
             return session
         except Exception as e:
             logger.error(f"创建会话失败: {e}")
             raise
     
-    def _is_error_message(self, chunk: str) -> bool:
+    def _remember_quota(self, session: Session) -> None:
+        """
+        将会话中解析到的额度信息保存到客户端，供之后派生的会话使用
+        
+        Args:
+            session: 已完成请求的会话实例
+        """
+        base = self._base_session
+        if base is None or session is base:
+            return
+        base.total = known(session.total, base.total)
+        base.remain = known(session.remain, base.remain)
+        base.advanced_total = known(session.advanced_total, base.advanced_total)
+        base.advanced_remain = known(session.advanced_remain, base.advanced_remain)
+    
+    def _quota(self, session: Session, model: str) -> tuple:
+        """
+        获取模型对应的额度信息(高级模型使用单独的额度)
+        
+        Args:
+            session: 已完成请求的会话实例
+            model: 模型名称
+            
+        Returns:
+            tuple: (剩余次数, 总次数, 是否高级模型额度)
+        """
+        if model in ADVANCED_MODELS:
+            return session.advanced_remain, session.advanced_total, True
+        return session.remain, session.total, False
+    
+    def _recover(self, message: ServerMessage, request: ChatRequest, api_params: Dict[str, Any],
+                 used_actions: Set[ErrorAction], has_output: bool) -> ErrorAction:
+        """
+        根据错误消息决定如何重试，需要换模型时直接修改api_params
+        
+        每种处理方式最多使用一次；流式模式下已经输出内容后不再重试，避免重复输出
+        
+        Args:
+            message: 服务端错误消息
+            request: 聊天请求对象
+            api_params: 本次调用的参数
+            used_actions: 已经使用过的处理方式
+            has_output: 是否已经向调用方输出了内容
+            
+        Returns:
+            ErrorAction: 需要执行的处理方式(RETRY/NEW_SESSION/FALLBACK)
+            
+        Raises:
+            Exception: 错误无法恢复
+        """
+        action = classify_error(message)
+        logger.warning(f"检测到错误消息: {message}，处理方式: {action.value}")
+        if action is ErrorAction.FALLBACK and (not request.fallback_model
+                                               or api_params['model'] == request.fallback_model):
+            action = ErrorAction.FAIL
+        if has_output or action in used_actions:
+            if used_actions:
+                logger.error(f"重试后仍然出现错误: {message}")
+            action = ErrorAction.FAIL
+        if action is ErrorAction.FAIL:
+            raise Exception(f"Sider API错误: {message}")
+        
+        used_actions.add(action)
+        if action is ErrorAction.FALLBACK:
+            logger.info(f"额度不足，改用模型 {request.fallback_model} 重试...")
+            api_params['model'] = request.fallback_model
+        elif action is ErrorAction.NEW_SESSION:
+            logger.info("检测到无效对话ID，创建新会话并重试...")
+        else:
+            logger.info("重新调用Sider API...")
+        return action
+    
+    def _initial_context(self, context_id: Optional[str]) -> str:
+        """
+        确定请求使用的对话上下文，已知失效的对话ID直接改用新会话，不再先请求一次收到605
+        
+        Args:
+            context_id: 请求的对话上下文ID
+            
+        Returns:
+            str: 会话使用的对话上下文ID
+        """
+        if context_id and context_id in dead_contexts:
+            logger.info(f"对话ID '{context_id}' 已知失效，直接创建新会话")
+            return ""
+        return context_id or ""
+    
+    def _retry_delay(self, err: Exception, attempt: int, deadline: Deadline,
+                     has_output: bool) -> Optional[float]:
+        """
+        请求失败(HTTP错误、连接中断、超时等)时，根据重试策略决定是否重试
+        
+        Args:
+            err: 请求失败的异常
+            attempt: 已经重试的次数
+            deadline: 时间预算
+            has_output: 是否已经向调用方输出了内容，已输出时不重试
+            
+        Returns:
+            Optional[float]: 重试前的等待时间(秒)，不重试时返回None
+        """
+        if has_output:
+            return None
+        delay = self.retry_policy.next_delay(err, attempt, deadline)
+        if delay is not None:
+            logger.warning(f"请求失败({type(err).__name__}): {err}，{delay:.2f}秒后第{attempt + 1}次重试")
+        return delay
+    
+    def _message_delay(self, message: ServerMessage, attempt: int, deadline: Deadline) -> Optional[float]:
+        """
+        非对话类请求收到服务端错误消息时，决定是否重试；只重试限流，且不超过重试次数和时间预算
+        
+        Args:
+            message: 服务端错误消息
+            attempt: 已经重试的次数
+            deadline: 时间预算
+            
+        Returns:
+            Optional[float]: 重试前的等待时间(秒)，不重试时返回None
+        """
+        if (classify_error(message) is not ErrorAction.RETRY
+                or attempt + 1 >= self.retry_policy.max_attempts):
+            return None
+        return self.retry_policy.backoff_within(attempt, deadline)
+    
+    def _api_params(self, request: ChatRequest, streaming: bool) -> Dict[str, Any]:
         """
-        检查响应块是否为错误消息
+        构建Session.chat的调用参数
         
         Args:
-            chunk: 响应文本块
+            request: 聊天请求对象
+            streaming: 是否启用流式输出
             
         Returns:
-            bool: 是否为错误消息
+            Dict[str, Any]: 调用参数
         """
-        error_patterns = [
-            "<Message:",
-            "Code:",
-            "invalid conversation id",
-            "Error:",
-            "Failed to",
-            "Unable to"
-        ]
-        return any(pattern in chunk for pattern in error_patterns)
+        return {
+            'prompt': request.prompt,
+            'model': request.model,
+            'stream': streaming,  # 根据参数决定是否使用流式输出
+            'output_lang': request.options.output_lang,
+            'thinking_mode': request.options.thinking_mode,
+            'data_analysis': request.options.data_analysis,
+            'search': request.options.search,
+            'text_to_image': request.options.text_to_image,
+            'artifact': request.options.artifact
+        }
     
-    def chat(self, request: ChatRequest, streaming: bool = True) -> Generator[str, None, ChatResponse]:
+    def chat(self, request: ChatRequest, streaming: bool = True,
+             buffer: Optional[ResponseBuffer] = None,
+             deadline: Optional[Deadline] = None,
+             hedge: Optional[HedgeConfig] = None,
+             single_flight: Optional[bool] = None) -> Generator[str, None, ChatResponse]:
         """
         执行聊天请求
         
         Args:
             request: 聊天请求对象
             streaming: 是否启用流式输出
+            buffer: 保存完整响应的缓冲区，为空时创建新的缓冲区
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            hedge: 对冲请求配置，为空时不发送对冲请求
+            single_flight: 是否与同时进行的相同请求合并，为空时使用客户端的设置；
+                调用方要继续使用响应中新建的对话时应传False
             
         Yields:
             str: 响应文本块
@@ -114,121 +430,351 @@ class SiderAPIClient:
         Returns:
             ChatResponse: 最终响应对象
         """
+        if single_flight is None:
+            single_flight = self.single_flight
+        key = flight_key(request, streaming, deadline, hedge) if single_flight else None
+        if key is None:
+            return (yield from self._chat_upstream(request, streaming, buffer, deadline, hedge))
+        
+        # 相同的请求正在进行时订阅它的响应，否则发起新的上游请求并由后台线程广播
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None or not flight.join()
+            if leader:
+                flight = self._flights[key] = Flight(MAX_RESPONSE_CHARS)
+                flight.join()
+                threading.Thread(target=self._pump, args=(key, flight, request, streaming, deadline, hedge),
+                                 name="sider-flight", daemon=True).start()
+            else:
+                logger.info(f"合并相同的请求: 当前{flight.subscribers}个调用共用一次上游请求")
+        return (yield from flight.subscribe(streaming, buffer, leader))
+    
+    def _pump(self, key: str, flight: Flight, request: ChatRequest, streaming: bool,
+              deadline: Optional[Deadline], hedge: Optional[HedgeConfig]) -> None:
+        """
+        在后台线程中执行上游请求，flight作为响应缓冲区，响应块写入时即广播给所有订阅者；
+        订阅者全部离开时停止
+        
+        Args:
+            key: 请求哈希
+            flight: 正在进行的请求
+            request: 聊天请求对象
+            streaming: 是否流式请求，与所有订阅者相同(是合并键的一部分)
+            deadline: 时间预算
+            hedge: 对冲请求配置
+        """
+        generator = self._chat_upstream(request, streaming, flight, deadline, hedge)
+        result = None
+        try:
+            while not flight.cancelled:
+                try:
+                    next(generator)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+        finally:
+            generator.close()
+            with self._flights_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            if result is None:
+                result = ChatResponse(response="", context_id="", model=request.model,
+                                      success=False, error="请求已取消")
+            flight.finish(result)
+    
+    def _chat_upstream(self, request: ChatRequest, streaming: bool, buffer: Optional[ResponseBuffer],
+                       deadline: Optional[Deadline],
+                       hedge: Optional[HedgeConfig]) -> Generator[str, None, ChatResponse]:
+        """向上游发送聊天请求，参数和返回值与chat相同"""
         # 创建会话实例
-        session = self._create_session(request.context_id or "")
+        session = self._create_session(self._initial_context(request.context_id))
         self._last_session = session
+        if buffer is None:
+            buffer = ResponseBuffer(MAX_RESPONSE_CHARS)
+        deadline = ensure_deadline(deadline)
+        metrics = RequestMetrics(request.model)
         
         try:
             # 构建API调用参数
-            api_params = {
-                'prompt': request.prompt,
-                'model': request.model,
-                'stream': streaming,  # 根据参数决定是否使用流式输出
-                'output_lang': request.options.output_lang,
-                'thinking_mode': request.options.thinking_mode,
-                'data_analysis': request.options.data_analysis,
-                'search': request.options.search,
-                'text_to_image': request.options.text_to_image,
-                'artifact': request.options.artifact
-            }
+            api_params = self._api_params(request, streaming)
             
             logger.info(f"调用Sider API: model={request.model}, prompt长度={len(request.prompt)}, context_id='{session.context_id}', streaming={streaming}")
             
             # 调用API并生成响应
-            response_chunks = []
             error_detected = False
             
-            # 如果是非流式模式，先收集所有响应
-            if not streaming:
-                for chunk in session.chat(**api_params):
-                    # 检查是否为错误消息
-                    if self._is_error_message(chunk):
-                        logger.warning(f"检测到错误消息: {chunk}")
-                        error_detected = True
-                        
-                        # 如果是对话ID错误，创建新会话并重试
-                        if "invalid conversation id" in chunk or "Code: 605" in chunk:
-                            logger.info("检测到无效对话ID，创建新会话并重试...")
-                            # 创建新的会话实例，开始新对话
-                            session = self._create_session("")
-                            self._last_session = session
-                            
-                            # 重新调用API
-                            logger.info("重新调用Sider API...")
-                            response_chunks = []  # 清空之前的响应
-                            for retry_chunk in session.chat(**api_params):
-                                if not self._is_error_message(retry_chunk):
-                                    response_chunks.append(retry_chunk)
-                                else:
-                                    logger.error(f"重试后仍然出现错误: {retry_chunk}")
-                                    raise Exception(f"Sider API错误: {retry_chunk}")
+            used_actions: Set[ErrorAction] = set()
+            attempt = 0
+            while True:
+                message = None
+                try:
+                    # 流式模式逐块yield响应；非流式模式一次请求，收集完整响应后一次性yield
+                    for event in session.chat(typed=True, deadline=deadline, hedge=hedge, metrics=metrics,
+                                              **api_params):
+                        event_type = type(event)
+                        if event_type is TextDelta:
+                            metrics.text()
+                            buffer.append(event.text)
+                            if streaming:
+                                yield event.text
+                        elif event_type is ServerMessage:
+                            message = event
                             break
-                        else:
-                            # 其他错误直接抛出异常
-                            raise Exception(f"Sider API错误: {chunk}")
-                    else:
-                        # 正常的响应内容
-                        response_chunks.append(chunk)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline,
+                                              has_output=streaming and len(buffer) > 0)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    metrics.retry()
+                    time.sleep(delay)
+                    buffer.clear()
+                    deadline.restart()
+                    continue
+                if message is None:
+                    break
                 
-                # 非流式模式：一次性yield完整响应
-                if response_chunks:
-                    full_response = "".join(response_chunks)
-                    yield full_response
-            else:
-                # 流式模式：逐块yield响应
-                for chunk in session.chat(**api_params):
-                    # 检查是否为错误消息
-                    if self._is_error_message(chunk):
-                        logger.warning(f"检测到错误消息: {chunk}")
-                        error_detected = True
-                        
-                        # 如果是对话ID错误，创建新会话并重试
-                        if "invalid conversation id" in chunk or "Code: 605" in chunk:
-                            logger.info("检测到无效对话ID，创建新会话并重试...")
-                            # 创建新的会话实例，开始新对话
-                            session = self._create_session("")
-                            self._last_session = session
-                            
-                            # 重新调用API
-                            logger.info("重新调用Sider API...")
-                            for retry_chunk in session.chat(**api_params):
-                                if not self._is_error_message(retry_chunk):
-                                    response_chunks.append(retry_chunk)
-                                    yield retry_chunk
-                                else:
-                                    logger.error(f"重试后仍然出现错误: {retry_chunk}")
-                                    raise Exception(f"Sider API错误: {retry_chunk}")
-                            break
-                        else:
-                            # 其他错误直接抛出异常
-                            raise Exception(f"Sider API错误: {chunk}")
-                    else:
-                        # 正常的响应内容
-                        response_chunks.append(chunk)
-                        yield chunk
+                error_detected = True
+                action = self._recover(message, request, api_params, used_actions,
+                                       has_output=streaming and len(buffer) > 0)
+                if action is ErrorAction.NEW_SESSION:
+                    dead_contexts.add(session.context_id)
+                    session = self._create_session("")
+                    self._last_session = session
+                elif action is ErrorAction.RETRY:
+                    # 限流时退避后再重试，退避后剩余时间不足时直接失败
+                    delay = self.retry_policy.backoff_within(attempt, deadline)
+                    if delay is None:
+                        raise Exception(f"Sider API错误: {message}，剩余时间不足，不再重试")
+                    time.sleep(delay)
+                    attempt += 1
+                metrics.retry()
+                buffer.clear()
+                deadline.restart()  # 重试只使用剩余的总时间
+            
+            if not streaming and buffer:
+                yield buffer.getvalue()
             
-            if not response_chunks and not error_detected:
+            if not buffer and not error_detected:
                 raise Exception("未收到任何响应内容")
             
+            self._remember_quota(session)
+            metrics.finish(True, host=session.host, quota=self._quota(session, request.model))
+            emit_metrics(metrics)
+            
             # 返回最终响应
-            full_response = "".join(response_chunks)
             return ChatResponse(
-                response=full_response,
+                response=buffer.getvalue(),
                 context_id=session.context_id,
                 model=request.model,
-                success=True
+                success=True,
+                truncated=buffer.truncated,
+                host=session.host,
+                metrics=metrics.to_dict()
             )
                 
         except Exception as e:
             logger.error(f"Sider API调用失败: {e}")
+            metrics.finish(False, error=str(e), host=session.host if session else None)
+            emit_metrics(metrics)
             return ChatResponse(
                 response="",
                 context_id=session.context_id if session else "",
                 model=request.model,
                 success=False,
-                error=str(e)
+                error=str(e),
+                metrics=metrics.to_dict()
             )
     
+    def translate(self, content: str, target_lang: str = "English", model: str = "gpt-4o-mini",
+                  deadline: Optional[Deadline] = None) -> str:
+        """
+        使用翻译模板(translate-basic)翻译一段文本，请求失败和限流时按重试策略重试
+        
+        Args:
+            content: 原文
+            target_lang: 目标语言名称，如"English"或"Chinese (Simplified)"
+            model: 模型名称
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            
+        Returns:
+            str: 译文
+            
+        Raises:
+            Exception: 翻译失败
+        """
+        return self._complete(
+            lambda session, deadline: session.translate(content, target_lang=target_lang, model=model,
+                                                        typed=True, deadline=deadline),
+            deadline, "翻译")
+    
+    def ocr(self, image, name: Optional[str] = None, content_type: Optional[str] = None,
+            model: str = "gemini-2.0-flash", deadline: Optional[Deadline] = None) -> str:
+        """
+        上传图片并识别其中的文字，上传和识别失败时按重试策略重试(每次重试重新上传)
+        
+        Args:
+            image: 图片来源，文件路径、bytes、文件对象，或返回它们的函数(重试时重新调用)
+            name: 上传使用的文件名，为空时根据图片来源推断
+            content_type: 图片的MIME类型，为空时根据文件名推断
+            model: 模型名称
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            
+        Returns:
+            str: 识别结果
+            
+        Raises:
+            Exception: 识别失败
+        """
+        return self._complete(
+            lambda session, deadline: session.ocr(image, model=model, typed=True, deadline=deadline,
+                                                  name=name, content_type=content_type),
+            deadline, "OCR")
+    
+    def ocr_stream(self, image, name: Optional[str] = None, content_type: Optional[str] = None,
+                   model: str = "gemini-2.0-flash", deadline: Optional[Deadline] = None) -> Generator[str, None, None]:
+        """
+        上传图片并流式返回识别结果，输出内容前失败或被限流时按重试策略重试(每次重试重新上传)
+        
+        Args:
+            image: 图片来源，与ocr相同
+            name: 上传使用的文件名，为空时根据图片来源推断
+            content_type: 图片的MIME类型，为空时根据文件名推断
+            model: 模型名称
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            
+        Yields:
+            str: 识别结果的文本块
+            
+        Raises:
+            Exception: 识别失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            has_output = False
+            message = None
+            try:
+                for event in session.ocr(image, model=model, typed=True, deadline=deadline,
+                                         name=name, content_type=content_type):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        if event.text:
+                            has_output = True
+                            yield event.text
+                    elif event_type is ServerMessage:
+                        message = event
+                        break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                deadline.restart()
+                continue
+            self._remember_quota(session)
+            if message is None:
+                return
+            delay = None if has_output else self._message_delay(message, attempt, deadline)
+            if delay is None:
+                raise Exception(f"OCR失败: {message}")
+            logger.warning(f"OCR请求被限流: {message}，退避后重试")
+            time.sleep(delay)
+            attempt += 1
+            deadline.restart()
+    
+    def deep_search(self, content: str, model: str = "gpt-4o-mini", focus: Optional[List[str]] = None,
+                    deadline: Optional[Deadline] = None) -> Generator[Any, None, None]:
+        """
+        执行深度搜索，输出回答片段和进度状态；输出回答前失败时按重试策略重试(进度状态可能重新开始)
+        
+        Args:
+            content: 搜索的问题
+            model: 模型名称
+            focus: 限定搜索的网站域名，如["wikipedia.org"]
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            
+        Yields:
+            TextDelta或DeepSearchStatus事件
+            
+        Raises:
+            Exception: 搜索失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            has_output = False
+            try:
+                for event in session.search(content, model=model, focus=focus, typed=True, deadline=deadline):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        has_output = True
+                        yield event
+                    elif event_type is DeepSearchStatus:
+                        yield event
+                    elif event_type is ServerMessage:
+                        raise Exception(f"深度搜索失败: {event}")
+                self._remember_quota(session)
+                return
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                deadline.restart()
+    
+    def _complete(self, start, deadline: Optional[Deadline], label: str) -> str:
+        """
+        在新会话上执行一个非对话类请求(翻译、OCR等)并收集完整结果，请求失败和限流时按重试策略重试
+        
+        Args:
+            start: 接收(会话, 时间预算)并返回类型化事件生成器的函数，每次重试重新调用
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+            label: 日志和错误消息中的请求名称
+            
+        Returns:
+            str: 完整结果
+            
+        Raises:
+            Exception: 请求失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            parts = []
+            message = None
+            try:
+                for event in start(session, deadline):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        parts.append(event.text)
+                    elif event_type is ServerMessage:
+                        message = event
+                        break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output=False)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                deadline.restart()
+                continue
+            self._remember_quota(session)
+            if message is None:
+                return "".join(parts)
+            delay = self._message_delay(message, attempt, deadline)
+            if delay is None:
+                raise Exception(f"{label}失败: {message}")
+            logger.warning(f"{label}请求被限流: {message}，退避后重试")
+            time.sleep(delay)
+            attempt += 1
+            deadline.restart()
+    
     def get_last_context_id(self) -> str:
         """
         获取最后使用的上下文ID
@@ -240,34 +786,104 @@ class SiderAPIClient:
             return self._last_session.context_id
         return ""
     
+    def _fetch_userinfo(self) -> None:
+        """获取用户额度信息并保存到基础会话，之后派生的会话和凭据池调度都会用到"""
+        self._create_session("")  # 首次调用时构建认证请求头，cookie无法解析时抛出ValueError
+        self._base_session.update_userinfo()
+    
     def validate_credentials(self) -> bool:
         """
         验证凭据有效性
         
+        通过获取用户额度信息的轻量接口验证，不消耗聊天额度；结果按凭据哈希缓存，
+        有效的凭据缓存VALIDATION_TTL秒，无效的缓存INVALID_TTL秒。网络错误等暂时性失败不缓存
+        
         Returns:
             bool: 凭据是否有效
         """
+        key = credential_key(self.token, self.cookie)
+        now = time.monotonic()
+        with _validation_lock:
+            cached = _validation_cache.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        
         try:
-            # 创建测试会话
-            test_session = self._create_session("")
-            
-            # 执行简单的测试请求
-            test_request = ChatRequest(
-                prompt="Hello",
-                model="gpt-4o-mini",
-                options=ChatOptions()
-            )
-            
-            # 尝试获取第一个响应块
-            for chunk in self.chat(test_request):
-                if chunk and not self._is_error_message(chunk):
-                    logger.info("凭据验证成功")
-                    return True
-                break
-            
-            logger.warning("凭据验证失败：未收到有效响应")
-            return False
-            
+            self._fetch_userinfo()
+            valid = True
+            logger.info("凭据验证成功")
+        except (KeyError, TypeError, ValueError) as e:
+            # 响应不是预期的用户信息结构，或cookie中没有token
+            logger.warning(f"凭据验证失败: {e}")
+            valid = False
         except Exception as e:
-            logger.error(f"凭据验证失败: {e}")
-            return False 
\ No newline at end of file
+            # requests和httpx的HTTP错误都带有response.status_code
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status not in (401, 403):
+                logger.warning(f"凭据验证失败({type(e).__name__}): {e}，暂不缓存结果")
+                return False
+            logger.warning(f"凭据验证失败：认证被拒绝(HTTP {status})")
+            valid = False
+        
+        with _validation_lock:
+            _validation_cache.pop(key, None)
+            if len(_validation_cache) >= VALIDATION_CACHE_SIZE:
+                for expired in [k for k, (_, until) in _validation_cache.items() if until <= now]:
+                    del _validation_cache[expired]
+            while len(_validation_cache) >= VALIDATION_CACHE_SIZE:
+                _validation_cache.popitem(last=False)  # 仍然已满时淘汰最早写入的结果
+            _validation_cache[key] = (valid, now + (VALIDATION_TTL if valid else INVALID_TTL))
+        return valid
+
+
+def credential_key(token: str, cookie: str) -> str:
+    """
+    计算凭据的哈希键，避免在缓存中以明文保存凭据作为键
+    
+    Args:
+        token: Sider认证令牌
+        cookie: Sider认证Cookie
+        
+    Returns:
+        str: 凭据哈希
+    """
+    return hashlib.sha256(f"{token}\0{cookie}".encode("utf-8")).hexdigest()
+
+
+_validation_cache: "OrderedDict[str, tuple]" = OrderedDict()  # 凭据哈希 -> (是否有效, 过期时间)，按写入顺序
+_validation_lock = threading.Lock()
+
+_client_cache: "OrderedDict[str, tuple[SiderAPIClient, float]]" = OrderedDict()
+_client_cache_lock = threading.Lock()
+
+
+def get_client(token: str, cookie: str, clock: Callable[[], float] = time.monotonic) -> SiderAPIClient:
+    """
+    获取凭据对应的API客户端，相同凭据的调用复用同一个客户端
+    
+    缓存为有界LRU，超过CLIENT_IDLE_TTL未使用的客户端会被淘汰
+    
+    Args:
+        token: Sider认证令牌
+        cookie: Sider认证Cookie
+        clock: 计时函数(秒)
+        
+    Returns:
+        SiderAPIClient: API客户端
+    """
+    key = credential_key(token, cookie)
+    now = clock()
+    with _client_cache_lock:
+        # 按最近使用顺序排列，从最旧的一端淘汰过期客户端
+        while _client_cache:
+            oldest_key, (_, last_used) = next(iter(_client_cache.items()))
+            if now - last_used <= CLIENT_IDLE_TTL:
+                break
+            del _client_cache[oldest_key]
+        
+        entry = _client_cache.pop(key, None)
+        client = entry[0] if entry else SiderAPIClient(token=token, cookie=cookie)
+        _client_cache[key] = (client, now)
+        while len(_client_cache) > CLIENT_CACHE_SIZE:
+            _client_cache.popitem(last=False)
+    return client
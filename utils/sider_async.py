@@ -0,0 +1,591 @@
+"""
+Sider AI 异步客户端
+基于asyncio和httpx的非阻塞实现，单个worker可以同时处理大量并发对话
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional, Set, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import sider_session
+from .sider_session import Session, APP_NAME, APP_VERSION, TIMEZONE, known, render_event, upload_image
+from .sider_api import (SiderAPIClient, ChatRequest, ChatResponse, ErrorAction,
+                         ResponseBuffer, MAX_RESPONSE_CHARS)
+from .sider_events import TextDelta, ServerMessage, DeepSearchStatus
+from .sider_sse import DONE, SSEDecoder
+from .sider_deadline import Deadline, REQUEST_TIMEOUT, ensure_deadline
+from .sider_retry import RetryPolicy, UpstreamError, get_breaker, is_host_failure, upstream_error
+from .sider_context import dead_contexts
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSession(Session):
+    """Session的异步版本，请求构建和事件处理逻辑与同步会话共用"""
+
+    def __init__(self, token=None, context_id="", cookie=None,
+                 http: Union[httpx.AsyncClient, Callable[[], httpx.AsyncClient], None] = None):
+        # 异步会话不在初始化时同步获取用户信息，需要时调用update_userinfo
+        # http为连接池，或返回当前事件循环的连接池的函数(连接池只能在创建它的事件循环中使用)
+        super().__init__(token=token, context_id=context_id, cookie=cookie, update_info_at_init=False)
+        self.http = http
+
+    def _client(self) -> httpx.AsyncClient:
+        # 获取本次请求使用的连接池，需要在事件循环中调用
+        return self.http() if callable(self.http) else self.http
+
+    def fork(self, context_id=""):
+        session = super().fork(context_id)
+        session.http = self.http
+        return session
+
+    async def update_userinfo(self):
+        url = "https://api3.sider.ai/api/v1/completion/limit/user"
+        params = {
+            "app_name": APP_NAME,
+            "app_version": APP_VERSION,
+            "tz_name": TIMEZONE
+        }
+        response = await self._client().get(url, params=params, headers=self.header,
+                                            timeout=httpx.Timeout(REQUEST_TIMEOUT[1], connect=REQUEST_TIMEOUT[0]))
+        response.raise_for_status()
+        data = response.json()
+        self.total = known(data["data"]["basic_credit"]["count"], self.total)
+        self.remain = known(data["data"]["basic_credit"]["remain"], self.remain)
+        self.advanced_total = known(data["data"]["advanced_credit"]["count"], self.advanced_total)
+        self.advanced_remain = known(data["data"]["advanced_credit"]["remain"], self.advanced_remain)
+
+    async def get_events(self, url, header, payload, deep_search=False, deadline=None):
+        # 一个异步生成器，获取类型化的输出事件。deadline为时间预算，为空时使用默认预算
+        # 错误处理与同步会话一致：错误状态码抛出UpstreamError，熔断中抛出CircuitOpenError
+        deadline = ensure_deadline(deadline)
+        connect, first_byte = deadline.requests_timeout()  # 时间预算已经用完时不占用熔断器的试探名额
+        breaker = get_breaker(url)
+        probe = breaker.check()
+        timeout = httpx.Timeout(first_byte, connect=connect, pool=connect)
+        body = getattr(payload, "body", None)  # Payload已经序列化，普通字典由httpx序列化
+        try:
+            async with self._client().stream("POST", url, headers=header, content=body,
+                                             json=payload if body is None else None, timeout=timeout) as resp:
+                chunks = resp.aiter_bytes()
+                if resp.status_code >= 400:
+                    text = b""
+                    async for chunk in chunks:
+                        text += chunk
+                        if len(text) >= 1024:
+                            break
+                    raise upstream_error(resp.status_code, resp.headers, text[:1024].decode("utf-8", "replace"))
+                breaker.record_success()
+                self.host = urlsplit(url).netloc
+                decoder = SSEDecoder(raw=not payload.get("stream", True))
+                phase = "first_byte"
+                while True:
+                    # httpx的读取超时不区分首个数据块和之后的间隔，这里按阶段单独限制每次读取
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline.timeout(phase))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError as err:
+                        raise deadline.exceeded(phase) from err
+                    phase = "idle"
+                    for data in decoder.feed(chunk):
+                        if data == DONE:
+                            return
+                        for event in self._event_items(data, payload, deep_search):
+                            yield event
+                for data in decoder.flush():
+                    if data == DONE:
+                        return
+                    for event in self._event_items(data, payload, deep_search):
+                        yield event
+        except httpx.ConnectTimeout as err:
+            breaker.record_failure()
+            raise deadline.exceeded("connect") from err
+        except httpx.ReadTimeout as err:
+            breaker.record_failure()
+            raise deadline.exceeded("first_byte") from err
+        except httpx.TransportError as err:
+            # 转换为内置的ConnectionError，与同步会话的连接错误一样按暂时性错误处理
+            breaker.record_failure()
+            raise ConnectionError(f"{type(err).__name__}: {err}") from err
+        except Exception as err:
+            if is_host_failure(err):
+                breaker.record_failure()
+            elif isinstance(err, UpstreamError):
+                breaker.record_success()
+            raise
+        finally:
+            if probe:
+                breaker.release()  # 试探请求没有得到结论时释放名额
+
+    def get_text(self, url, header, payload, deep_search=False, deadline=None):
+        # 返回输出结果的异步生成器
+        return self._render(self.get_events(url, header, payload, deep_search, deadline))
+
+    async def _render(self, events):
+        # 把类型化事件的异步生成器转换为输出文本
+        async for event in events:
+            text = render_event(event)
+            if text is not None:
+                yield text
+
+    async def _join(self, chunks):
+        return "".join([chunk async for chunk in chunks])
+
+    def _output(self, events, stream, typed):
+        # 按typed和stream返回类型化事件、输出文本的异步生成器，或返回完整结果的协程
+        if typed:
+            return events
+        if stream:
+            return self._render(events)
+        return self._join(self._render(events))
+
+    def translate(self, content, target_lang="English", model="gpt-4o-mini", stream=True,
+                  typed=False, deadline=None):
+        # 参数与Session.translate相同，返回值与chat相同
+        events = super().translate(content, target_lang=target_lang, model=model, stream=stream,
+                                   typed=True, deadline=deadline)
+        return self._output(events, stream, typed)
+
+    def search(self, content, model="gpt-4o-mini", stream=True, focus=None, typed=False, deadline=None):
+        # 参数与Session.search相同，返回值与chat相同
+        events = super().search(content, model=model, stream=stream, focus=focus, typed=True,
+                                deadline=deadline)
+        return self._output(events, stream, typed)
+
+    def ocr(self, filename, model="gemini-2.0-flash", stream=True, typed=False, deadline=None,
+            name=None, content_type=None):
+        # 参数与Session.ocr相同，返回值与chat相同
+        events = self._ocr_events(filename, model, stream, deadline, name, content_type)
+        return self._output(events, stream, typed)
+
+    async def _ocr_events(self, filename, model, stream, deadline, name, content_type):
+        # 上传使用同步的requests，在线程中执行，不阻塞事件循环
+        data = await asyncio.to_thread(upload_image, filename, self.header, name=name,
+                                       content_type=content_type)
+        url, payload = self._ocr_request(data["data"]["id"], model, stream)
+        async for event in self.get_events(url, self.json_header, payload, deadline=deadline):
+            yield event
+
+    def chat(self, prompt, model="gpt-4o-mini",
+             stream=True, output_lang=None, thinking_mode=False,
+             data_analysis=True, search=False,
+             text_to_image=False, artifact=True, typed=False, deadline=None):
+        # 返回结果的异步生成器(stream为True，默认)，或返回结果字符串的协程(stream为False)
+        # typed为True时返回类型化事件的异步生成器
+        url, header, payload = self._chat_request(
+            prompt, model=model, stream=stream, output_lang=output_lang,
+            thinking_mode=thinking_mode, data_analysis=data_analysis, search=search,
+            text_to_image=text_to_image, artifact=artifact)
+        return self._output(self.get_events(url, header, payload, deadline=deadline), stream, typed)
+
+
+class AsyncChatStream:
+    """
+    一次异步聊天的结果流
+
+    使用async for逐块获取响应文本，迭代结束后result中保存最终的ChatResponse
+    """
+
+    def __init__(self, client: "AsyncSiderAPIClient", request: ChatRequest, streaming: bool,
+                 buffer: Optional[ResponseBuffer] = None, deadline: Optional[Deadline] = None):
+        self.result: Optional[ChatResponse] = None
+        self.buffer = buffer if buffer is not None else ResponseBuffer(MAX_RESPONSE_CHARS)
+        self.deadline = ensure_deadline(deadline)
+        self._chunks = client._chat(self, request, streaming)
+
+    def __aiter__(self) -> AsyncGenerator[str, None]:
+        return self._chunks
+
+    async def aclose(self) -> None:
+        await self._chunks.aclose()
+
+
+class AsyncSiderAPIClient(SiderAPIClient):
+    """Sider AI API异步客户端"""
+
+    def __init__(self, token: str, cookie: str, retry_policy: Optional[RetryPolicy] = None):
+        """
+        初始化异步API客户端
+
+        Args:
+            token: Sider认证令牌
+            cookie: Sider认证Cookie
+            retry_policy: 请求失败时的重试策略，为空时使用默认策略
+        """
+        super().__init__(token=token, cookie=cookie, retry_policy=retry_policy)
+        self._http: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}  # 事件循环 -> 连接池
+        self._http_lock = threading.Lock()
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """
+        获取当前事件循环的连接池，首次使用时创建
+
+        httpx.AsyncClient的连接绑定创建它的事件循环，同步调用使用的后台事件循环和调用方的事件循环
+        各用一个连接池，不能共用；已关闭的事件循环的连接池随之丢弃
+
+        Returns:
+            httpx.AsyncClient: 连接池
+        """
+        loop = asyncio.get_running_loop()
+        with self._http_lock:
+            http = self._http.get(loop)
+            if http is None or http.is_closed:
+                for closed in [other for other in self._http if other.is_closed()]:
+                    del self._http[closed]
+                size = sider_session.POOL_MAXSIZE  # 创建时读取，configure_pool修改后的大小对新连接池生效
+                http = self._http[loop] = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=size * 4, max_keepalive_connections=size),
+                    timeout=None
+                )
+            return http
+
+    def _create_session(self, context_id: str = "") -> AsyncSession:
+        """
+        创建新的异步会话实例
+
+        Args:
+            context_id: 对话上下文ID
+
+        Returns:
+            AsyncSession: 会话实例
+        """
+        try:
+            if self._base_session is None:
+                # 客户端内同一事件循环中的会话共用一个连接池
+                self._base_session = AsyncSession(token=self.token, cookie=self.cookie, http=self._http_client)
+            session = self._base_session.fork(context_id)
+            logger.debug(f"创建异步会话: context_id='{context_id}'")
+            return session
+        except Exception as e:
+            logger.error(f"创建异步会话失败: {e}")
+            raise
+
+    def _fetch_userinfo(self) -> None:
+        # 供同步的validate_credentials调用，在后台事件循环中获取用户信息
+        self._create_session("")
+        asyncio.run_coroutine_threadsafe(self._base_session.update_userinfo(), _background_loop()).result()
+
+    def chat(self, request: ChatRequest, streaming: bool = True,
+             buffer: Optional[ResponseBuffer] = None,
+             deadline: Optional[Deadline] = None) -> AsyncChatStream:
+        """
+        执行异步聊天请求
+
+        Args:
+            request: 聊天请求对象
+            streaming: 是否启用流式输出
+            buffer: 保存完整响应的缓冲区，为空时创建新的缓冲区
+            deadline: 时间预算，包括重试在内共用，为空时使用默认预算
+
+        Returns:
+            AsyncChatStream: 可用async for迭代的响应流，结束后result为最终响应对象
+        """
+        return AsyncChatStream(self, request, streaming, buffer, deadline)
+
+    async def _chat(self, stream: AsyncChatStream, request: ChatRequest,
+                    streaming: bool) -> AsyncGenerator[str, None]:
+        session = self._create_session(self._initial_context(request.context_id))
+        self._last_session = session
+        buffer = stream.buffer
+        deadline = stream.deadline
+        try:
+            api_params = self._api_params(request, streaming)
+            logger.info(f"异步调用Sider API: model={request.model}, prompt长度={len(request.prompt)}, context_id='{session.context_id}', streaming={streaming}")
+
+            error_detected = False
+            used_actions: Set[ErrorAction] = set()
+            attempt = 0
+            while True:
+                message = None
+                try:
+                    async for event in session.chat(typed=True, deadline=deadline, **api_params):
+                        event_type = type(event)
+                        if event_type is TextDelta:
+                            buffer.append(event.text)
+                            if streaming:
+                                yield event.text
+                        elif event_type is ServerMessage:
+                            message = event
+                            break
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline,
+                                              has_output=streaming and len(buffer) > 0)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    buffer.clear()
+                    deadline.restart()
+                    continue
+                if message is None:
+                    break
+                error_detected = True
+                # 错误处理与同步客户端一致
+                action = self._recover(message, request, api_params, used_actions,
+                                       has_output=streaming and len(buffer) > 0)
+                if action is ErrorAction.NEW_SESSION:
+                    dead_contexts.add(session.context_id)
+                    session = self._create_session("")
+                    self._last_session = session
+                elif action is ErrorAction.RETRY:
+                    delay = self.retry_policy.backoff_within(attempt, deadline)
+                    if delay is None:
+                        raise Exception(f"Sider API错误: {message}，剩余时间不足，不再重试")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                buffer.clear()
+                deadline.restart()
+
+            if not streaming and buffer:
+                yield buffer.getvalue()
+
+            if not buffer and not error_detected:
+                raise Exception("未收到任何响应内容")
+
+            self._remember_quota(session)
+            stream.result = ChatResponse(
+                response=buffer.getvalue(),
+                context_id=session.context_id,
+                model=request.model,
+                success=True,
+                truncated=buffer.truncated,
+                host=session.host
+            )
+        except Exception as e:
+            logger.error(f"Sider API调用失败: {e}")
+            stream.result = ChatResponse(
+                response="",
+                context_id=session.context_id if session else "",
+                model=request.model,
+                success=False,
+                error=str(e)
+            )
+
+    def chat_blocking(self, request: ChatRequest, streaming: bool = True,
+                      buffer: Optional[ResponseBuffer] = None,
+                      deadline: Optional[Deadline] = None) -> Generator[str, None, ChatResponse]:
+        """
+        同步调用接口，与SiderAPIClient.chat的签名和返回值一致，供同步代码(如SiderChatTool)使用
+
+        请求在后台事件循环线程中执行，所有同步调用共用该事件循环和连接池
+
+        Args:
+            request: 聊天请求对象
+            streaming: 是否启用流式输出
+            buffer: 保存完整响应的缓冲区，为空时创建新的缓冲区
+            deadline: 时间预算，为空时使用默认预算
+
+        Yields:
+            str: 响应文本块
+
+        Returns:
+            ChatResponse: 最终响应对象
+        """
+        loop = _background_loop()
+        stream = self.chat(request, streaming, buffer, deadline)
+        chunks = stream.__aiter__()
+        finished = False
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop)
+                try:
+                    chunk = future.result()
+                except StopAsyncIteration:
+                    finished = True
+                    break
+                yield chunk
+        finally:
+            if not finished:
+                asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
+        return stream.result
+
+    async def translate(self, content: str, target_lang: str = "English", model: str = "gpt-4o-mini",
+                        deadline: Optional[Deadline] = None) -> str:
+        """
+        异步翻译一段文本，参数和重试方式与SiderAPIClient.translate相同
+
+        Returns:
+            str: 译文
+
+        Raises:
+            Exception: 翻译失败
+        """
+        return await self._complete(
+            lambda session, deadline: session.translate(content, target_lang=target_lang, model=model,
+                                                        typed=True, deadline=deadline),
+            deadline, "翻译")
+
+    async def ocr(self, image, name: Optional[str] = None, content_type: Optional[str] = None,
+                  model: str = "gemini-2.0-flash", deadline: Optional[Deadline] = None) -> str:
+        """
+        异步上传图片并识别其中的文字，参数和重试方式与SiderAPIClient.ocr相同
+
+        Returns:
+            str: 识别结果
+
+        Raises:
+            Exception: 识别失败
+        """
+        return await self._complete(
+            lambda session, deadline: session.ocr(image, model=model, typed=True, deadline=deadline,
+                                                  name=name, content_type=content_type),
+            deadline, "OCR")
+
+    async def ocr_stream(self, image, name: Optional[str] = None, content_type: Optional[str] = None,
+                         model: str = "gemini-2.0-flash",
+                         deadline: Optional[Deadline] = None) -> AsyncGenerator[str, None]:
+        """
+        异步上传图片并流式返回识别结果，参数和重试方式与SiderAPIClient.ocr_stream相同
+
+        Yields:
+            str: 识别结果的文本块
+
+        Raises:
+            Exception: 识别失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            has_output = False
+            message = None
+            try:
+                async for event in session.ocr(image, model=model, typed=True, deadline=deadline,
+                                               name=name, content_type=content_type):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        if event.text:
+                            has_output = True
+                            yield event.text
+                    elif event_type is ServerMessage:
+                        message = event
+                        break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                deadline.restart()
+                continue
+            self._remember_quota(session)
+            if message is None:
+                return
+            delay = None if has_output else self._message_delay(message, attempt, deadline)
+            if delay is None:
+                raise Exception(f"OCR失败: {message}")
+            logger.warning(f"OCR请求被限流: {message}，退避后重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+            deadline.restart()
+
+    async def deep_search(self, content: str, model: str = "gpt-4o-mini", focus: Optional[List[str]] = None,
+                          deadline: Optional[Deadline] = None) -> AsyncGenerator[Any, None]:
+        """
+        异步执行深度搜索，参数和重试方式与SiderAPIClient.deep_search相同
+
+        Yields:
+            TextDelta或DeepSearchStatus事件
+
+        Raises:
+            Exception: 搜索失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            has_output = False
+            try:
+                async for event in session.search(content, model=model, focus=focus, typed=True,
+                                                  deadline=deadline):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        has_output = True
+                        yield event
+                    elif event_type is DeepSearchStatus:
+                        yield event
+                    elif event_type is ServerMessage:
+                        raise Exception(f"深度搜索失败: {event}")
+                self._remember_quota(session)
+                return
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                deadline.restart()
+
+    async def _complete(self, start, deadline: Optional[Deadline], label: str) -> str:
+        """
+        SiderAPIClient._complete的异步版本，start返回类型化事件的异步生成器
+
+        Returns:
+            str: 完整结果
+
+        Raises:
+            Exception: 请求失败
+        """
+        deadline = ensure_deadline(deadline)
+        attempt = 0
+        while True:
+            session = self._create_session("")
+            parts = []
+            message = None
+            try:
+                async for event in start(session, deadline):
+                    event_type = type(event)
+                    if event_type is TextDelta:
+                        parts.append(event.text)
+                    elif event_type is ServerMessage:
+                        message = event
+                        break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, has_output=False)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                deadline.restart()
+                continue
+            self._remember_quota(session)
+            if message is None:
+                return "".join(parts)
+            delay = self._message_delay(message, attempt, deadline)
+            if delay is None:
+                raise Exception(f"{label}失败: {message}")
+            logger.warning(f"{label}请求被限流: {message}，退避后重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+            deadline.restart()
+
+    async def aclose(self) -> None:
+        """关闭客户端持有的所有连接池，每个连接池在创建它的事件循环中关闭"""
+        with self._http_lock:
+            clients, self._http = self._http, {}
+        current = asyncio.get_running_loop()
+        for loop, http in clients.items():
+            if loop is current:
+                await http.aclose()
+            elif loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(http.aclose(), loop))
+            # 已关闭的事件循环中的连接已经无法使用，直接丢弃
+        self._base_session = None
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """返回供同步调用使用的后台事件循环，首次使用时启动"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="sider-async-loop", daemon=True).start()
+    return _loop
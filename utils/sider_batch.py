@@ -0,0 +1,244 @@
+"""
+批量执行
+把一组提示词(或翻译片段、图片等)交给有上限的线程池并发执行，所有请求共用同一个客户端(及其连接池和额度状态)，
+按完成顺序或输入顺序返回每一项的结果
+"""
+import json
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from .sider_api import ChatRequest, ChatResponse
+from .sider_deadline import Deadline
+from . import sider_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+MAX_ITEMS = 500  # 单次批量的最大条数
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+STREAM_END = object()  # map_streams中某一项正常结束
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _workers(max_workers: int, count: int) -> int:
+    # 并发数不超过每个主机的连接池大小，避免建立池外的临时连接；
+    # 每次调用时读取，configure_pool修改后的大小立即生效
+    return max(1, min(max_workers, sider_session.POOL_MAXSIZE, count))
+
+
+def render_template(template: str, variables: Dict[str, Any]) -> str:
+    """
+    用变量替换提示词模板中的{name}占位符
+
+    Args:
+        template: 提示词模板
+        variables: 变量，非字符串的值转换为JSON
+
+    Returns:
+        str: 提示词
+
+    Raises:
+        ValueError: 模板中的变量没有提供
+    """
+    def substitute(match):
+        name = match.group(1)
+        if name not in variables:
+            raise ValueError(f"提示词模板中的变量 {name} 没有提供")
+        value = variables[name]
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+    return _PLACEHOLDER.sub(substitute, template)
+
+
+def parse_prompts(prompts: str, template: str = "") -> List[str]:
+    """
+    解析批量输入。prompts为JSON数组或每行一项；提供模板时每一项是模板变量(对象)，
+    或者是替换{item}的字符串
+
+    Args:
+        prompts: 批量输入
+        template: 提示词模板，为空时每一项就是提示词
+
+    Returns:
+        List[str]: 提示词列表
+
+    Raises:
+        ValueError: 输入格式错误或条数超过上限
+    """
+    text = prompts.strip()
+    items = None
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            items = None  # 不是合法的JSON时按行处理
+    if items is None:
+        items = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"批量条数({len(items)})超过上限{MAX_ITEMS}")
+
+    results = []
+    for index, item in enumerate(items, 1):
+        if template:
+            variables = item if isinstance(item, dict) else {"item": item}
+            results.append(render_template(template, variables))
+        elif isinstance(item, str):
+            results.append(item)
+        else:
+            raise ValueError(f"第{index}项不是字符串，使用变量时需要提供提示词模板")
+    return results
+
+
+def complete(client, request: ChatRequest, deadline: Optional[Deadline] = None) -> ChatResponse:
+    """
+    非流式执行一个请求
+
+    Args:
+        client: SiderAPIClient或CredentialPool
+        request: 聊天请求
+        deadline: 时间预算，为空时使用默认预算
+
+    Returns:
+        ChatResponse: 最终响应
+    """
+    generator = client.chat(request, streaming=False, deadline=deadline)
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def map_completed(func: Callable[[T], R], items: Sequence[T],
+                  max_workers: int = DEFAULT_WORKERS) -> Generator[Tuple[int, Future], None, None]:
+    """
+    并发执行func，按完成顺序输出
+
+    Args:
+        func: 处理单项的函数
+        items: 输入列表
+        max_workers: 最大并发数，不超过连接池大小
+
+    Yields:
+        Tuple[int, Future]: (序号, 已完成的Future)，结果或异常由调用方通过future.result()获取
+    """
+    if not items:
+        return
+    workers = _workers(max_workers, len(items))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sider-batch")
+    try:
+        futures = {executor.submit(func, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            yield futures[future], future
+    finally:
+        # 调用方提前停止时取消还没有开始的项，不等待进行中的项
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def map_streams(func: Callable[[T], Iterable[R]], items: Sequence[T],
+                max_workers: int = DEFAULT_WORKERS) -> Generator[Tuple[int, Any], None, None]:
+    """
+    并发执行返回生成器的func，按产生的先后顺序输出各项的结果块
+
+    Args:
+        func: 处理单项、逐块返回结果的函数
+        items: 输入列表
+        max_workers: 最大并发数，不超过连接池大小
+
+    Yields:
+        Tuple[int, Any]: (序号, 结果块)；某项正常结束时结果块为STREAM_END，失败时为异常
+    """
+    if not items:
+        return
+    out = queue.Queue()
+    stop = threading.Event()
+
+    def run(index: int, item: T) -> None:
+        try:
+            chunks = iter(func(item))
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return  # 调用方已经停止读取
+                    out.put((index, chunk))
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            out.put((index, STREAM_END))
+        except Exception as e:
+            out.put((index, e))
+
+    workers = _workers(max_workers, len(items))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sider-batch")
+    try:
+        for index, item in enumerate(items):
+            executor.submit(run, index, item)
+        remaining = len(items)
+        while remaining:
+            index, chunk = out.get()
+            if chunk is STREAM_END or isinstance(chunk, Exception):
+                remaining -= 1
+            yield index, chunk
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_batch(client, requests: Sequence[ChatRequest],
+              max_workers: int = DEFAULT_WORKERS) -> Generator[Tuple[int, ChatResponse], None, None]:
+    """
+    并发执行一组请求
+
+    Args:
+        client: SiderAPIClient或CredentialPool
+        requests: 聊天请求列表
+        max_workers: 最大并发数，不超过连接池大小
+
+    Yields:
+        Tuple[int, ChatResponse]: 按完成顺序输出(请求序号, 最终响应)；请求抛出的异常转换为失败的响应
+    """
+    for index, future in map_completed(lambda request: complete(client, request), requests, max_workers):
+        try:
+            response = future.result()
+        except Exception as e:
+            logger.error(f"批量请求第{index + 1}项失败: {e}")
+            response = ChatResponse(response="", context_id="", model=requests[index].model,
+                                    success=False, error=str(e))
+        yield index, response
+
+
+def map_ordered(func: Callable[[T], R], items: Sequence[T],
+                max_workers: int = DEFAULT_WORKERS) -> Generator[R, None, None]:
+    """
+    并发执行func，按输入顺序输出结果：前面的结果都完成后立即输出，不等待全部完成
+
+    Args:
+        func: 处理单项的函数
+        items: 输入列表
+        max_workers: 最大并发数，不超过连接池大小
+
+    Yields:
+        按输入顺序的结果
+
+    Raises:
+        Exception: 按顺序轮到的某一项失败时抛出它的异常，并取消还没有开始的项
+    """
+    if not items:
+        return
+    workers = _workers(max_workers, len(items))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sider-ordered")
+    try:
+        futures = [executor.submit(func, item) for item in items]
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,229 @@
+"""
+响应缓存
+缓存不带对话上下文的请求(context_id为空)的完整响应，键为模型、提示词和聊天选项的哈希。
+分两级：进程内的热缓存，以及插件持久化存储(manifest中申请的1MB storage)中经过zlib压缩的条目，
+持久化部分按LRU和TTL淘汰，总大小不超过存储配额
+"""
+import json
+import logging
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from .sider_api import ChatRequest, request_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 86400.0             # 默认缓存时间(秒)
+STORAGE_BUDGET = 850 * 1024       # 持久化条目(含索引)的总大小，1MB配额的其余部分留给对话上下文存储
+INDEX_OVERHEAD = 100              # 每个条目在索引中占用的大约字节数
+MAX_ENTRY_SIZE = 64 * 1024        # 单个条目压缩后的最大大小，超过时不缓存
+HOT_CACHE_SIZE = 256              # 进程内热缓存的条目数
+HOT_CACHE_CHARS = 4 * 1024 * 1024  # 进程内热缓存的总字符数
+
+INDEX_KEY = "sider_cache_index"
+ENTRY_PREFIX = "sider_cache:"
+ENTRY_VERSION = 1
+ENTRY_HEADER = struct.Struct(">Bd")  # 持久化条目的头部：格式版本、过期时间，之后是zlib压缩的响应
+
+# 同一进程内的索引读改写由锁串行；命中记录(键 -> 索引记录)在下次写入索引时合并
+_index_lock = threading.Lock()
+_touched: Dict[str, list] = {}
+
+
+def cache_key(request: ChatRequest) -> Optional[str]:
+    """
+    计算请求的缓存键，带对话上下文的请求不缓存
+
+    Args:
+        request: 聊天请求对象
+
+    Returns:
+        Optional[str]: 缓存键，不可缓存时返回None
+    """
+    return request_key(request)
+
+
+class HotCache:
+    """进程内的LRU热缓存，所有工具调用共用"""
+
+    def __init__(self, max_entries: int = HOT_CACHE_SIZE, max_chars: int = HOT_CACHE_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 键 -> (文本, 过期时间)
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, text: str, expires_at: float) -> None:
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (text, expires_at)
+            self._chars += len(text)
+            while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._chars -= len(entry[0])
+
+
+hot_cache = HotCache()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+
+    storage为插件的持久化存储(Tool.session.storage)，为空时只使用热缓存。
+    持久化条目自带过期时间，读取时直接按键查找，不依赖索引；索引只用于按预算淘汰，
+    由put在进程锁内读改写。命中时的最近使用时间先记在进程内，下次put时一并写入索引。
+    存储操作失败只记录日志，缓存不影响正常请求
+    """
+
+    def __init__(self, storage=None, ttl: float = DEFAULT_TTL, budget: int = STORAGE_BUDGET,
+                 hot: HotCache = hot_cache, clock: Callable[[], float] = time.time):
+        """
+        初始化响应缓存
+
+        Args:
+            storage: 插件持久化存储，需要提供get/set/delete/exist方法
+            ttl: 新条目的缓存时间(秒)
+            budget: 持久化条目(含索引)的总大小(字节)
+            hot: 进程内热缓存
+            clock: 计时函数(秒，持久化条目跨进程使用，需要是墙上时间)
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.budget = budget
+        self.hot = hot
+        self._clock = clock
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查找缓存的响应
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 响应文本，未命中时返回None
+        """
+        now = self._clock()
+        text = self.hot.get(key, now)
+        if text is not None or self.storage is None:
+            return text
+        name = ENTRY_PREFIX + key
+        try:
+            if not self.storage.exist(name):
+                return None
+            data = self.storage.get(name)
+            expires_at = _unpack_entry(data)
+            if expires_at is None or expires_at <= now:
+                self.storage.delete(name)  # 过期或旧格式的条目，索引中的记录在下次put时清理
+                return None
+            text = zlib.decompress(data[ENTRY_HEADER.size:]).decode("utf-8")
+        except Exception as e:
+            logger.warning(f"读取响应缓存失败: {e}")
+            return None
+        with _index_lock:
+            _touched[key] = [len(data), expires_at, now]
+        self.hot.put(key, text, expires_at)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """
+        保存响应
+
+        Args:
+            key: 缓存键
+            text: 响应文本
+        """
+        now = self._clock()
+        expires_at = now + self.ttl
+        self.hot.put(key, text, expires_at)
+        if self.storage is None:
+            return
+        data = ENTRY_HEADER.pack(ENTRY_VERSION, expires_at) + zlib.compress(text.encode("utf-8"), 6)
+        if len(data) > min(MAX_ENTRY_SIZE, self.budget):
+            return
+        try:
+            with _index_lock:
+                index = self._load_index()
+                # 写入命中记录的最近使用时间；索引中缺少的条目(被其他进程的并发写入覆盖)重新登记
+                for touched, meta in _touched.items():
+                    if touched in index:
+                        index[touched][2] = max(index[touched][2], meta[2])
+                    elif meta[1] > now and self.storage.exist(ENTRY_PREFIX + touched):
+                        index[touched] = meta
+                _touched.clear()
+                index.pop(key, None)
+                for evicted in self._evict(index, len(data), now):
+                    self.storage.delete(ENTRY_PREFIX + evicted)
+                self.storage.set(ENTRY_PREFIX + key, data)
+                index[key] = [len(data), expires_at, now]
+                self._save_index(index)
+        except Exception as e:
+            logger.warning(f"写入响应缓存失败: {e}")
+
+    def _evict(self, index: Dict[str, list], incoming: int, now: float) -> List[str]:
+        # 先淘汰过期条目，再按最近使用时间从旧到新淘汰，直到能放下新条目
+        evicted = [key for key, meta in index.items() if meta[1] <= now]
+        for key in evicted:
+            del index[key]
+        used = sum(meta[0] for meta in index.values()) + INDEX_OVERHEAD * len(index)
+        incoming += INDEX_OVERHEAD
+        for key in sorted(index, key=lambda k: index[k][2]):
+            if used + incoming <= self.budget:
+                break
+            used -= index.pop(key)[0] + INDEX_OVERHEAD
+            evicted.append(key)
+        return evicted
+
+    def _load_index(self) -> Dict[str, list]:
+        # 索引：缓存键 -> [条目大小, 过期时间, 最近使用时间]
+        if not self.storage.exist(INDEX_KEY):
+            return {}
+        return json.loads(self.storage.get(INDEX_KEY))
+
+    def _save_index(self, index: Dict[str, list]) -> None:
+        self.storage.set(INDEX_KEY, json.dumps(index, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack_entry(data: bytes) -> Optional[float]:
+    # 返回持久化条目的过期时间，不是当前格式时返回None
+    if len(data) < ENTRY_HEADER.size or data[0] != ENTRY_VERSION:
+        return None
+    return ENTRY_HEADER.unpack_from(data)[1]
+
+
+def split_text(text: str, size: int) -> List[str]:
+    """
+    把缓存的响应按大约size个字符切分，命中缓存时按流式输出的方式分块发送
+
+    Args:
+        text: 响应文本
+        size: 每块的字符数，<=0时不切分
+
+    Returns:
+        List[str]: 文本块
+    """
+    if size <= 0 or len(text) <= size:
+        return [text] if text else []
+    return [text[i:i + size] for i in range(0, len(text), size)]
@@ -0,0 +1,295 @@
+"""
+流式输出合并
+把上游逐token的响应块合并成较大的消息再发送，减少消息对象、序列化和IPC次数；
+深度搜索的进度状态同样按状态去重、限速后发送
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional
+
+SENTENCE_ENDINGS = tuple("。！？；.!?;…")
+
+
+@dataclass
+class CoalesceStats:
+    """合并统计，用于调整合并参数"""
+    chunks_in: int = 0          # 收到的响应块数
+    bytes_in: int = 0           # 收到的字节数(UTF-8)
+    messages_out: int = 0       # 发出的消息数
+    flush_reasons: Dict[str, int] = field(default_factory=dict)  # 各触发条件的发送次数
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["chunks_per_message"] = round(self.chunks_in / self.messages_out, 2) if self.messages_out else 0
+        return data
+
+
+class ChunkCoalescer:
+    """
+    响应块合并器
+
+    第一个响应块立即发送以保证首字延迟，之后的响应块先缓存，满足以下任一条件时合并发送：
+    缓存达到max_bytes字节、最早缓存的响应块已等待max_delay_ms毫秒、遇到换行或句子结尾。
+    上游停顿时不会有新的响应块触发检查，调用方用remaining()作为读取超时(见with_idle)，
+    超时后调用expire()发出已到期的缓存内容
+    """
+
+    def __init__(self, max_bytes: int = 512, max_delay_ms: float = 200,
+                 flush_on_newline: bool = True, flush_on_sentence: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化合并器
+
+        Args:
+            max_bytes: 缓存的最大字节数，<=0表示不合并
+            max_delay_ms: 缓存的最长等待时间(毫秒)
+            flush_on_newline: 遇到换行时发送
+            flush_on_sentence: 遇到句子结尾时发送
+            clock: 计时函数(秒)
+        """
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000
+        self.flush_on_newline = flush_on_newline
+        self.flush_on_sentence = flush_on_sentence
+        self.stats = CoalesceStats()
+        self._clock = clock
+        self._parts: List[str] = []
+        self._size = 0
+        self._since = 0.0
+        self._started = False
+
+    def push(self, chunk: str) -> Optional[str]:
+        """
+        输入一个响应块
+
+        Args:
+            chunk: 响应文本块
+
+        Returns:
+            Optional[str]: 需要发送的合并文本，暂不发送时返回None
+        """
+        size = len(chunk.encode("utf-8"))
+        stats = self.stats
+        stats.chunks_in += 1
+        stats.bytes_in += size
+        if not self._started or self.max_bytes <= 0:
+            self._started = True
+            self._parts.append(chunk)
+            return self._flush("first" if stats.chunks_in == 1 else "passthrough")
+
+        if not self._parts:
+            self._since = self._clock()
+        self._parts.append(chunk)
+        self._size += size
+
+        if self._size >= self.max_bytes:
+            return self._flush("size")
+        if self.flush_on_newline and "\n" in chunk:
+            return self._flush("newline")
+        if self.flush_on_sentence and chunk.rstrip().endswith(SENTENCE_ENDINGS):
+            return self._flush("sentence")
+        if self._clock() - self._since >= self.max_delay:
+            return self._flush("delay")
+        return None
+
+    def remaining(self) -> Optional[float]:
+        """
+        获取缓存内容距离最长等待时间还剩的秒数
+
+        Returns:
+            Optional[float]: 剩余秒数，没有缓存内容时为None
+        """
+        if not self._parts:
+            return None
+        return max(0.0, self._since + self.max_delay - self._clock())
+
+    def expire(self) -> Optional[str]:
+        """
+        缓存内容已等待max_delay_ms毫秒时发送(读取超时时调用)
+
+        Returns:
+            Optional[str]: 到期的缓存文本，没有到期时返回None
+        """
+        if self._parts and self._clock() - self._since >= self.max_delay:
+            return self._flush("delay")
+        return None
+
+    def flush(self) -> Optional[str]:
+        """
+        发送剩余的缓存内容(响应结束时调用)
+
+        Returns:
+            Optional[str]: 剩余的文本，没有时返回None
+        """
+        if not self._parts:
+            return None
+        return self._flush("end")
+
+    def _flush(self, reason: str) -> str:
+        text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        stats = self.stats
+        stats.messages_out += 1
+        stats.flush_reasons[reason] = stats.flush_reasons.get(reason, 0) + 1
+        return text
+
+
+IDLE = object()  # with_idle在等待超时时产出的标记
+
+
+def with_idle(source: Iterator, timeout: Callable[[], Optional[float]]) -> Generator[Any, None, Any]:
+    """
+    在后台线程中读取source，超过timeout()秒没有新元素时产出IDLE，
+    使调用方在上游停顿期间也能按时发出缓存的内容
+
+    Args:
+        source: 迭代器或生成器
+        timeout: 返回本次最长等待秒数的函数，None表示一直等待(如ChunkCoalescer.remaining)
+
+    Yields:
+        source的元素，或IDLE
+
+    Returns:
+        source为生成器时的返回值
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def read() -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    item = next(source)
+                except StopIteration as end:
+                    items.put((True, end.value))
+                    return
+                items.put((False, item))
+        except Exception as err:
+            items.put((None, err))
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=read, name="sider-coalesce", daemon=True).start()
+    try:
+        while True:
+            wait = timeout()
+            try:
+                done, value = items.get(timeout=None if wait is None else max(wait, 0.0))
+            except queue.Empty:
+                yield IDLE
+                continue
+            if done is None:
+                raise value
+            if done:
+                return value
+            yield value
+    finally:
+        stop.set()  # 调用方停止读取时，读取线程在下一个元素后关闭source
+
+
+MAX_DETAIL_CHARS = 200  # 进度详情中单个字符串的最大长度
+MAX_DETAIL_ITEMS = 5    # 进度详情中列表保留的最多项数
+
+
+def summarize_field(value, depth: int = 0):
+    """
+    把深度搜索状态的field压缩为适合作为进度消息的结构：长字符串截断，长列表只保留前几项和总数。
+    只在需要发送进度时调用，不做格式化排版
+
+    Args:
+        value: 状态的field
+        depth: 当前嵌套深度
+
+    Returns:
+        压缩后的值
+    """
+    if isinstance(value, str):
+        return value if len(value) <= MAX_DETAIL_CHARS else value[:MAX_DETAIL_CHARS] + "…"
+    if depth >= 2:
+        if isinstance(value, (dict, list, tuple)):
+            return f"<{len(value)} items>"
+        return value
+    if isinstance(value, dict):
+        return {key: summarize_field(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [summarize_field(item, depth + 1) for item in value[:MAX_DETAIL_ITEMS]]
+        if len(value) > MAX_DETAIL_ITEMS:
+            items.append(f"<{len(value) - MAX_DETAIL_ITEMS} more>")
+        return items
+    return value
+
+
+class StatusThrottle:
+    """
+    深度搜索进度节流器
+
+    状态变化时立即发送；相同状态的重复事件合并，最多每min_interval秒发送一次最新的一个，
+    其余的只计数，不处理它们的field
+    """
+
+    def __init__(self, min_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化节流器
+
+        Args:
+            min_interval: 相同状态两次发送之间的最短间隔(秒)
+            clock: 计时函数(秒)
+        """
+        self.min_interval = min_interval
+        self._clock = clock
+        self._started = clock()
+        self._status = None       # 最近发送的状态
+        self._sent_at = 0.0
+        self._pending = None      # 还没有发送的最新事件
+        self._merged = 0          # 上次发送后合并的事件数
+        self.events_in = 0
+        self.messages_out = 0
+
+    def push(self, event) -> Optional[Dict]:
+        """
+        输入一个状态事件
+
+        Args:
+            event: DeepSearchStatus
+
+        Returns:
+            Optional[Dict]: 需要发送的进度，暂不发送时返回None
+        """
+        self.events_in += 1
+        self._pending = event
+        self._merged += 1
+        now = self._clock()
+        if event.status != self._status or now - self._sent_at >= self.min_interval:
+            return self._emit(now)
+        return None
+
+    def flush(self) -> Optional[Dict]:
+        """
+        发送最后一个没有发送的事件(搜索结束时调用)
+
+        Returns:
+            Optional[Dict]: 进度，没有时返回None
+        """
+        if self._pending is None:
+            return None
+        return self._emit(self._clock())
+
+    def _emit(self, now: float) -> Dict:
+        event = self._pending
+        progress = {
+            "status": event.status,
+            "detail": summarize_field(event.field),
+            "merged": self._merged,
+            "elapsed": round(now - self._started, 2)
+        }
+        self._status = event.status
+        self._sent_at = now
+        self._pending = None
+        self._merged = 0
+        self.messages_out += 1
+        return progress
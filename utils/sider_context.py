@@ -0,0 +1,209 @@
+"""
+对话上下文存储
+把调用方提供的会话键(如Dify的conversation_id)映射到最新的Sider对话ID，保存在插件持久化存储中，
+调用方不需要在工作流的每一步手动传递context_id；同时记录已知失效的对话ID，
+再次使用时直接创建新会话，不再先浪费一次请求收到"invalid conversation id"(605)
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TTL = 7 * 86400.0   # 会话键超过这段时间(秒)未使用时视为过期，开始新对话
+DEAD_TTL = 7 * 86400.0      # 失效对话ID的记录时间(秒)
+MAX_CONTEXTS = 1000         # 持久化的会话键数量上限(约100KB)，按最近使用时间淘汰
+MAX_DEAD = 1000             # 持久化的失效对话ID数量上限
+
+CONTEXTS_KEY = "sider_contexts"
+DEAD_KEY = "sider_dead_contexts"
+
+
+class DeadContexts:
+    """进程内的失效对话ID记录(LRU)，所有客户端共用"""
+
+    def __init__(self, max_entries: int = MAX_DEAD, ttl: float = DEAD_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, float]" = OrderedDict()  # 对话ID -> 过期时间
+        self._lock = threading.Lock()
+
+    def add(self, context_id: str) -> None:
+        """
+        记录失效的对话ID
+
+        Args:
+            context_id: 对话ID
+        """
+        if not context_id:
+            return
+        with self._lock:
+            self._entries.pop(context_id, None)
+            self._entries[context_id] = self._clock() + self.ttl
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, context_id: str) -> bool:
+        with self._lock:
+            expires_at = self._entries.get(context_id)
+            if expires_at is None:
+                return False
+            if expires_at <= self._clock():
+                del self._entries[context_id]
+                return False
+            return True
+
+
+dead_contexts = DeadContexts()
+
+
+def conversation_hash(conversation_key: str) -> str:
+    """
+    计算会话键在存储中使用的哈希，避免把调用方的原始标识写入存储
+
+    Args:
+        conversation_key: 会话键
+
+    Returns:
+        str: 哈希
+    """
+    return hashlib.sha256(conversation_key.encode("utf-8")).hexdigest()[:32]
+
+
+class ContextStore:
+    """
+    基于插件持久化存储的对话上下文存储
+
+    只有按会话键查找和记录时访问存储，直接传入的对话ID只查进程内的失效记录(带有效期)。
+    存储为空时只使用进程内的失效记录。存储操作失败只记录日志，不影响正常请求；
+    并发写入同一份索引时后写入的覆盖先写入的，最坏情况是丢失一次映射，下一次调用开始新对话
+    """
+
+    def __init__(self, storage=None, ttl: float = CONTEXT_TTL, dead: DeadContexts = dead_contexts,
+                 clock: Callable[[], float] = time.time):
+        """
+        初始化上下文存储
+
+        Args:
+            storage: 插件持久化存储，需要提供get/set/exist方法
+            ttl: 会话键的有效时间(秒)
+            dead: 进程内的失效对话ID记录
+            clock: 计时函数(秒，记录跨进程使用，需要是墙上时间)
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.dead = dead
+        self._clock = clock
+
+    def resolve(self, conversation_key: str) -> str:
+        """
+        查找会话键对应的最新对话ID
+
+        Args:
+            conversation_key: 会话键
+
+        Returns:
+            str: 对话ID，没有记录、已过期或已失效时返回空字符串
+        """
+        if self.storage is None or not conversation_key:
+            return ""
+        try:
+            entry = self._load(CONTEXTS_KEY).get(conversation_hash(conversation_key))
+        except Exception as e:
+            logger.warning(f"读取对话上下文失败: {e}")
+            return ""
+        if entry is None or entry[1] + self.ttl <= self._clock():
+            return ""
+        context_id = entry[0]
+        return "" if self.is_dead(context_id) or self._stored_dead(context_id) else context_id
+
+    def record(self, conversation_key: str, context_id: str) -> None:
+        """
+        保存会话键对应的最新对话ID，并更新最近使用时间
+
+        Args:
+            conversation_key: 会话键
+            context_id: 对话ID
+        """
+        if self.storage is None or not conversation_key or not context_id:
+            return
+        now = self._clock()
+        try:
+            contexts = self._load(CONTEXTS_KEY)
+            key = conversation_hash(conversation_key)
+            contexts.pop(key, None)
+            contexts[key] = [context_id, now]
+            self._save(CONTEXTS_KEY, self._prune(contexts, lambda entry: entry[1] + self.ttl,
+                                                 lambda entry: entry[1], MAX_CONTEXTS, now))
+        except Exception as e:
+            logger.warning(f"保存对话上下文失败: {e}")
+
+    def is_dead(self, context_id: str) -> bool:
+        """
+        判断对话ID是否已知失效，只查进程内的记录，不访问存储
+
+        Args:
+            context_id: 对话ID
+
+        Returns:
+            bool: 是否已失效
+        """
+        return bool(context_id) and context_id in self.dead
+
+    def _stored_dead(self, context_id: str) -> bool:
+        # 查找其他进程记录的失效对话ID，找到时加入进程内记录；只在按会话键查找时调用
+        try:
+            expires_at = self._load(DEAD_KEY).get(context_id)
+        except Exception as e:
+            logger.warning(f"读取失效对话记录失败: {e}")
+            return False
+        if expires_at is None or expires_at <= self._clock():
+            return False
+        self.dead.add(context_id)
+        return True
+
+    def mark_dead(self, context_id: str) -> None:
+        """
+        记录失效的对话ID
+
+        Args:
+            context_id: 对话ID
+        """
+        if not context_id:
+            return
+        self.dead.add(context_id)
+        if self.storage is None:
+            return
+        now = self._clock()
+        try:
+            dead = self._load(DEAD_KEY)
+            dead[context_id] = now + self.dead.ttl
+            self._save(DEAD_KEY, self._prune(dead, lambda expires_at: expires_at,
+                                             lambda expires_at: expires_at, MAX_DEAD, now))
+        except Exception as e:
+            logger.warning(f"保存失效对话记录失败: {e}")
+
+    @staticmethod
+    def _prune(entries: Dict[str, object], expires: Callable, order: Callable,
+               limit: int, now: float) -> Dict[str, object]:
+        # 去掉过期的记录，超过数量上限时保留最新的limit条
+        alive = [(key, value) for key, value in entries.items() if expires(value) > now]
+        if len(alive) > limit:
+            alive.sort(key=lambda item: order(item[1]))
+            alive = alive[-limit:]
+        return dict(alive)
+
+    def _load(self, key: str) -> Dict[str, object]:
+        if not self.storage.exist(key):
+            return {}
+        return json.loads(self.storage.get(key))
+
+    def _save(self, key: str, value: Dict[str, object]) -> None:
+        self.storage.set(key, json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
@@ -0,0 +1,151 @@
+"""
+请求时间预算
+一次聊天请求(包括重试)共用一个Deadline，分别限制建立连接、等待首个数据块、数据块之间的间隔和总耗时，
+避免上游卡住的连接一直占用worker直到被Dify的MAX_REQUEST_TIMEOUT强制结束
+"""
+import time
+from typing import Callable, Optional, Tuple
+
+# 默认预算(秒)。总时间需要小于main.py中的MAX_REQUEST_TIMEOUT(120秒)，留出输出结果的时间
+DEFAULT_CONNECT = 10.0      # 建立连接(含TLS握手)
+DEFAULT_FIRST_BYTE = 60.0   # 从发出请求到收到第一个数据块，推理模型可能较长时间不输出
+DEFAULT_IDLE = 30.0         # 相邻两个数据块之间的最长间隔
+DEFAULT_TOTAL = 110.0       # 整个请求(包括重试)的总时间
+
+# 不属于聊天流的短请求(获取用户信息、上传图片等)的(连接, 读取)超时
+REQUEST_TIMEOUT = (DEFAULT_CONNECT, 30.0)
+
+PHASES = ("connect", "first_byte", "idle", "total")
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求超出时间预算"""
+
+    def __init__(self, phase: str, budget: float):
+        self.phase = phase
+        self.budget = budget
+        super().__init__(f"请求超时: {phase}阶段超过{budget:.1f}秒")
+
+
+class Deadline:
+    """
+    一次请求的时间预算
+
+    total从创建时开始计时；first_byte同样从创建(或restart)时开始计时，因此包含建立连接和等待响应头的时间。
+    重试时调用restart重新开始first_byte计时，total不变，重试只能使用剩余的时间
+    """
+
+    __slots__ = ("connect", "first_byte", "idle", "total", "_clock", "_expires_at", "_first_byte_at")
+
+    def __init__(self, total: float = DEFAULT_TOTAL, connect: float = DEFAULT_CONNECT,
+                 first_byte: float = DEFAULT_FIRST_BYTE, idle: float = DEFAULT_IDLE,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化时间预算
+
+        Args:
+            total: 总时间(秒)
+            connect: 建立连接的时间(秒)
+            first_byte: 等待首个数据块的时间(秒)
+            idle: 数据块之间的最长间隔(秒)
+            clock: 计时函数(秒)
+        """
+        self.connect = connect
+        self.first_byte = first_byte
+        self.idle = idle
+        self.total = total
+        self._clock = clock
+        now = clock()
+        self._expires_at = now + total
+        self._first_byte_at = now + first_byte
+
+    def restart(self) -> None:
+        """开始一次新的上游请求(重试)，重新计算首个数据块的等待时间"""
+        self._first_byte_at = self._clock() + self.first_byte
+
+    def child(self) -> "Deadline":
+        """
+        派生一个新的预算，各阶段的限制相同，总时间为当前剩余的总时间；供并发的子请求使用，
+        各子请求分别重新计时首个数据块，不互相影响
+
+        Returns:
+            Deadline: 新的时间预算
+        """
+        return Deadline(total=max(self.remaining(), 0.0), connect=self.connect,
+                        first_byte=self.first_byte, idle=self.idle, clock=self._clock)
+
+    def remaining(self) -> float:
+        """
+        获取剩余的总时间
+
+        Returns:
+            float: 剩余秒数，已超时时为负数
+        """
+        return self._expires_at - self._clock()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, phase: str) -> float:
+        """
+        获取某个阶段当前可用的超时时间，不超过剩余的总时间
+
+        Args:
+            phase: 阶段，取值见PHASES
+
+        Returns:
+            float: 超时时间(秒)
+
+        Raises:
+            DeadlineExceeded: 该阶段或总时间已经用完
+        """
+        now = self._clock()
+        remaining = self._expires_at - now
+        if remaining <= 0:
+            raise DeadlineExceeded("total", self.total)
+        if phase == "first_byte":
+            budget = self._first_byte_at - now
+            if budget <= 0:
+                raise DeadlineExceeded("first_byte", self.first_byte)
+        elif phase == "total":
+            return remaining
+        else:
+            budget = getattr(self, phase)
+        return budget if budget < remaining else remaining
+
+    def exceeded(self, phase: str) -> DeadlineExceeded:
+        """
+        构造某个阶段超时的异常；总时间已经用完时归为total
+
+        Args:
+            phase: 阶段
+
+        Returns:
+            DeadlineExceeded: 超时异常
+        """
+        if self.expired:
+            return DeadlineExceeded("total", self.total)
+        return DeadlineExceeded(phase, getattr(self, phase))
+
+    def requests_timeout(self) -> Tuple[float, float]:
+        """
+        获取requests使用的(连接, 读取)超时，读取超时限制等待响应头的时间
+
+        Returns:
+            Tuple[float, float]: (连接超时, 读取超时)
+        """
+        return self.timeout("connect"), self.timeout("first_byte")
+
+
+def ensure_deadline(deadline: Optional[Deadline]) -> Deadline:
+    """
+    没有指定时间预算时使用默认预算
+
+    Args:
+        deadline: 时间预算
+
+    Returns:
+        Deadline: 时间预算
+    """
+    return deadline if deadline is not None else Deadline()
@@ -0,0 +1,39 @@
+"""
+Sider AI 流式事件类型
+Session把上游的每个事件解码为以下类型之一，调用方按类型处理，不再依赖字符串匹配
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+
+CODE_INVALID_CONVERSATION = 605  # 对话ID无效或已过期
+
+
+@dataclass(slots=True, frozen=True)
+class TextDelta:
+    """一段回答文本(包括深度搜索的回答片段)"""
+    text: str
+
+
+@dataclass(slots=True, frozen=True)
+class ServerMessage:
+    """服务端返回的msg/code消息，如 605 invalid conversation id"""
+    code: int
+    msg: str
+
+    def __str__(self) -> str:
+        return f"{self.msg} (Code: {self.code})"
+
+
+@dataclass(slots=True, frozen=True)
+class DeepSearchStatus:
+    """深度搜索的进度状态"""
+    status: str
+    field: Optional[Any] = None
+
+
+@dataclass(slots=True, frozen=True)
+class QuotaUpdate:
+    """剩余调用次数发生变化，advanced表示高级模型的额度"""
+    total: Optional[int]
+    remain: Optional[int]
+    advanced: bool = False
@@ -0,0 +1,167 @@
+"""
+相同请求合并(single-flight)
+多个相同的不带上下文的请求同时进行时，只向上游发送一次请求，响应块广播给所有订阅者；
+已收到的响应块保存在回放缓冲区中，晚加入的订阅者从头开始接收。
+上游请求新建的对话只属于第一个调用方，其他订阅者得到的响应不带context_id
+"""
+import threading
+from dataclasses import replace
+from typing import Generator, List
+
+
+class Flight:
+    """
+    一次正在进行的上游请求
+
+    由一个后台线程写入：Flight同时作为上游请求的响应缓冲区(接口与ResponseBuffer相同)，
+    响应块只保存这一份，append即广播；请求结束时调用finish。任意多个订阅者通过subscribe读取；
+    所有订阅者都提前离开时标记cancelled，后台线程随之停止上游请求
+    """
+
+    def __init__(self, max_chars=None):
+        """
+        初始化请求
+
+        Args:
+            max_chars: 最多保存的字符数，超过的部分丢弃并标记truncated，None表示不限制
+        """
+        self.chunks: List[str] = []  # 回放缓冲区，getvalue拼接后清空，之后从_text按_ends切分读取
+        self.result = None  # 最终的ChatResponse
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self.max_chars = max_chars
+        self.truncated = False
+        self._text = None  # getvalue拼接的完整响应，与ChatResponse.response共用
+        self._ends: List[int] = []  # 每个响应块在完整响应中的结束位置，拼接后仍按原来的块输出
+        self._length = 0
+        self._cond = threading.Condition()
+
+    def join(self) -> bool:
+        """
+        加入为订阅者
+
+        Returns:
+            bool: 是否加入成功，请求已被取消时返回False
+        """
+        with self._cond:
+            if self.cancelled:
+                return False
+            self.subscribers += 1
+            return True
+
+    def leave(self) -> None:
+        """订阅者离开，最后一个订阅者在请求完成前离开时取消请求"""
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.cancelled = True
+
+    def append(self, text: str) -> None:
+        """
+        追加并广播一个响应块
+
+        Args:
+            text: 响应文本块
+        """
+        with self._cond:
+            if self.max_chars is not None and self._length + len(text) > self.max_chars:
+                text = text[:self.max_chars - self._length]
+                self.truncated = True
+                if not text:
+                    return
+            self.chunks.append(text)
+            self._length += len(text)
+            self._ends.append(self._length)
+            self._cond.notify_all()
+
+    def clear(self) -> None:
+        """清空缓冲区。上游请求只在还没有输出内容时重试，此时订阅者还没有读取任何内容"""
+        with self._cond:
+            self.chunks = []
+            self._text = None
+            self._ends = []
+            self._length = 0
+            self.truncated = False
+
+    def getvalue(self) -> str:
+        """
+        获取完整响应，拼接后替换回放缓冲区，之后的订阅者从拼接结果中读取
+
+        Returns:
+            str: 完整响应
+        """
+        with self._cond:
+            if self._text is None:
+                self._text = "".join(self.chunks)
+                self.chunks = []
+                self._cond.notify_all()
+            return self._text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def finish(self, result) -> None:
+        """
+        请求结束
+
+        Args:
+            result: 最终响应对象
+        """
+        with self._cond:
+            self.result = result
+            self.done = True
+            self._cond.notify_all()
+
+    def _read(self, index: int):
+        # 返回从第index块开始的新响应块，调用时需持有锁
+        if self._text is None:
+            return self.chunks[index:]
+        ends = self._ends
+        return [self._text[ends[i - 1] if i else 0:ends[i]] for i in range(index, len(ends))]
+
+    def subscribe(self, streaming: bool = True, buffer=None,
+                  leader: bool = False) -> Generator[str, None, "ChatResponse"]:
+        """
+        接收响应，用法与SiderAPIClient.chat相同。调用前需要先join
+
+        Args:
+            streaming: 是否逐块输出；为False时等请求完成后一次性输出完整响应
+            buffer: 保存完整响应的缓冲区(ResponseBuffer)
+            leader: 是否是发起上游请求的调用方，只有它得到新建对话的context_id
+
+        Yields:
+            str: 响应文本块
+
+        Returns:
+            ChatResponse: 最终响应对象(副本)
+        """
+        index = 0  # 已读取的块数
+        try:
+            if not streaming:
+                # 非流式请求可能在收到部分内容后重试(清空缓冲区)，等请求结束后一次读取
+                with self._cond:
+                    while not self.done:
+                        self._cond.wait()
+                    chunks = self._read(0)
+                if buffer is not None:
+                    for chunk in chunks:
+                        buffer.append(chunk)
+            while streaming:
+                with self._cond:
+                    chunks = self._read(index)
+                    while not chunks and not self.done:
+                        self._cond.wait()
+                        chunks = self._read(index)
+                if not chunks:
+                    break  # 请求已结束且已读取全部内容
+                index += len(chunks)
+                for chunk in chunks:
+                    if buffer is not None:
+                        buffer.append(chunk)
+                    yield chunk
+        finally:
+            self.leave()
+        if not streaming and self.result.success and self.result.response:
+            yield self.result.response
+        return replace(self.result) if leader else replace(self.result, context_id="")
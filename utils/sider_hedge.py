@@ -0,0 +1,235 @@
+"""
+对冲请求
+首个请求在一定时间内(按历史首字延迟的分位数计算)没有收到任何事件时，向另一个等价的Sider接口地址发送相同的请求，
+使用最先开始输出的响应，立即关闭其余的响应，降低首字延迟的长尾
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Sequence
+from urllib.parse import urlsplit
+
+from .sider_deadline import ensure_deadline
+from .sider_retry import CircuitOpenError, is_transient
+
+logger = logging.getLogger(__name__)
+
+# 等价的聊天接口地址，请求体相同
+HEDGE_URLS = (
+    "https://sider.ai/api/v3/completion/text",
+    "https://api2.sider.ai/api/v2/completion/text",
+    "https://api3.sider.ai/api/v2/completion/text",
+)
+
+_END = object()  # 请求正常结束
+
+
+class LatencyTracker:
+    """
+    首字延迟统计，保存最近window次请求的延迟，用于计算对冲的等待时间
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        """
+        初始化延迟统计
+
+        Args:
+            window: 保存的最近样本数
+            min_samples: 计算分位数需要的最少样本数
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """
+        记录一次首字延迟
+
+        Args:
+            seconds: 从发出请求到收到第一个事件的时间(秒)
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        计算延迟的分位数
+
+        Args:
+            p: 分位数(0~1)
+
+        Returns:
+            Optional[float]: 延迟(秒)，样本不足时返回None
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+# 进程内所有对冲请求共用的首字延迟统计
+ttft_tracker = LatencyTracker()
+
+
+@dataclass
+class HedgeConfig:
+    """对冲请求配置"""
+    percentile: float = 0.95     # 首个请求等待超过该分位数的首字延迟后发送对冲请求
+    default_delay: float = 2.0   # 样本不足时的等待时间(秒)
+    min_delay: float = 0.2       # 最短等待时间(秒)，避免延迟统计偏低时过早对冲
+    max_hedges: int = 1          # 最多额外发送的请求数，等待超时的对冲和失败后的换用地址都计入
+    urls: Sequence[str] = HEDGE_URLS
+
+    def delay(self, tracker: LatencyTracker = ttft_tracker) -> float:
+        """
+        计算发送对冲请求前的等待时间
+
+        Args:
+            tracker: 首字延迟统计
+
+        Returns:
+            float: 等待时间(秒)
+        """
+        value = tracker.percentile(self.percentile)
+        if value is None:
+            value = self.default_delay
+        return max(self.min_delay, value)
+
+    def targets(self, url: str) -> list:
+        """
+        获取按顺序尝试的接口地址，原请求地址在最前面
+
+        Args:
+            url: 原请求地址
+
+        Returns:
+            list: 接口地址
+        """
+        return [url] + [other for other in self.urls if other != url]
+
+
+def _abort(session):
+    # 关闭派生会话进行中的响应，使读取它的工作线程立即结束
+    abort = getattr(session, "abort", None)
+    if abort is not None:
+        abort()
+
+
+def _worker(session, url, header, payload, deep_search, deadline, out, index, stop):
+    # 在线程中读取一个请求的事件放入队列；被要求停止时在下一个事件后关闭响应(会话不支持abort时的兜底)
+    events = session.get_events(url, header, payload, deep_search, deadline)
+    try:
+        for event in events:
+            out.put((index, event))
+            if stop.is_set():
+                return
+        out.put((index, _END))
+    except Exception as err:
+        out.put((index, err))
+    finally:
+        events.close()
+
+
+def hedged_events(session, url, header, payload, deep_search=False, deadline=None,
+                  config: Optional[HedgeConfig] = None, tracker: LatencyTracker = ttft_tracker):
+    """
+    对冲请求的事件生成器，与Session.get_events的输出相同
+
+    每个请求使用session派生的会话，避免并发修改上下文和额度信息；结束后把胜出请求的
+    上下文ID、额度和主机名复制回session。某个请求在输出前因暂时性错误(或熔断)失败时立即改用下一个地址，
+    认证失败等其他错误直接抛出；额外的请求总数不超过max_hedges，所有请求都失败时抛出最后一个错误
+
+    Args:
+        session: 会话实例
+        url: 原请求地址
+        header: 请求头
+        payload: 请求体
+        deep_search: 是否处理深度搜索事件
+        deadline: 时间预算，所有请求共用
+        config: 对冲配置
+        tracker: 首字延迟统计
+
+    Yields:
+        类型化事件
+    """
+    config = config or HedgeConfig()
+    deadline = ensure_deadline(deadline)
+    urls = config.targets(url)
+    hedge_delay = config.delay(tracker)
+    limit = min(len(urls), 1 + config.max_hedges)  # 最多发送的请求数
+    out = queue.Queue()
+    forks, stops, starts = [], [], []
+
+    def launch():
+        index = len(forks)
+        fork = session.fork(session.context_id)
+        stop = threading.Event()
+        forks.append(fork)
+        stops.append(stop)
+        starts.append(time.monotonic())
+        threading.Thread(target=_worker, name=f"sider-hedge-{index}", daemon=True,
+                         args=(fork, urls[index], header, payload, deep_search, deadline,
+                               out, index, stop)).start()
+
+    launch()
+    pending = 1
+    winner = None
+    first = None
+    try:
+        while winner is None:
+            can_hedge = len(forks) < limit
+            try:
+                index, item = out.get(timeout=hedge_delay if can_hedge else deadline.timeout("total"))
+            except queue.Empty:
+                if not can_hedge:
+                    raise deadline.exceeded("total")
+                logger.info(f"{hedge_delay:.2f}秒内未收到响应，向 {urlsplit(urls[len(forks)]).netloc} 发送对冲请求")
+                launch()
+                pending += 1
+                continue
+            if isinstance(item, Exception):
+                pending -= 1
+                if not (is_transient(item) or isinstance(item, CircuitOpenError)):
+                    raise item  # 换用其他地址也不会成功
+                if len(forks) < limit:
+                    logger.warning(f"{urlsplit(urls[index]).netloc} 请求失败: {item}，改用 {urlsplit(urls[len(forks)]).netloc}")
+                    launch()
+                    pending += 1
+                elif pending == 0:
+                    raise item
+                continue
+            winner, first = index, item
+
+        for index, stop in enumerate(stops):
+            if index != winner:
+                stop.set()
+                _abort(forks[index])  # 直接关闭落选请求的连接，不等它们的下一个事件
+        tracker.record(time.monotonic() - starts[winner])
+        if len(forks) > 1:
+            logger.info(f"对冲请求: {urlsplit(urls[winner]).netloc} 最先响应")
+        if first is _END:
+            return
+        yield first
+        while True:
+            index, item = out.get()
+            if index != winner:
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for stop, fork in zip(stops, forks):
+            stop.set()
+            _abort(fork)  # 已结束的请求没有进行中的响应，不受影响
+        if winner is not None:
+            fork = forks[winner]
+            session.context_id = fork.context_id
+            session.total, session.remain = fork.total, fork.remain
+            session.advanced_total, session.advanced_remain = fork.advanced_total, fork.advanced_remain
+            session.host = fork.host
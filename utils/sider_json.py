@@ -0,0 +1,61 @@
+"""
+JSON解析后端
+按可用性依次选择orjson、msgspec，都未安装时使用标准库json。
+所有后端的loads都直接接受bytes，解析失败时抛出ValueError；
+dumps输出紧凑的UTF-8编码的bytes(非ASCII字符不转义)，用于序列化请求体
+"""
+import json
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+
+def _stdlib_loads(data):
+    # 先解码再解析，省去json.loads对bytes的编码检测
+    return json.loads(data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data)
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _load_backend(name):
+    # 返回指定后端的(loads, dumps)函数，后端不可用时返回None
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            return None
+        return orjson.loads, orjson.dumps  # orjson.JSONDecodeError是ValueError的子类
+    if name == "msgspec":
+        try:
+            import msgspec
+        except ImportError:
+            return None
+        decode = msgspec.json.Decoder().decode
+
+        def loads(data):
+            try:
+                return decode(data)
+            except msgspec.DecodeError as err:
+                raise ValueError(str(err)) from None
+        return loads, msgspec.json.Encoder().encode
+    if name == "json":
+        return _stdlib_loads, _stdlib_dumps
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+def set_backend(name=None):
+    # 切换JSON后端；name为None时自动选择第一个可用的后端
+    global loads, dumps, backend
+    for candidate in ([name] if name else BACKENDS):
+        funcs = _load_backend(candidate)
+        if funcs is not None:
+            (loads, dumps), backend = funcs, candidate
+            return backend
+    raise ImportError(f"JSON backend {name} is not installed")
+
+
+loads = _stdlib_loads
+dumps = _stdlib_dumps
+backend = "json"
+set_backend()
@@ -0,0 +1,218 @@
+"""
+Map-reduce模式
+提示词超过模型单次请求的输入上限时，把它按token预算切分为多个部分，对每一部分并发执行map提示词，
+再用reduce提示词汇总各部分的结果；总耗时取决于最慢的部分，而不是整个文档。
+各模型的输入上限见MODEL_INPUT_TOKENS
+"""
+import logging
+from dataclasses import dataclass, replace
+from typing import Generator, List, Optional
+
+from .sider_api import ChatRequest, ChatResponse, ResponseBuffer
+from .sider_batch import DEFAULT_WORKERS, complete, map_ordered
+from .sider_deadline import Deadline, ensure_deadline
+from .sider_text import estimate_tokens, split_tokens
+
+logger = logging.getLogger(__name__)
+
+# 单次请求的输入token上限。网页端接口对单条消息的限制明显低于模型的上下文窗口，
+# 超出时请求变慢，响应被截断或请求被拒绝，这里按保守的估计取值
+MODEL_INPUT_TOKENS = {
+    # MODELS
+    "sider": 16000,
+    "gpt-4o-mini": 16000,
+    "claude-3-haiku": 32000,
+    "claude-3.5-haiku": 32000,
+    "gemini-1.5-flash": 32000,
+    "gemini-2.0-flash": 32000,
+    "llama-3": 8000,
+    "llama-3.3-70b": 8000,
+    "deepseek-chat": 16000,
+    "deepseek-r1-distill-llama-70b": 8000,
+    # ADVANCED_MODELS
+    "gpt-4o": 32000,
+    "claude-3.5-sonnet": 32000,
+    "gemini-1.5-pro": 32000,
+    "llama-3.1-405b": 8000,
+    "o1-mini": 16000,
+    "o1": 32000,
+    "deepseek-reasoner": 16000,
+    # 工具中可选择的其他模型
+    "gpt-4.1": 32000,
+    "gpt-4.1-mini": 32000,
+    "claude-4-sonnet": 32000,
+    "claude-4-opus": 32000,
+    "claude-4-sonnet-think": 32000,
+    "claude-4-opus-think": 32000,
+    "gemini-2.5-flash": 32000,
+    "gemini-2.5-pro": 32000,
+    "gemini-2.5-flash-think": 32000,
+    "gemini-2.5-pro-think": 32000,
+    "o3": 32000,
+    "o4-mini": 16000,
+}
+DEFAULT_INPUT_TOKENS = 8000  # 表中没有的模型
+
+MAX_REDUCE_ROUNDS = 4  # 部分结果合在一起仍然超出上限时，最多先分组汇总的轮数
+
+DEFAULT_INSTRUCTION = "Summarize the document, keeping all key facts, figures and conclusions."
+
+MAP_PROMPT = """The following is part {index} of {total} of a long document.
+Task: {instruction}
+Apply the task to this part only and write down everything from it that is relevant to the task.
+The results of all parts will be combined afterwards.
+
+--- Part {index}/{total} ---
+{chunk}"""
+
+REDUCE_PROMPT = """The following are results obtained from the {total} parts of a long document, in order.
+Task: {instruction}
+Combine them into a single, complete answer to the task for the whole document.
+
+{results}"""
+
+
+@dataclass
+class MapReduceConfig:
+    """Map-reduce配置"""
+    instruction: str = ""                 # 对整个文档执行的任务，为空时使用DEFAULT_INSTRUCTION
+    map_prompt: str = MAP_PROMPT          # 占位符: {instruction} {index} {total} {chunk}
+    reduce_prompt: str = REDUCE_PROMPT    # 占位符: {instruction} {total} {results}
+    max_workers: int = DEFAULT_WORKERS    # map步骤的最大并发数
+    max_input_tokens: Optional[int] = None  # 单次请求的输入上限，为空时按模型查表
+
+
+def input_limit(model: str) -> int:
+    """
+    获取模型单次请求的输入token上限
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        int: 输入token上限
+    """
+    return MODEL_INPUT_TOKENS.get(model, DEFAULT_INPUT_TOKENS)
+
+
+def needs_map_reduce(request: ChatRequest, config: Optional[MapReduceConfig] = None) -> bool:
+    """
+    判断请求的提示词是否超过模型单次请求的输入上限
+
+    Args:
+        request: 聊天请求
+        config: map-reduce配置
+
+    Returns:
+        bool: 是否需要map-reduce
+    """
+    config = config or MapReduceConfig()
+    return estimate_tokens(request.prompt) > (config.max_input_tokens or input_limit(request.model))
+
+
+def _render(template: str, **values) -> str:
+    # 提示词模板中只替换已知的占位符，文档中的花括号保持原样
+    for name, value in values.items():
+        template = template.replace("{" + name + "}", str(value))
+    return template
+
+
+def _join_results(results: List[str]) -> str:
+    # 拼接各部分的结果，标出序号
+    return "\n\n".join(f"### Part {index}\n{result.strip()}" for index, result in enumerate(results, 1))
+
+
+def _group_results(results: List[str], max_tokens: int) -> List[List[str]]:
+    # 按顺序把部分结果贪心分组，每组拼接后不超过max_tokens(单个结果本身超长时单独成组)
+    groups = []
+    size = 0
+    for result in results:
+        tokens = estimate_tokens(_join_results([result])) + 1
+        if not groups or size + tokens > max_tokens:
+            groups.append([])
+            size = 0
+        groups[-1].append(result)
+        size += tokens
+    return groups
+
+
+def _run_all(client, requests: List[ChatRequest], deadline: Deadline,
+             max_workers: int) -> List[str]:
+    # 并发执行一组非流式请求，按输入顺序返回响应文本；任一请求失败时抛出异常
+    def run(item):
+        index, request = item
+        response = complete(client, request, deadline.child())
+        if not response.success:
+            raise Exception(f"第{index + 1}/{len(requests)}部分处理失败: {response.error}")
+        return response.response
+
+    return list(map_ordered(run, list(enumerate(requests)), max_workers))
+
+
+def map_reduce(client, request: ChatRequest, config: Optional[MapReduceConfig] = None,
+               streaming: bool = True, buffer: Optional[ResponseBuffer] = None,
+               deadline: Optional[Deadline] = None) -> Generator[str, None, ChatResponse]:
+    """
+    以map-reduce模式执行聊天请求。提示词没有超过输入上限时直接执行原请求；
+    否则把提示词作为文档切分，并发执行map步骤，再流式返回reduce步骤的结果。
+    map和reduce步骤共用同一个时间预算
+
+    Args:
+        client: SiderAPIClient或CredentialPool
+        request: 聊天请求，prompt为整个文档
+        config: map-reduce配置，为空时使用默认配置
+        streaming: 是否流式输出reduce步骤的结果
+        buffer: 保存完整响应的缓冲区
+        deadline: 时间预算，为空时使用默认预算
+
+    Yields:
+        str: reduce步骤的响应文本块
+
+    Returns:
+        ChatResponse: 最终响应对象
+    """
+    config = config or MapReduceConfig()
+    deadline = ensure_deadline(deadline)
+    if not needs_map_reduce(request, config):
+        return (yield from client.chat(request, streaming=streaming, buffer=buffer, deadline=deadline))
+
+    instruction = config.instruction.strip() or DEFAULT_INSTRUCTION
+    limit = config.max_input_tokens or input_limit(request.model)
+    try:
+        # map: 每部分的预算要扣除提示词模板本身占用的token
+        overhead = estimate_tokens(_render(config.map_prompt, instruction=instruction,
+                                           index=999, total=999, chunk=""))
+        chunks = split_tokens(request.prompt, max(1, limit - overhead))
+        logger.info(f"开始map-reduce: model={request.model}, 估算token={estimate_tokens(request.prompt)}, "
+                    f"输入上限={limit}, 部分数={len(chunks)}")
+        # map步骤互相独立，不使用对话上下文
+        results = _run_all(client, [
+            replace(request, context_id="", prompt=_render(
+                config.map_prompt, instruction=instruction, index=index, total=len(chunks), chunk=chunk))
+            for index, chunk in enumerate(chunks, 1)
+        ], deadline, config.max_workers)
+
+        # 部分结果合在一起仍然超出上限时，先分组汇总，直到可以一次汇总
+        overhead = estimate_tokens(_render(config.reduce_prompt, instruction=instruction, total=999, results=""))
+        for _ in range(MAX_REDUCE_ROUNDS):
+            joined = _join_results(results)
+            if estimate_tokens(joined) + overhead <= limit:
+                break
+            groups = _group_results(results, max(1, limit - overhead))
+            if len(groups) >= len(results):
+                break  # 每个部分结果本身已经超出上限，无法再分组
+            logger.info(f"map-reduce部分结果超出输入上限，先分{len(groups)}组汇总")
+            results = _run_all(client, [
+                replace(request, context_id="", prompt=_render(
+                    config.reduce_prompt, instruction=instruction, total=len(group),
+                    results=_join_results(group)))
+                for group in groups
+            ], deadline, config.max_workers)
+    except Exception as e:
+        logger.error(f"map-reduce失败: {e}")
+        return ChatResponse(response="", context_id="", model=request.model, success=False, error=str(e))
+
+    # reduce: 使用原请求的对话上下文，最终结果流式返回
+    reduce_request = replace(request, prompt=_render(
+        config.reduce_prompt, instruction=instruction, total=len(results), results=_join_results(results)))
+    return (yield from client.chat(reduce_request, streaming=streaming, buffer=buffer, deadline=deadline))
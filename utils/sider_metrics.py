@@ -0,0 +1,329 @@
+"""
+请求指标
+记录每次聊天请求的建立连接、首字节、首字、数据块间隔和总耗时，接收的字节数和事件数，重试次数和剩余额度，
+用于区分上游响应慢和插件自身的开销。请求结束时把指标交给注册的钩子；
+默认注册一个在内存中汇总、输出Prometheus文本格式的导出器(exporter)
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的分桶上限(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """分桶计数的直方图，输出Prometheus格式时转换为累积计数"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是+Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为字典，分桶为非累积的计数
+
+        Returns:
+            Dict[str, Any]: {"buckets": {上限(毫秒): 计数}, "count", "sum_ms"}
+        """
+        labels = [f"{bound * 1000:g}" for bound in self.buckets] + ["+Inf"]
+        return {
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+            "count": self.count,
+            "sum_ms": round(self.sum * 1000, 3),
+        }
+
+
+class RequestMetrics:
+    """
+    一次聊天请求(包括重试)的指标
+
+    连接、首字节等按最后一次上游请求记录；字节数、事件数和数据块间隔在各次上游请求之间累加。
+    时间都从创建时开始计算
+    """
+
+    __slots__ = ("model", "host", "connect", "reused_connection", "headers", "first_byte", "first_token",
+                 "total", "bytes", "events", "chunks", "retries", "quota_remain", "quota_total", "advanced",
+                 "success", "error", "inter_chunk", "_clock", "_start", "_last_chunk")
+
+    def __init__(self, model: str, clock: Callable[[], float] = time.perf_counter):
+        """
+        初始化请求指标
+
+        Args:
+            model: 模型名称
+            clock: 计时函数(秒)
+        """
+        self.model = model
+        self.host: Optional[str] = None
+        self.connect: Optional[float] = None        # 建立连接(含TLS握手)的耗时，复用连接时为None
+        self.reused_connection: Optional[bool] = None
+        self.headers: Optional[float] = None        # 收到响应头的时间
+        self.first_byte: Optional[float] = None     # 收到第一个响应体数据块的时间
+        self.first_token: Optional[float] = None    # 收到第一段回答文本的时间
+        self.total: Optional[float] = None
+        self.bytes = 0
+        self.events = 0
+        self.chunks = 0
+        self.retries = 0
+        self.quota_remain: Optional[int] = None
+        self.quota_total: Optional[int] = None
+        self.advanced = False
+        self.success: Optional[bool] = None
+        self.error: Optional[str] = None
+        self.inter_chunk = Histogram()
+        self._clock = clock
+        self._start = clock()
+        self._last_chunk: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return self._clock() - self._start
+
+    def response_started(self, connect: Optional[float]) -> None:
+        """
+        收到响应头
+
+        Args:
+            connect: 这次请求新建连接的耗时(秒)，复用已有连接时为None
+        """
+        self.headers = self.elapsed()
+        self.first_byte = None
+        self.connect = connect
+        self.reused_connection = connect is None
+
+    def count_bytes(self, chunks):
+        # 包装原始字节块的迭代器，记录首字节时间和接收的字节数
+        for chunk in chunks:
+            if self.first_byte is None:
+                self.first_byte = self.elapsed()
+            self.bytes += len(chunk)
+            yield chunk
+
+    def count_events(self, events):
+        # 包装类型化事件的迭代器，记录接收的事件数
+        for event in events:
+            self.events += 1
+            yield event
+
+    def text(self) -> None:
+        """收到一段回答文本，记录首字时间和与上一段的间隔"""
+        now = self._clock()
+        if self._last_chunk is None:
+            self.first_token = now - self._start
+        else:
+            self.inter_chunk.observe(now - self._last_chunk)
+        self._last_chunk = now
+        self.chunks += 1
+
+    def retry(self) -> None:
+        """开始一次重试，之后的数据块间隔不包括重试前的等待"""
+        self.retries += 1
+        self._last_chunk = None
+
+    def finish(self, success: bool, error: Optional[str] = None, host: Optional[str] = None,
+               quota: Optional[tuple] = None) -> None:
+        """
+        请求结束
+
+        Args:
+            success: 是否成功
+            error: 错误信息
+            host: 返回响应的主机
+            quota: (剩余次数, 总次数, 是否高级模型额度)
+        """
+        self.total = self.elapsed()
+        self.success = success
+        self.error = error
+        self.host = host
+        if quota is not None:
+            self.quota_remain, self.quota_total, self.advanced = quota
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为结果JSON中的字典，时间单位为毫秒
+
+        Returns:
+            Dict[str, Any]: 指标
+        """
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "connect_ms": ms(self.connect),
+            "reused_connection": self.reused_connection,
+            "headers_ms": ms(self.headers),
+            "first_byte_ms": ms(self.first_byte),
+            "first_token_ms": ms(self.first_token),
+            "total_ms": ms(self.total),
+            "inter_chunk": self.inter_chunk.to_dict(),
+            "bytes_received": self.bytes,
+            "events_received": self.events,
+            "chunks": self.chunks,
+            "retries": self.retries,
+            "quota_remain": self.quota_remain,
+            "quota_total": self.quota_total,
+            "host": self.host,
+        }
+
+
+MetricsHook = Callable[[RequestMetrics], None]
+
+_hooks: List[MetricsHook] = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: MetricsHook) -> None:
+    """
+    注册指标钩子，每次请求结束时调用
+
+    Args:
+        hook: 接收RequestMetrics的函数，不应阻塞
+    """
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: MetricsHook) -> None:
+    """
+    移除指标钩子
+
+    Args:
+        hook: 已注册的钩子
+    """
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def emit(metrics: RequestMetrics) -> None:
+    """
+    把一次请求的指标交给所有钩子，钩子抛出的异常只记录日志
+
+    Args:
+        metrics: 请求指标
+    """
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(metrics)
+        except Exception as e:
+            logger.warning(f"指标钩子执行失败: {e}")
+
+
+class PrometheusExporter:
+    """
+    在内存中汇总请求指标，按Prometheus文本格式输出
+
+    作为指标钩子注册；按模型区分的指标只使用模型名称作为标签，标签组合数量有限
+    """
+
+    def __init__(self, prefix: str = "sider"):
+        """
+        初始化导出器
+
+        Args:
+            prefix: 指标名称前缀
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests: Dict[tuple, int] = {}           # (model, outcome) -> 请求数
+        self._counters: Dict[tuple, float] = {}         # (name, model) -> 累计值
+        self._histograms: Dict[tuple, Histogram] = {}   # (name, model) -> 直方图
+        self._quota: Dict[str, int] = {}                # 额度类型 -> 剩余次数
+
+    def _observe(self, name: str, model: str, value: Optional[float]) -> None:
+        if value is None:
+            return
+        histogram = self._histograms.get((name, model))
+        if histogram is None:
+            histogram = self._histograms[(name, model)] = Histogram()
+        histogram.observe(value)
+
+    def _add(self, name: str, model: str, value: float) -> None:
+        self._counters[(name, model)] = self._counters.get((name, model), 0) + value
+
+    def __call__(self, metrics: RequestMetrics) -> None:
+        model = metrics.model
+        outcome = "success" if metrics.success else "failure"
+        with self._lock:
+            self._requests[(model, outcome)] = self._requests.get((model, outcome), 0) + 1
+            self._observe("request_duration_seconds", model, metrics.total)
+            self._observe("time_to_first_byte_seconds", model, metrics.first_byte)
+            self._observe("time_to_first_token_seconds", model, metrics.first_token)
+            self._observe("connect_seconds", model, metrics.connect)
+            if metrics.inter_chunk.count:
+                key = ("inter_chunk_seconds", model)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram()
+                self._histograms[key].merge(metrics.inter_chunk)
+            self._add("received_bytes_total", model, metrics.bytes)
+            self._add("received_events_total", model, metrics.events)
+            self._add("retries_total", model, metrics.retries)
+            if metrics.reused_connection is not None:
+                self._add("connections_reused_total" if metrics.reused_connection
+                          else "connections_new_total", model, 1)
+            if metrics.quota_remain is not None:
+                self._quota["advanced" if metrics.advanced else "basic"] = metrics.quota_remain
+
+    def render(self) -> str:
+        """
+        输出Prometheus文本格式
+
+        Returns:
+            str: 指标文本
+        """
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for (model, outcome), count in sorted(self._requests.items()):
+                lines.append(f'{prefix}_requests_total{{model="{model}",outcome="{outcome}"}} {count}')
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for (counter, model), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{prefix}_{name}{{model="{model}"}} {value:g}')
+            names = sorted({name for name, _ in self._histograms})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                for (histogram_name, model), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else f"{bound:g}"
+                        lines.append(f'{prefix}_{name}_bucket{{model="{model}",le="{le}"}} {cumulative}')
+                    lines.append(f'{prefix}_{name}_sum{{model="{model}"}} {histogram.sum:g}')
+                    lines.append(f'{prefix}_{name}_count{{model="{model}"}} {histogram.count}')
+            if self._quota:
+                lines.append(f"# TYPE {prefix}_quota_remaining gauge")
+                for tier, remain in sorted(self._quota.items()):
+                    lines.append(f'{prefix}_quota_remaining{{tier="{tier}"}} {remain}')
+        return "\n".join(lines) + "\n"
+
+
+# 默认的导出器，汇总本进程的所有请求
+exporter = PrometheusExporter()
+add_hook(exporter)
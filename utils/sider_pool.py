@@ -0,0 +1,315 @@
+"""
+多凭据池
+保存多组token/cookie，根据流中解析到的剩余额度把每个请求分配给对应模型档位(普通/高级)余量最多的凭据，
+并限制每个凭据的并发请求数
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Generator, List, Optional, Sequence, Tuple
+
+from .sider_api import (SiderAPIClient, ChatRequest, ChatResponse, ErrorAction,
+                        classify_error, credential_key, get_client)
+from .sider_events import ServerMessage
+from .sider_session import ADVANCED_MODELS
+
+logger = logging.getLogger(__name__)
+
+# 额度耗尽的凭据在这段时间(秒)内不再分配该档位的请求，之后重新尝试(额度可能已经重置)
+EXHAUSTED_COOLDOWN = 600.0
+
+# 记住最近多少个对话上下文所属的凭据，上下文ID只在创建它的账号下有效
+AFFINITY_SIZE = 1024
+
+POOL_CACHE_SIZE = 8
+
+
+def is_advanced(model: str) -> bool:
+    """
+    判断模型是否消耗高级额度
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        bool: 是否为高级模型
+    """
+    return model in ADVANCED_MODELS
+
+
+class PooledCredential:
+    """凭据池中的一组凭据及其调度状态"""
+
+    def __init__(self, client: SiderAPIClient, max_concurrency: int):
+        self.client = client
+        self.key = credential_key(client.token, client.cookie)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.exhausted_until = {False: 0.0, True: 0.0}  # 档位 -> 额度耗尽的冷却结束时间
+
+    def remain(self, advanced: bool) -> Optional[int]:
+        """
+        获取最近一次请求后记录的剩余额度
+
+        Args:
+            advanced: 是否为高级模型档位
+
+        Returns:
+            Optional[int]: 剩余次数，还没有请求过时为None
+        """
+        session = self.client._base_session
+        if session is None:
+            return None
+        return session.advanced_remain if advanced else session.remain
+
+    def available(self, advanced: bool, now: float) -> bool:
+        return self.in_flight < self.max_concurrency and self.exhausted_until[advanced] <= now
+
+    def headroom(self, advanced: bool) -> float:
+        """
+        计算调度用的余量：剩余额度减去进行中的请求数。额度未知的凭据优先使用，以便尽快获取其额度
+
+        Args:
+            advanced: 是否为高级模型档位
+
+        Returns:
+            float: 余量
+        """
+        remain = self.remain(advanced)
+        if remain is None:
+            return float("inf")
+        return remain - self.in_flight
+
+
+class CredentialPool:
+    """
+    多凭据池，chat的用法与SiderAPIClient.chat相同
+
+    带context_id的请求交给创建该对话的凭据；额度耗尽(且还没有输出内容)时换用下一个凭据重试
+    """
+
+    def __init__(self, credentials: Sequence[Tuple[str, str]], max_concurrency: int = 2,
+                 acquire_timeout: float = 30.0):
+        """
+        初始化凭据池
+
+        Args:
+            credentials: (token, cookie)列表
+            max_concurrency: 每个凭据的最大并发请求数
+            acquire_timeout: 所有凭据都繁忙时最多等待的时间(秒)
+        """
+        if not credentials:
+            raise ValueError("凭据池至少需要一组凭据")
+        self.acquire_timeout = acquire_timeout
+        self.members: List[PooledCredential] = [
+            PooledCredential(get_client(token=token, cookie=cookie), max_concurrency)
+            for token, cookie in credentials
+        ]
+        self._affinity: "OrderedDict[str, PooledCredential]" = OrderedDict()  # context_id -> 凭据
+        self._cond = threading.Condition()
+
+    def _pick(self, advanced: bool, context_id: str, exclude: Sequence[PooledCredential],
+              now: float) -> Optional[PooledCredential]:
+        owner = self._affinity.get(context_id) if context_id else None
+        if owner is not None and owner not in exclude and owner.exhausted_until[advanced] <= now:
+            # 对话所属的凭据繁忙时等待它，而不是换一个无法继续该对话的凭据
+            return owner if owner.in_flight < owner.max_concurrency else None
+        best = None
+        for member in self.members:
+            if member in exclude or not member.available(advanced, now):
+                continue
+            if best is None or (member.headroom(advanced), -member.in_flight) > \
+                    (best.headroom(advanced), -best.in_flight):
+                best = member
+        return best
+
+    def acquire(self, model: str, context_id: str = "",
+                exclude: Sequence[PooledCredential] = ()) -> PooledCredential:
+        """
+        为请求分配一个凭据，所有凭据都繁忙时等待
+
+        Args:
+            model: 模型名称
+            context_id: 对话上下文ID
+            exclude: 不使用的凭据(已经因额度耗尽失败过)
+
+        Returns:
+            PooledCredential: 分配的凭据，使用后需要调用release
+
+        Raises:
+            Exception: 没有可用的凭据，或等待超时
+        """
+        advanced = is_advanced(model)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                member = self._pick(advanced, context_id, exclude, now)
+                if member is not None:
+                    member.in_flight += 1
+                    return member
+                if all(m in exclude or m.exhausted_until[advanced] > now for m in self.members):
+                    raise Exception(f"凭据池中所有凭据的{'高级' if advanced else '普通'}模型额度都已耗尽")
+                if now >= deadline or not self._cond.wait(deadline - now):
+                    raise Exception(f"等待可用凭据超时({self.acquire_timeout:.0f}秒)")
+
+    def release(self, member: PooledCredential, response: Optional[ChatResponse] = None,
+                model: str = "") -> None:
+        """
+        归还凭据，并根据响应更新对话归属和额度状态
+
+        Args:
+            member: acquire分配的凭据
+            response: 请求的最终响应
+            model: 模型名称
+        """
+        with self._cond:
+            member.in_flight -= 1
+            if response is not None:
+                advanced = is_advanced(model)
+                if response.success and response.context_id:
+                    self._affinity[response.context_id] = member
+                    self._affinity.move_to_end(response.context_id)
+                    while len(self._affinity) > AFFINITY_SIZE:
+                        self._affinity.popitem(last=False)
+                if (not response.success and is_quota_error(response.error)) or member.remain(advanced) == 0:
+                    member.exhausted_until[advanced] = time.monotonic() + EXHAUSTED_COOLDOWN
+                    logger.warning(f"凭据 {member.key[:8]} 的{'高级' if advanced else '普通'}模型额度已耗尽")
+            self._cond.notify_all()
+
+    def best_client(self, model: str) -> SiderAPIClient:
+        """
+        为非聊天请求(翻译、OCR、深度搜索)选择模型档位余量最多的凭据的客户端；
+        这些请求不经过chat，不占用并发名额，也不更新额度状态
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            SiderAPIClient: 客户端
+        """
+        advanced = is_advanced(model)
+        with self._cond:
+            now = time.monotonic()
+            members = [m for m in self.members if m.exhausted_until[advanced] <= now] or self.members
+            return max(members, key=lambda m: (m.headroom(advanced), -m.in_flight)).client
+
+    def chat(self, request: ChatRequest, streaming: bool = True,
+             **kwargs) -> Generator[str, None, ChatResponse]:
+        """
+        使用池中的凭据执行聊天请求，参数与SiderAPIClient.chat相同
+
+        Yields:
+            str: 响应文本块
+
+        Returns:
+            ChatResponse: 最终响应对象
+        """
+        tried: List[PooledCredential] = []
+        while True:
+            member = self.acquire(request.model, request.context_id or "", tried)
+            tried.append(member)
+            generator = member.client.chat(request, streaming, **kwargs)
+            response = None
+            has_output = False
+            try:
+                while True:
+                    try:
+                        chunk = next(generator)
+                    except StopIteration as stop:
+                        response = stop.value
+                        break
+                    has_output = True
+                    yield chunk
+            finally:
+                generator.close()
+                self.release(member, response, request.model)
+            if (response.success or has_output or not is_quota_error(response.error)
+                    or len(tried) >= len(self.members)):
+                return response
+            logger.info(f"凭据 {member.key[:8]} 额度不足，换用其他凭据重试")
+
+
+def is_quota_error(error: Optional[str]) -> bool:
+    """
+    判断失败的响应是否是额度耗尽造成的(按错误消息归类，与客户端的降级判断一致)
+
+    Args:
+        error: ChatResponse.error
+
+    Returns:
+        bool: 是否为额度耗尽
+    """
+    return bool(error) and classify_error(ServerMessage(0, error)) is ErrorAction.FALLBACK
+
+
+def parse_credentials(token: str, cookie: str) -> List[Tuple[str, str]]:
+    """
+    解析按行分隔的多组凭据。token和cookie按行一一对应；只有一个cookie时所有token共用
+
+    Args:
+        token: 一行一个token
+        cookie: 一行一个cookie
+
+    Returns:
+        List[Tuple[str, str]]: (token, cookie)列表
+
+    Raises:
+        ValueError: token和cookie的数量不匹配
+    """
+    tokens = [line.strip() for line in token.splitlines() if line.strip()]
+    cookies = [line.strip() for line in cookie.splitlines() if line.strip()]
+    if len(cookies) == 1:
+        cookies = cookies * len(tokens)
+    if not tokens:
+        raise ValueError("缺少Sider认证信息（token）")
+    if len(tokens) != len(cookies):
+        raise ValueError(f"token数量({len(tokens)})与cookie数量({len(cookies)})不一致")
+    return list(zip(tokens, cookies))
+
+
+def client_for(token: str, cookie: str, model: str) -> SiderAPIClient:
+    """
+    获取非聊天工具使用的客户端：单组凭据直接使用对应的客户端，多组凭据(每行一组)时从凭据池中选择
+
+    Args:
+        token: 一行一个token
+        cookie: 一行一个cookie
+        model: 模型名称
+
+    Returns:
+        SiderAPIClient: 客户端
+
+    Raises:
+        ValueError: token和cookie的数量不匹配
+    """
+    credentials = parse_credentials(token, cookie)
+    if len(credentials) > 1:
+        return get_pool(credentials).best_client(model)
+    return get_client(token=credentials[0][0], cookie=credentials[0][1])
+
+
+_pool_cache: "OrderedDict[Tuple[str, ...], CredentialPool]" = OrderedDict()
+_pool_cache_lock = threading.Lock()
+
+
+def get_pool(credentials: Sequence[Tuple[str, str]]) -> CredentialPool:
+    """
+    获取凭据列表对应的凭据池，相同凭据列表的调用共用同一个池(及其额度和并发状态)
+
+    Args:
+        credentials: (token, cookie)列表
+
+    Returns:
+        CredentialPool: 凭据池
+    """
+    key = tuple(credential_key(token, cookie) for token, cookie in credentials)
+    with _pool_cache_lock:
+        pool = _pool_cache.pop(key, None)
+        if pool is None:
+            pool = CredentialPool(credentials)
+        _pool_cache[key] = pool
+        while len(_pool_cache) > POOL_CACHE_SIZE:
+            _pool_cache.popitem(last=False)
+    return pool
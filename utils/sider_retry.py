@@ -0,0 +1,305 @@
+"""
+上游请求的重试策略和熔断器
+只在还没有向调用方输出内容时重试；退避时间带随机抖动，避免多个worker同时重试加重上游压力
+"""
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ProtocolError
+
+from .sider_deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504, 520, 521, 522, 523, 524))
+
+# Cloudflare验证页面的特征，出现在403/503响应中
+_CHALLENGE_MARKERS = ("Just a moment...", "cf-chl", "challenge-platform", "cf_chl_opt")
+
+
+class UpstreamError(Exception):
+    """上游返回了错误的HTTP状态码"""
+
+    def __init__(self, status: int, message: str = "", retry_after: Optional[float] = None,
+                 challenge: bool = False):
+        self.status = status
+        self.retry_after = retry_after  # Retry-After响应头(秒)
+        self.challenge = challenge      # 是否为Cloudflare验证页面
+        kind = "Cloudflare验证" if challenge else f"HTTP {status}"
+        super().__init__(f"{kind}: {message}" if message else kind)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求不发送直接失败"""
+
+    def __init__(self, host: str, retry_after: float):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"{host} 暂时不可用(熔断中)，{retry_after:.0f}秒后重试")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头，支持秒数和HTTP日期两种格式
+
+    Args:
+        value: 响应头的值
+
+    Returns:
+        Optional[float]: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def upstream_error(status: int, headers, text: str = "") -> UpstreamError:
+    """
+    根据错误响应构造UpstreamError
+
+    Args:
+        status: HTTP状态码
+        headers: 响应头(不区分大小写的映射)
+        text: 响应内容的开头部分
+
+    Returns:
+        UpstreamError: 上游错误
+    """
+    challenge = status in (403, 503) and (
+        headers.get("cf-mitigated") == "challenge" or any(marker in text for marker in _CHALLENGE_MARKERS))
+    # 验证页面是完整的HTML，只保留状态码即可；其他错误保留开头部分便于排查
+    message = "" if challenge else text[:256]
+    return UpstreamError(status, message, parse_retry_after(headers.get("Retry-After")), challenge)
+
+
+def is_transient(err: BaseException) -> bool:
+    """
+    判断错误是否是暂时性的(限流、服务端错误、Cloudflare验证、连接中断、建立连接或等待响应超时)
+
+    Args:
+        err: 异常
+
+    Returns:
+        bool: 是否值得重试
+    """
+    if isinstance(err, UpstreamError):
+        return err.status in RETRY_STATUSES or err.challenge
+    if isinstance(err, DeadlineExceeded):
+        return err.phase in ("connect", "first_byte")
+    # 异步会话把httpx的传输错误转换为内置的ConnectionError；
+    # 同步会话直接读取urllib3的响应，连接中断时抛出的是urllib3的ProtocolError
+    return isinstance(err, (ConnectionError, ProtocolError, requests.exceptions.ConnectionError,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+def is_host_failure(err: BaseException) -> bool:
+    """
+    判断错误是否说明主机本身异常(计入熔断器)。限流是针对凭据的，不算主机异常
+
+    Args:
+        err: 异常
+
+    Returns:
+        bool: 是否计入熔断器的失败次数
+    """
+    if isinstance(err, UpstreamError) and err.status == 429:
+        return False
+    return is_transient(err)
+
+
+class RetryPolicy:
+    """
+    重试策略：指数退避+完全随机抖动(full jitter)，遵守Retry-After，且不超过剩余的时间预算
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_retry_after: float = 30.0, rng: Callable[[], float] = random.random):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数(包括第一次请求)
+            base_delay: 第一次重试的最大退避时间(秒)
+            max_delay: 退避时间上限(秒)
+            max_retry_after: 最多遵守的Retry-After时间(秒)，超过时不再重试
+            rng: 返回[0, 1)随机数的函数
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self._rng = rng
+
+    def backoff(self, attempt: int) -> float:
+        """
+        计算第attempt次重试(从0开始)的退避时间
+
+        Args:
+            attempt: 已经重试的次数
+
+        Returns:
+            float: 退避时间(秒)
+        """
+        return self._rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+
+    def next_delay(self, err: BaseException, attempt: int,
+                   deadline: Optional[Deadline] = None) -> Optional[float]:
+        """
+        判断失败的请求是否重试，以及重试前的等待时间
+
+        Args:
+            err: 请求失败的异常
+            attempt: 已经重试的次数
+            deadline: 时间预算，等待后剩余时间不足时不再重试
+
+        Returns:
+            Optional[float]: 等待时间(秒)，不重试时返回None
+        """
+        if attempt + 1 >= self.max_attempts or not is_transient(err):
+            return None
+        delay = self.backoff(attempt)
+        retry_after = getattr(err, "retry_after", None)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        return delay if _fits(delay, deadline) else None
+
+    def backoff_within(self, attempt: int, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """
+        计算服务端限流消息(429等)重试前的退避时间，等待后剩余时间不足时不再重试
+
+        Args:
+            attempt: 已经重试的次数
+            deadline: 时间预算
+
+        Returns:
+            Optional[float]: 等待时间(秒)，不重试时返回None
+        """
+        delay = self.backoff(attempt)
+        return delay if _fits(delay, deadline) else None
+
+
+def _fits(delay: float, deadline: Optional[Deadline]) -> bool:
+    # 等待之后是否还够建立一次连接的时间
+    return deadline is None or deadline.remaining() - delay >= deadline.connect
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+
+    连续failure_threshold次暂时性失败后打开，reset_timeout秒内的请求直接失败；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开；
+    试探请求没有结论(如调用方的时间预算用完)时释放名额，由下一个请求重新试探
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化熔断器
+
+        Args:
+            host: 主机名
+            failure_threshold: 打开熔断器的连续失败次数
+            reset_timeout: 打开后等待多久(秒)放行试探请求
+            clock: 计时函数(秒)
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False  # 半开状态下是否已有试探请求
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """
+        请求前调用，熔断中时抛出异常
+
+        Returns:
+            bool: 这次请求是否为半开状态下的试探请求，是则请求结束时必须调用record_success、
+                record_failure或release之一
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下已有试探请求
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            waited = self._clock() - self._opened_at
+            if self.state == self.OPEN and waited >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logger.info(f"{self.host} 熔断器半开，放行试探请求")
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpenError(self.host, max(0.0, self.reset_timeout - waited))
+
+    def release(self) -> None:
+        """试探请求结束，但既没有成功也没有失败(如调用方的时间预算用完)，释放试探名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_success(self) -> None:
+        """请求成功(收到正常的响应头)"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.host} 恢复正常，关闭熔断器")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """请求出现暂时性失败"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.failures >= self.failure_threshold):
+                logger.warning(f"{self.host} 连续失败{self.failures}次，打开熔断器{self.reset_timeout:.0f}秒")
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """
+    返回url所在主机的熔断器，同一主机的所有请求共用
+
+    Args:
+        url: 请求地址
+
+    Returns:
+        CircuitBreaker: 熔断器
+    """
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
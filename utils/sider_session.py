@@ -2,22 +2,28 @@
 Sider AI Session核心实现
 从sider_ai_api包提取的核心功能，避免外部依赖
 """
-import sys
 import os
 import json
-import traceback
-import pprint
-import gzip
-import bz2
-import zlib
+import io
+import mimetypes
+import socket
+import threading
+import time
 from warnings import warn
-from urllib.parse import unquote
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import unquote, urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
 
-try:
-    import brotli  # 处理brotli压缩格式
-except ImportError:
-    brotli = None
+from . import sider_json
+from .sider_events import TextDelta, ServerMessage, DeepSearchStatus, QuotaUpdate
+from .sider_sse import DONE, is_ignorable, iter_events, parse_event
+from .sider_deadline import REQUEST_TIMEOUT, ensure_deadline
+from .sider_retry import UpstreamError, get_breaker, is_host_failure, upstream_error
+from .sider_hedge import hedged_events
 
 __version__ = "1.0.2"
 
@@ -72,6 +78,166 @@ ADVANCED_MODELS = ["gpt-4o",
                    ]
 
 
+# 连接池配置：每个主机一个requests.Session，所有Session/SiderAPIClient共享，复用keep-alive连接
+POOL_MAXSIZE = int(os.environ.get("SIDER_POOL_MAXSIZE", "16"))  # 每个主机保持的最大连接数
+
+_http_sessions = {}  # 主机名 -> requests.Session
+_http_lock = threading.Lock()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    # 记录建立连接的耗时，由pop_connect_time读取
+    connect_time = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.connect_time = time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    # 记录建立连接(含TLS握手)的耗时，由pop_connect_time读取
+    connect_time = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.connect_time = time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    # 连接池中的连接记录建立连接的耗时，用于请求指标
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool,
+                                                   "https": _TimedHTTPSConnectionPool}
+
+
+def pop_connect_time(resp):
+    # 返回这次请求新建连接的耗时(秒)，复用已有连接时返回None
+    conn = getattr(resp.raw, "connection", None)
+    seconds = getattr(conn, "connect_time", None)
+    if seconds is not None:
+        conn.connect_time = None
+    return seconds
+
+
+def _new_http_session():
+    http = requests.Session()
+    # 认证信息通过Cookie请求头显式传递，禁止共享的cookie jar保存响应中的Set-Cookie，
+    # 否则不同凭据之间会互相串用cookie
+    http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
+
+def get_http_session(url):
+    # 返回url所在主机的共享requests.Session，首次使用时创建
+    host = urlsplit(url).netloc
+    http = _http_sessions.get(host)
+    if http is None:
+        with _http_lock:
+            http = _http_sessions.get(host)
+            if http is None:
+                http = _http_sessions[host] = _new_http_session()
+    return http
+
+
+def configure_pool(maxsize):
+    # 修改每个主机的连接池大小。已有的连接池会被关闭，之后的请求使用新的大小重新建立
+    global POOL_MAXSIZE
+    POOL_MAXSIZE = maxsize
+    close_pool()
+
+
+def close_pool():
+    # 关闭所有共享连接
+    with _http_lock:
+        sessions = list(_http_sessions.values())
+        _http_sessions.clear()
+    for http in sessions:
+        http.close()
+
+
+def known(value, old):
+    # 额度字段没有返回(None)时保留旧值，0是有效的额度，不能用or回退
+    return old if value is None else value
+
+
+def render_event(event):
+    # 把类型化事件转换为原来的文本输出格式，额度更新等不输出的事件返回None
+    kind = type(event)
+    if kind is TextDelta:
+        return event.text
+    if kind is ServerMessage:
+        return "<Message: %s Code: %d>" % (event.msg, event.code)
+    if kind is DeepSearchStatus:
+        if event.field is None:
+            return f"<Status: {event.status}>\n"
+        return f"<Status: {event.status}: {event.field}>\n"
+    return None
+
+
+def iter_raw(resp, chunk_size=65536):
+    # 按到达顺序读取响应的原始字节块，收到多少处理多少，不等待凑满固定大小
+    raw = resp.raw
+    if raw.chunked or not hasattr(raw, "read1"):
+        # 分块传输时每次返回一个完整的HTTP块
+        yield from resp.iter_content(chunk_size=None if raw.chunked else 512)
+        return
+    while True:
+        data = raw.read1(chunk_size, decode_content=True)
+        if not data:
+            break
+        yield data
+
+
+def _is_read_timeout(err):
+    # iter_content把urllib3的ReadTimeoutError包装成requests的ConnectionError
+    if isinstance(err, (ReadTimeoutError, socket.timeout, requests.exceptions.Timeout)):
+        return True
+    return isinstance(err, requests.exceptions.ConnectionError) and bool(err.args) \
+        and isinstance(err.args[0], ReadTimeoutError)
+
+
+def iter_raw_until(resp, deadline, chunk_size=65536):
+    # 在时间预算内读取原始字节块：首个数据块受first_byte限制，之后每个数据块受idle限制，
+    # 同时都不超过剩余的总时间。通过修改底层socket的超时实现，取不到socket时只能在数据块之间检查
+    conn = getattr(resp.raw, "connection", None)
+    sock = getattr(conn, "sock", None)
+    phase = "first_byte"
+    current = None
+    chunks = iter_raw(resp, chunk_size)
+    while True:
+        timeout = deadline.timeout(phase)
+        if sock is not None and timeout != current:
+            try:
+                sock.settimeout(timeout)
+                current = timeout
+            except OSError:
+                sock = None
+        try:
+            data = next(chunks)
+        except StopIteration:
+            return
+        except Exception as err:
+            if _is_read_timeout(err):
+                raise deadline.exceeded(phase) from err
+            raise
+        yield data
+        phase = "idle"
+
+
 def normpath(path):
     # 重写os.path.normpath。规范化Windows路径，如去除两端的双引号等
     path = os.path.normpath(path).strip('"')
@@ -96,33 +262,180 @@ def parse_cookie(cookie):
     return cookie_dict
 
 
-def upload_image(filename, header):
+UPLOAD_CHUNK_SIZE = 65536
+
+
+class MultipartBody:
+    # 流式的multipart/form-data请求体，只包含一个文件字段：文件内容逐块读取发送，不整体读入内存。
+    # 提供长度，requests据此设置Content-Length(不使用chunked编码)
+    def __init__(self, field, filename, content_type, fileobj, size, chunk_size=UPLOAD_CHUNK_SIZE):
+        boundary = os.urandom(16).hex()
+        self.content_type = "multipart/form-data; boundary=" + boundary
+        filename = filename.replace('"', "%22").replace("\r", "").replace("\n", "")
+        self._head = (f"--{boundary}\r\n"
+                      f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                      f"Content-Type: {content_type}\r\n\r\n").encode("utf-8")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+        self._fileobj = fileobj
+        self._size = size
+        self._chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self._head) + self._size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        remaining = self._size
+        while remaining > 0:
+            chunk = self._fileobj.read(min(self._chunk_size, remaining))
+            if not chunk:
+                raise IOError(f"上传的文件比声明的长度短{remaining}字节")
+            remaining -= len(chunk)
+            yield chunk
+        yield self._tail
+
+
+def open_upload(source):
+    # 把要上传的文件转换为(文件对象, 长度, 文件名, MIME类型)
+    # source可以是文件路径、bytes、可读的二进制文件对象、(文件对象, 长度)，
+    # 或返回以上之一的函数(每次上传重新打开，重试时使用)
+    if callable(source):
+        source = source()
+    if isinstance(source, tuple):
+        return source[0], source[1], None, None
+    if isinstance(source, (str, os.PathLike)):
+        name = os.path.basename(source)
+        fileobj = open(source, "rb")
+        return fileobj, os.fstat(fileobj.fileno()).st_size, name, mimetypes.guess_type(name)[0]
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source), len(source), None, None
+    name = getattr(source, "name", None)
+    name = os.path.basename(name) if isinstance(name, str) else None
+    try:
+        start = source.tell()
+        size = source.seek(0, os.SEEK_END) - start
+        source.seek(start)
+    except (AttributeError, OSError):
+        data = source.read()  # 不能定位的流只能整体读取以获得长度
+        return io.BytesIO(data), len(data), name, None
+    return source, size, name, None
+
+
+def upload_image(filename, header, name=None, content_type=None):
+    # 上传图片，返回接口的JSON结果。filename为open_upload支持的文件来源；
+    # name和content_type为上传使用的文件名和MIME类型，为空时根据文件来源推断
     url = "https://api1.sider.ai/api/v1/imagechat/upload"
-    header = header.copy()
-    with open(filename, 'rb') as img:
-        files = {'file': ("ocr.jpg", img, 'application/octet-stream')}  # file 应与API要求的字段名一致
-        response = requests.post(url, headers=header, files=files)
-        if response.status_code != 200:
-            # respose.text可能过长 (如果遇到了Cloudflare验证等)，因此截取前1024个字符
-            raise Exception({"error": response.status_code, "message": response.text[:1024]})
-    coding = response.headers.get('Content-Encoding')
-    if not response.content.startswith(b"{") and coding is not None:
-        decompress = None
-        if coding == 'deflate':
-            decompress = zlib.decompress
-        elif coding == 'gzip':
-            decompress = gzip.decompress
-        elif coding == 'bzip2':
-            decompress = bz2.decompress
-        elif brotli is not None and coding == 'br':
-            decompress = brotli.decompress
-        data = decompress(response.content)
-    else:
-        data = response.content
-    return json.loads(data.decode("utf-8"))
+    fileobj, size, guessed_name, guessed_type = open_upload(filename)
+    name = name or guessed_name or "image.jpg"
+    content_type = content_type or guessed_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+    try:
+        body = MultipartBody("file", name, content_type, fileobj, size)  # file 应与API要求的字段名一致
+        header = header.copy()
+        header["Content-Type"] = body.content_type
+        response = get_http_session(url).post(url, headers=header, data=body, timeout=REQUEST_TIMEOUT)
+    finally:
+        fileobj.close()
+    if response.status_code != 200:
+        # respose.text可能过长 (如果遇到了Cloudflare验证等)，因此截取前1024个字符
+        raise upstream_error(response.status_code, response.headers, response.text[:1024])
+    return response.json()  # 压缩的响应由urllib3按Content-Encoding解压
+
+
+class Payload(dict):
+    # 已序列化的请求体：字典中只有每次请求不同的字段(解析响应时读取model、stream)，
+    # body为包含固定字段的完整JSON，get_events直接发送body，不再由requests序列化
+    __slots__ = ("body",)
+
+
+class PayloadTemplate:
+    # 接口请求体模板：固定字段在创建时序列化一次，render只序列化每次请求不同的字段，再与固定部分拼接。
+    # 可变字段不能与固定字段重名；fixed在创建后不应修改
+    __slots__ = ("fixed", "_fixed")
+
+    def __init__(self, fixed):
+        self.fixed = fixed
+        self._fixed = sider_json.dumps(fixed)[1:-1]  # 去掉两边的花括号
+
+    def render(self, **fields):
+        payload = Payload(fields)
+        body = sider_json.dumps(fields)
+        if self._fixed:
+            body = body[:-1] + b"," + self._fixed + b"}" if fields else b"{" + self._fixed + b"}"
+        payload.body = body
+        return payload
+
+
+EXTRA_INFO = {
+    "origin_url": ORIGIN + "/standalone.html",
+    "origin_title": "Sider"
+}
+
+# 各接口请求体的固定部分，模块导入时序列化一次
+CHAT_TEMPLATE = PayloadTemplate({
+    "app_name": APP_NAME,
+    "app_version": APP_VERSION,
+    "tz_name": TIMEZONE,
+    "search": False,
+    "auto_search": False,
+    "filter_search_history": False,
+    "from": "chat",
+    "group_id": "default",
+    "chat_models": [],
+    "files": [],
+    "extra_info": EXTRA_INFO
+})
+OCR_TEMPLATE = PayloadTemplate({
+    "prompt": "ocr",
+    "app_name": APP_NAME,
+    "app_version": APP_VERSION,
+    "tz_name": TIMEZONE,
+    "from": "ocr",
+    "ocr_option": {
+        "force_ocr": True,
+        "use_azure": False
+    },
+    "tools": {},
+    "extra_info": EXTRA_INFO
+})
+TRANSLATE_TEMPLATE = PayloadTemplate({
+    "prompt": "",
+    "app_name": APP_NAME,
+    "app_version": APP_VERSION,
+    "tz_name": TIMEZONE,
+    "from": "translate",
+    "tools": {
+        "force": "reader"
+    },
+    "extra_info": EXTRA_INFO
+})
+SEARCH_TEMPLATE = PayloadTemplate({
+    "app_name": APP_NAME,
+    "app_version": APP_VERSION,
+    "tz_name": TIMEZONE,
+    "from": "deepsearch",
+    "tools": {},
+    "extra_info": EXTRA_INFO
+})
+
+# 聊天请求的prompt_templates和tools的取值组合有限，预先构建，请求间共享(只读)
+ARTIFACT_PROMPT = {"key": "artifacts", "attributes": {"lang": "original"}}  # 在artifact的新窗口中显示结果
+THINKING_PROMPT = {"key": "thinking_mode", "attributes": {}}
+_PROMPT_TEMPLATES = {
+    (artifact, thinking): tuple(prompt for prompt, enabled in ((ARTIFACT_PROMPT, artifact),
+                                                               (THINKING_PROMPT, thinking)) if enabled)
+    for artifact in (False, True) for thinking in (False, True)
+}
+_AUTO_TOOLS = {
+    (data_analysis, search, text_to_image): {"auto": tuple(tool for tool, enabled in (
+        ("data_analysis", data_analysis), ("search", search), ("artifact", text_to_image)) if enabled)}
+    for data_analysis in (False, True) for search in (False, True) for text_to_image in (False, True)
+}
 
 
 class Session:
+    response = None  # 进行中的流式响应，abort()从其他线程关闭
+    aborted = False  # 已被abort()中止
+
     def __init__(self, token=None, context_id="", cookie=None, update_info_at_init=True):
         if token is None:
             if cookie is None:
@@ -141,6 +454,7 @@ class Session:
             if token.startswith("Bearer "):
                 token = token[7:]  # token不包含头部的Bearer
         self.context_id = context_id
+        self.host = None  # 最近一次请求实际使用的主机
         self.total = self.remain = None  # 总/剩下调用次数
         self.advanced_total = self.advanced_remain = None  # 高级模型的调用次数
         self.header = HEADER.copy()
@@ -148,12 +462,25 @@ class Session:
         if cookie is None:
             cookie = COOKIE_TEMPLATE.format(token=token)
         self.header['Cookie'] = cookie
+        self.json_header = {**self.header, "content-type": "application/json"}  # 发送JSON请求体时使用
         if update_info_at_init:
             try:
                 self.update_userinfo()
             except Exception as err:
                 warn(f"Failed to get user info ({type(err).__name__}): {err}")
 
+    def fork(self, context_id=""):
+        # 基于当前会话创建新会话：复用已构建的认证请求头和额度信息，跳过cookie解析
+        # 请求头在会话间共享，各方法只读不写(需要修改时先copy)
+        session = Session.__new__(type(self))
+        session.context_id = context_id
+        session.host = None
+        session.total, session.remain = self.total, self.remain
+        session.advanced_total, session.advanced_remain = self.advanced_total, self.advanced_remain
+        session.header = self.header
+        session.json_header = self.json_header
+        return session
+
     def update_userinfo(self):
         url = "https://api3.sider.ai/api/v1/completion/limit/user"
         params = {
@@ -161,206 +488,234 @@ class Session:
             "app_version": APP_VERSION,
             "tz_name": TIMEZONE
         }
-        response = requests.get(url, params=params, headers=self.header)
+        response = get_http_session(url).get(url, params=params, headers=self.header,
+                                             timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         data = response.json()
-        self.total = data["data"]["basic_credit"]["count"] or self.total
-        self.remain = data["data"]["basic_credit"]["remain"] or self.remain
-        self.advanced_total = data["data"]["advanced_credit"]["count"] or self.advanced_total
-        self.advanced_remain = data["data"]["advanced_credit"]["remain"] or self.advanced_remain
+        self.total = known(data["data"]["basic_credit"]["count"], self.total)
+        self.remain = known(data["data"]["basic_credit"]["remain"], self.remain)
+        self.advanced_total = known(data["data"]["advanced_credit"]["count"], self.advanced_total)
+        self.advanced_remain = known(data["data"]["advanced_credit"]["remain"], self.advanced_remain)
 
-    def get_text(self, url, header, payload, deep_search=False):
-        # 一个生成器，获取输出结果
-        resp = requests.post(url, headers=header, json=payload, stream=True)
-        resp.raise_for_status()
-        for line_raw in resp.iter_lines():
-            if not line_raw.strip():
-                continue
-            try:
-                # 解析每一行的数据
-                line = line_raw.decode("utf-8")
-                if payload.get("stream", True):
-                    if not line.startswith("data:"):
-                        continue
-                    response = line[5:]  # 去掉前缀 "data:"
+    def _handle_data(self, data, payload, deep_search=False):
+        # 处理一个已解析的事件，更新上下文和额度信息，生成类型化事件
+        msg = data["msg"]
+        if msg and msg.strip():
+            yield ServerMessage(data.get("code", 0), msg)
+        inner = data["data"]
+        if inner is None:
+            return
+        if "text" in inner:
+            self.context_id = inner.get("cid", "") or self.context_id  # 对话上下文
+            total, remain = inner.get("total"), inner.get("remain")
+            if total is not None or remain is not None:
+                if payload.get("model") in ADVANCED_MODELS:
+                    old = self.advanced_total, self.advanced_remain
+                    self.advanced_total = known(total, self.advanced_total)
+                    self.advanced_remain = known(remain, self.advanced_remain)
+                    if old != (self.advanced_total, self.advanced_remain):
+                        yield QuotaUpdate(self.advanced_total, self.advanced_remain, True)
                 else:
-                    response = line
-
-                if not response:
-                    continue  # 确保数据非空
-                if response == "[DONE]":
-                    break
-                data = json.loads(response)
-
-                if data["msg"].strip():
-                    yield "<Message: %s Code: %d>" % (data["msg"], data["code"])
-                if data["data"] is None:
-                    continue
-                if "text" in data["data"]:
-                    self.context_id = data["data"].get("cid", "") or self.context_id  # 对话上下文
-                    if payload.get("model") in ADVANCED_MODELS:
-                        self.advanced_total = data["data"].get("total", None) or self.advanced_total
-                        self.advanced_remain = data["data"].get("remain", None) or self.advanced_remain
-                    else:
-                        self.total = data["data"].get("total", None) or self.total  # or: 保留旧的self.total
-                        self.remain = data["data"].get("remain", None) or self.remain
-                    yield data["data"]["text"]  # 返回文本响应
-
-                if deep_search and "deep_search" in data["data"]:
-                    search = data["data"]["deep_search"]
-                    if search["status"] == "answering":
-                        yield search["field"].get("answer_fragment", "")
-                    elif "field" in search:
-                        field = str(search['field'])
-                        if len(field) >= 128:
-                            field = pprint.pformat(search['field'])
-                        yield f"<Status: {search['status']}: {field}>\n"
-                    else:
-                        yield f"<Status: {search['status']}>\n"
-            except Exception as err:
-                warn(f"Error processing stream ({type(err).__name__}): {err} Raw: {line_raw}")
+                    old = self.total, self.remain
+                    self.total = known(total, self.total)  # 没有返回时保留旧值，0是有效的额度
+                    self.remain = known(remain, self.remain)
+                    if old != (self.total, self.remain):
+                        yield QuotaUpdate(self.total, self.remain, False)
+            yield TextDelta(inner["text"])  # 返回文本响应
 
-    def chat(self, prompt, model="gpt-4o-mini",
-             stream=True, output_lang=None, thinking_mode=False,
-             data_analysis=True, search=False,
-             text_to_image=False, artifact=True):
-        # 使用提示词调用AI，返回结果的字符串生成器(如果参数stream为True，默认)
-        # 或结果字符串(如果stream为False)
-        auto_tools = []
-        if data_analysis:
-            auto_tools.append("data_analysis")
-        if search:
-            auto_tools.append("search")
-        if text_to_image:
-            auto_tools.append("artifact")
+        if deep_search and "deep_search" in inner:
+            search = inner["deep_search"]
+            if search["status"] == "answering":
+                yield TextDelta(search["field"].get("answer_fragment", ""))
+            else:
+                yield DeepSearchStatus(search["status"], search.get("field"))
+
+    def _event_items(self, data, payload, deep_search=False):
+        # 处理一个事件数据，返回其中的类型化事件。同步和异步会话共用
+        if is_ignorable(data):
+            return ()  # 没有输出内容且msg为空的事件不做JSON解析
+        try:
+            return [event for item in parse_event(data, sider_json.loads)
+                    for event in self._handle_data(item, payload, deep_search)]
+        except Exception as err:
+            warn(f"Error processing stream ({type(err).__name__}): {err} Raw: {data[:256]!r}")
+            return ()
+
+    def _iter_events(self, chunks, payload, deep_search=False):
+        # 从原始字节块中增量解码，生成类型化事件
+        for data in iter_events(chunks, raw=not payload.get("stream", True)):
+            if data == DONE:
+                break
+            yield from self._event_items(data, payload, deep_search)
+
+    def get_events(self, url, header, payload, deep_search=False, deadline=None, metrics=None):
+        # 一个生成器，获取类型化的输出事件。deadline为时间预算，为空时使用默认预算
+        # metrics为请求指标(sider_metrics.RequestMetrics)，不为空时记录连接耗时、接收的字节数和事件数
+        # 错误状态码抛出UpstreamError；主机的熔断器打开时抛出CircuitOpenError，不发送请求
+        deadline = ensure_deadline(deadline)
+        timeout = deadline.requests_timeout()  # 时间预算已经用完时直接失败，不占用熔断器的试探名额
+        breaker = get_breaker(url)
+        probe = breaker.check()
+        resp = None
+        try:
+            try:
+                body = getattr(payload, "body", None)  # Payload已经序列化，普通字典由requests序列化
+                resp = get_http_session(url).post(url, headers=header, data=body,
+                                                  json=payload if body is None else None, stream=True,
+                                                  timeout=timeout)
+            except requests.exceptions.ConnectTimeout as err:
+                raise deadline.exceeded("connect") from err
+            except requests.exceptions.ReadTimeout as err:
+                raise deadline.exceeded("first_byte") from err
+            self.response = resp
+            if self.aborted:
+                return  # 连接建立期间已被中止
+            if metrics is not None:
+                metrics.response_started(pop_connect_time(resp))
+            if resp.status_code >= 400:
+                # 错误响应可能是很长的HTML(如Cloudflare验证页面)，只读取开头部分
+                text = next(resp.iter_content(1024), b"").decode("utf-8", "replace")
+                raise upstream_error(resp.status_code, resp.headers, text)
+            breaker.record_success()
+            self.host = urlsplit(url).netloc
+            if metrics is None:
+                yield from self._iter_events(iter_raw_until(resp, deadline), payload, deep_search)
+            else:
+                chunks = metrics.count_bytes(iter_raw_until(resp, deadline))
+                yield from metrics.count_events(self._iter_events(chunks, payload, deep_search))
+        except Exception as err:
+            if self.aborted:
+                raise  # 主动中止导致的读取错误不计入熔断器
+            if is_host_failure(err):
+                breaker.record_failure()
+            elif isinstance(err, UpstreamError):
+                breaker.record_success()  # 主机正常响应了(如401、429)
+            raise
+        finally:
+            if probe:
+                breaker.release()  # 试探请求没有得到结论时(如空闲超时)释放名额，已记录结果时不做处理
+            if resp is not None:
+                self.response = None
+                resp.close()  # 连接归还连接池；提前结束时丢弃未读完的连接
+
+    def abort(self):
+        # 从其他线程中止进行中的请求(如对冲请求中落选的请求)：关闭连接，阻塞在读取中的线程随即结束，
+        # 不必等到下一个事件。还没有建立连接时，建立后直接结束
+        self.aborted = True
+        resp = self.response
+        if resp is not None:
+            shutdown = getattr(resp.raw, "shutdown", None)  # urllib3>=2.3，能打断其他线程中阻塞的读取
+            if shutdown is not None:
+                shutdown()
+            else:
+                resp.close()
 
+    def get_text(self, url, header, payload, deep_search=False, deadline=None, metrics=None):
+        # 一个生成器，获取输出结果
+        return self._render(self.get_events(url, header, payload, deep_search, deadline, metrics))
+
+    def _render(self, events):
+        # 把类型化事件转换为输出文本
+        for event in events:
+            text = render_event(event)
+            if text is not None:
+                yield text
+
+    def _chat_request(self, prompt, model="gpt-4o-mini",
+                      stream=True, output_lang=None, thinking_mode=False,
+                      data_analysis=True, search=False,
+                      text_to_image=False, artifact=True):
+        # 构建聊天请求，返回(url, header, payload)，同步和异步会话共用
+        # 固定字段来自CHAT_TEMPLATE，这里只序列化每次请求不同的字段
         url = "https://sider.ai/api/v3/completion/text"
-        header = self.header.copy()
-        header["content-type"] = 'application/json'
-        payload = {
+        fields = {
             "prompt": prompt,
             "stream": stream,
-            "app_name": APP_NAME,
-            "app_version": APP_VERSION,
-            "tz_name": TIMEZONE,
             "cid": self.context_id,  # 对话上下文id，如果为空则开始新对话
             "model": model,
-            "search": False,
-            "auto_search": False,
-            "filter_search_history": False,
-            "from": "chat",
-            "group_id": "default",
-            "chat_models": [],
-            "files": [],
-            "prompt_templates": [],
-            "tools": {"auto": auto_tools},
-            "extra_info": {
-                "origin_url": ORIGIN + "/standalone.html",
-                "origin_title": "Sider"
-            }
+            "prompt_templates": _PROMPT_TEMPLATES[bool(artifact), bool(thinking_mode)],
+            "tools": _AUTO_TOOLS[bool(data_analysis), bool(search), bool(text_to_image)],
         }
-        if artifact:  # 在artifact的新窗口中显示结果
-            payload["prompt_templates"].append(
-                {"key": "artifacts", "attributes": {"lang": "original"}}
-            )
-        if thinking_mode:
-            payload["prompt_templates"].append(
-                {"key": "thinking_mode", "attributes": {}}
-            )
         if output_lang is not None:  # 模型输出语言，如"en","zh-CN"
-            payload["output_language"] = output_lang
+            fields["output_language"] = output_lang
+        return url, self.json_header, CHAT_TEMPLATE.render(**fields)
+
+    def chat(self, prompt, model="gpt-4o-mini",
+             stream=True, output_lang=None, thinking_mode=False,
+             data_analysis=True, search=False,
+             text_to_image=False, artifact=True, typed=False, deadline=None, hedge=None, metrics=None):
+        # 使用提示词调用AI，返回结果的字符串生成器(如果参数stream为True，默认)
+        # 或结果字符串(如果stream为False)
+        # typed为True时返回类型化事件(TextDelta、ServerMessage等)的生成器，stream只决定上游是否流式返回
+        # deadline为时间预算(sider_deadline.Deadline)，为空时使用默认预算
+        # hedge为对冲配置(sider_hedge.HedgeConfig)，为空时不发送对冲请求
+        # metrics为请求指标(sider_metrics.RequestMetrics)；对冲请求时同时有多个上游请求，不记录连接和字节数
+        url, header, payload = self._chat_request(
+            prompt, model=model, stream=stream, output_lang=output_lang,
+            thinking_mode=thinking_mode, data_analysis=data_analysis, search=search,
+            text_to_image=text_to_image, artifact=artifact)
+        if hedge is not None:
+            events = hedged_events(self, url, header, payload, deadline=deadline, config=hedge)
+        else:
+            events = self.get_events(url, header, payload, deadline=deadline, metrics=metrics)
+        if typed:
+            return events
 
         if stream:
-            return self.get_text(url, header, payload)
+            return self._render(events)
         else:
-            return "".join(self.get_text(url, header, payload))
+            return "".join(self._render(events))
 
-    def ocr(self, filename, model="gemini-2.0-flash", stream=True):
-        # 一个生成器，调用OCR并返回结果
-        data = upload_image(filename, self.header)
-        img_id = data["data"]["id"]
+    def _ocr_request(self, img_id, model, stream):
+        # 构建识别已上传图片的请求，返回(url, payload)，同步和异步会话共用
         url = "https://api2.sider.ai/api/v2/completion/text"
-        payload = {
-            "prompt": "ocr",
-            "stream": stream,
-            "app_name": APP_NAME,
-            "app_version": APP_VERSION,
-            "tz_name": TIMEZONE,
-            "cid": self.context_id,
-            "model": model,
-            "from": "ocr",
-            "image_id": img_id,
-            "ocr_option": {
-                "force_ocr": True,
-                "use_azure": False
-            },
-            "tools": {},
-            "extra_info": {
-                "origin_url": ORIGIN + "/standalone.html",
-                "origin_title": "Sider"
-            }
-        }
+        return url, OCR_TEMPLATE.render(stream=stream, cid=self.context_id, model=model, image_id=img_id)
+
+    def ocr(self, filename, model="gemini-2.0-flash", stream=True, typed=False, deadline=None,
+            name=None, content_type=None):
+        # 上传图片并调用OCR，返回结果的字符串生成器；typed和deadline的含义与chat相同
+        # filename为open_upload支持的文件来源，name和content_type为上传使用的文件名和MIME类型
+        data = upload_image(filename, self.header, name=name, content_type=content_type)
+        url, payload = self._ocr_request(data["data"]["id"], model, stream)
+        if typed:
+            return self.get_events(url, self.json_header, payload, deadline=deadline)
         if stream:
-            return self.get_text(url, self.header, payload)
+            return self.get_text(url, self.json_header, payload, deadline=deadline)
         else:
-            return "".join(self.get_text(url, self.header, payload))
+            return "".join(self.get_text(url, self.json_header, payload, deadline=deadline))
 
-    def translate(self, content, target_lang="English", model="gpt-4o-mini", stream=True):
+    def translate(self, content, target_lang="English", model="gpt-4o-mini", stream=True,
+                  typed=False, deadline=None):
+        # 使用translate-basic提示词模板翻译content；typed和deadline的含义与chat相同
         url = "https://api3.sider.ai/api/v2/completion/text"
-        payload = {
-            "prompt": "",
-            "stream": stream,
-            "app_name": APP_NAME,
-            "app_version": APP_VERSION,
-            "tz_name": TIMEZONE,
-            "model": model,
-            "from": "translate",
-            "prompt_template": {
-                "key": "translate-basic",
-                "attributes": {
-                    "input": content,
-                    "target_lang": target_lang  # 目标语言名称，如"English"或"Chinese (Simplified)"
-                }
-            },
-            "tools": {
-                "force": "reader"
-            },
-            "extra_info": {
-                "origin_url": ORIGIN + "/standalone.html",
-                "origin_title": "Sider"
+        payload = TRANSLATE_TEMPLATE.render(stream=stream, model=model, prompt_template={
+            "key": "translate-basic",
+            "attributes": {
+                "input": content,
+                "target_lang": target_lang  # 目标语言名称，如"English"或"Chinese (Simplified)"
             }
-        }
+        })
+        if typed:
+            return self.get_events(url, self.json_header, payload, deadline=deadline)
         if stream:
-            return self.get_text(url, self.header, payload)
+            return self.get_text(url, self.json_header, payload, deadline=deadline)
         else:
-            return "".join(self.get_text(url, self.header, payload))
+            return "".join(self.get_text(url, self.json_header, payload, deadline=deadline))
 
-    def search(self, content, model="gpt-4o-mini", stream=True, focus=None):
+    def search(self, content, model="gpt-4o-mini", stream=True, focus=None, typed=False, deadline=None):
         # focus为字符串列表，包含搜索网站的域名，如"wikipedia.org"或"youtube.com"等
+        # typed为True时返回类型化事件(回答片段为TextDelta，进度为DeepSearchStatus)，deadline的含义与chat相同
         url = "https://api3.sider.ai/api/v2/completion/text"
-        payload = {
-            "prompt": content,
-            "stream": stream,
-            "app_name": APP_NAME,
-            "app_version": APP_VERSION,
-            "tz_name": TIMEZONE,
-            "model": model,
-            "from": "deepsearch",
-            "deep_search": {
-                "enable": True
-            },
-            "tools": {},
-            "extra_info": {
-                "origin_url": ORIGIN + "/standalone.html",
-                "origin_title": "Sider"
-            }
-        }
+        deep_search = {"enable": True}
         if focus:
-            payload["deep_search"]["focus"] = focus
+            deep_search["focus"] = focus
+        payload = SEARCH_TEMPLATE.render(prompt=content, stream=stream, model=model, deep_search=deep_search)
+        if typed:
+            return self.get_events(url, self.json_header, payload, deep_search=True, deadline=deadline)
         if stream:
-            return self.get_text(url, self.header, payload, deep_search=True)
+            return self.get_text(url, self.json_header, payload, deep_search=True, deadline=deadline)
         else:
-            return "".join(self.get_text(url, self.header, payload, deep_search=True))
+            return "".join(self.get_text(url, self.json_header, payload, deep_search=True, deadline=deadline))
 
     def improve_grammar(self, content, model="gpt-4o-mini"):
         url = "https://api3.sider.ai/api/v1/completion/improve_writing"
@@ -0,0 +1,165 @@
+"""
+增量式SSE(Server-Sent Events)解码器
+直接处理网络收到的原始字节块，不需要先按行解码成字符串
+"""
+import re
+from typing import List
+
+DONE = b"[DONE]"
+
+# 事件中只有这些字段会产生输出，其余事件(msg为空时)可以跳过完整的JSON解析
+_TEXT_KEY = b'"text"'
+_DEEP_SEARCH_KEY = b'"deep_search"'
+_EMPTY_MSG = (b'"msg":""', b'"msg": ""')
+
+# 只匹配行首的data字段，注释行或其他字段中间出现的"data:"不算
+_DATA_LINE = re.compile(rb"^data: ?([^\n]*)\n\n", re.MULTILINE)
+
+
+class SSEDecoder:
+    """
+    SSE增量解码器
+
+    每次feed一个网络数据块，返回其中已经完整的事件数据(bytes)。
+    事件可以跨数据块，多行data:按SSE规范用换行连接；支持\\n和\\r\\n换行。
+    raw为True时不要求data:前缀，每个非空行即为一个事件(非流式响应)
+    """
+
+    __slots__ = ("_buffer", "_data", "_raw")
+
+    def __init__(self, raw: bool = False):
+        self._buffer = b""
+        self._data: List[bytes] = []  # 当前事件已收到的data行
+        self._raw = raw
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        输入一个数据块
+
+        Args:
+            chunk: 网络收到的原始字节
+
+        Returns:
+            List[bytes]: 已完整接收的事件数据
+        """
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            # 末尾的\r可能是被切开的\r\n，留到下一个数据块再处理
+            if buffer.endswith(b"\r"):
+                self._buffer = buffer
+                return []
+            buffer = buffer.replace(b"\r\n", b"\n")
+        if self._raw:
+            lines = buffer.split(b"\n")
+            self._buffer = lines.pop()
+            return [line for line in lines if line.strip()]
+
+        # 最后一个空行之前都是完整事件，之后的部分留到下一个数据块
+        end = buffer.rfind(b"\n\n")
+        if end < 0:
+            self._buffer = buffer
+            return []
+        end += 2
+        head, self._buffer = buffer[:end], buffer[end:]
+        if not self._data:
+            # 常见情况：每个事件只有一行data，用正则整批取出；
+            # 换行数不等于事件数的两倍说明有多行事件、注释或其他字段，交给逐行处理
+            events = _DATA_LINE.findall(head)
+            if head.count(b"\n") == 2 * len(events):
+                return events if all(events) else [event for event in events if event]
+        events = []
+        for line in head.split(b"\n")[:-1]:
+            if line:
+                self._line(line)
+            else:
+                self._dispatch(events)
+        return events
+
+    def flush(self) -> List[bytes]:
+        """
+        输入结束，返回缓冲区中剩余的事件
+
+        Returns:
+            List[bytes]: 剩余的事件数据
+        """
+        events = []
+        buffer, self._buffer = self._buffer.replace(b"\r\n", b"\n").rstrip(b"\r"), b""
+        if self._raw:
+            return [line for line in buffer.split(b"\n") if line.strip()]
+        for line in buffer.split(b"\n"):
+            if line:
+                self._line(line)
+            else:
+                self._dispatch(events)
+        self._dispatch(events)
+        return events
+
+    def _line(self, line: bytes) -> None:
+        if line.startswith(b"data:"):
+            value = line[5:]
+            if value.startswith(b" "):
+                value = value[1:]
+            if value:
+                self._data.append(value)
+        # 注释行(:开头)以及event/id/retry字段不影响结果，直接忽略
+
+    def _dispatch(self, events: List[bytes]) -> None:
+        # 当前事件结束，多行data用换行连接
+        data = self._data
+        if data:
+            events.append(data[0] if len(data) == 1 else b"\n".join(data))
+            self._data = []
+
+
+def is_ignorable(data: bytes) -> bool:
+    """
+    快速判断事件是否可以不解析直接跳过：没有text/deep_search内容，且msg为空
+
+    转义后的JSON字符串中不会出现未转义的引号，因此这里的字节匹配不会把内容误判为字段
+
+    Args:
+        data: 事件数据
+
+    Returns:
+        bool: 是否可以跳过
+    """
+    if _TEXT_KEY in data or _DEEP_SEARCH_KEY in data:
+        return False
+    return _EMPTY_MSG[0] in data or _EMPTY_MSG[1] in data
+
+
+def iter_events(chunks, raw: bool = False):
+    """
+    从字节块序列中依次取出事件数据
+
+    Args:
+        chunks: 字节块的可迭代对象
+        raw: 是否为非流式响应(每行一个事件)
+
+    Yields:
+        bytes: 事件数据
+    """
+    decoder = SSEDecoder(raw)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.flush()
+
+
+def parse_event(data: bytes, loads) -> list:
+    """
+    解析事件数据。多个data行被合并成一个事件但整体不是合法JSON时(服务端未用空行分隔事件)，
+    逐行解析
+
+    Args:
+        data: 事件数据
+        loads: JSON解析函数
+
+    Returns:
+        list: 解析出的对象
+    """
+    try:
+        return [loads(data)]
+    except ValueError:
+        if b"\n" not in data:
+            raise
+        return [loads(line) for line in data.split(b"\n") if line and line != DONE]
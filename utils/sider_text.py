@@ -0,0 +1,132 @@
+"""
+长文本切分
+按段落、句子边界把长文档切分为不超过指定长度(字符数或估算的token数)的片段，片段按顺序拼接后与原文完全相同，
+供翻译、map-reduce等需要分段并发处理的功能使用
+"""
+import math
+import re
+from typing import List, Tuple
+
+DEFAULT_SEGMENT_CHARS = 2000
+
+# token估算：中日韩字符大约每个字符一个token，其他文本大约每4个字符一个token
+CHARS_PER_TOKEN = 4
+# 按一个字符一个token计算的字符(中日韩文字、全角符号)。在首次估算时由re编译并缓存，不增加导入时间
+_WIDE_CHARS = r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+
+# 段落分隔(空行)，分隔符保留在前一段的末尾
+_PARAGRAPH = re.compile(r"(?<=\n)[ \t]*\n\s*")
+# 句子结束：中日文句末标点，或英文句末标点后跟空白；标点和其后的空白保留在前一句
+_SENTENCE = re.compile(r"(?<=[。！？；!?])\s*|(?<=[.;:])\s+|\n+")
+
+
+def _split_keep(pattern: re.Pattern, text: str) -> List[str]:
+    # 按分隔符的结束位置切分，每一部分带上自己后面的分隔符
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        end = match.end()
+        if end > start and end < len(text):
+            pieces.append(text[start:end])
+            start = end
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece]
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    # 贪心合并相邻的片段，每个结果不超过max_chars(单个片段本身超长时单独成段)
+    segments = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            segments.append(current)
+            current = ""
+        current += piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def split_segments(text: str, max_chars: int = DEFAULT_SEGMENT_CHARS) -> List[str]:
+    """
+    把文本切分为不超过max_chars个字符的片段：优先在段落之间切分，
+    段落过长时在句子之间切分，句子仍然过长时按长度硬切分
+
+    Args:
+        text: 原文
+        max_chars: 每个片段的最大字符数
+
+    Returns:
+        List[str]: 片段列表，"".join后与原文相同
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars必须大于0")
+    pieces = []
+    for paragraph in _split_keep(_PARAGRAPH, text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _split_keep(_SENTENCE, paragraph):
+            if len(sentence) <= max_chars:
+                pieces.append(sentence)
+            else:
+                pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+    return _pack(pieces, max_chars)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数(不依赖分词器，按字符类型粗略估算，用于切分长文本时留出余量)
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    wide = len(re.findall(_WIDE_CHARS, text))
+    return wide + math.ceil((len(text) - wide) / CHARS_PER_TOKEN)
+
+
+def split_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    把文本切分为估算token数不超过max_tokens的片段，切分位置与split_segments相同
+
+    Args:
+        text: 原文
+        max_tokens: 每个片段的最大token数
+
+    Returns:
+        List[str]: 片段列表，"".join后与原文相同
+    """
+    if max_tokens <= 0:
+        raise ValueError("max_tokens必须大于0")
+    segments = []
+    pending = [text] if text else []
+    while pending:
+        piece = pending.pop()
+        tokens = estimate_tokens(piece)
+        if tokens <= max_tokens or len(piece) <= 1:
+            segments.append(piece)
+            continue
+        # 按这一部分的字符/token比例换算为字符数上限后切分，仍然超出的片段继续切分
+        max_chars = max(1, min(len(piece) - 1, len(piece) * max_tokens // tokens))
+        pending.extend(reversed(split_segments(piece, max_chars)))
+    return segments
+
+
+def split_whitespace(segment: str) -> Tuple[str, str, str]:
+    """
+    分离片段首尾的空白，处理时只发送中间的内容，结果再放回原来的空白，保持段落结构
+
+    Args:
+        segment: 片段
+
+    Returns:
+        Tuple[str, str, str]: (开头的空白, 内容, 结尾的空白)
+    """
+    body = segment.strip()
+    if not body:
+        return segment, "", ""
+    start = len(segment) - len(segment.lstrip())
+    return segment[:start], body, segment[start + len(body):]